@@ -1,21 +1,27 @@
-from mcp.server.fastmcp import FastMCP
-from utils.db_utils import get_mongo_client
-from utils.constants import DEFAULT_DATABASE, PROFILE_COLLECTION
+from pymongo.errors import DuplicateKeyError
+from utils.db_utils import get_async_db, warm_up, start_health_monitor
+from utils.constants import PROFILE_COLLECTION, CASE_INSENSITIVE_COLLATION
+from utils.indexes import ensure_indexes
+from utils.lifespan import startup_lifespan
+from utils.metrics import InstrumentedFastMCP
+from utils.name_cache import name_cache
+from utils.serialization import to_json
+from utils.sessions import session_store, SESSION_TTL_SECONDS
 
-mcp = FastMCP("Login")
+STARTUP_HOOKS = (start_health_monitor, warm_up, ensure_indexes)
+
+mcp = InstrumentedFastMCP("Login", lifespan=startup_lifespan(*STARTUP_HOOKS))
 
 @mcp.tool()
-def checkUser(name: str):
+async def checkUser(name: str):
     '''
     Check if the given user name exists (case-insensitive exact match).
     '''
-    client = None
     try:
-        client = get_mongo_client()
-        db = client[DEFAULT_DATABASE]
+        db = get_async_db()
         prof = db[PROFILE_COLLECTION]
 
-        count = prof.count_documents({"name": {"$regex": f"^{name.strip()}$", "$options": "i"}})
+        count = await prof.count_documents({"name": name.strip()}, collation=CASE_INSENSITIVE_COLLATION)
 
         if count > 0:
             return f"There {'is' if count == 1 else 'are'} {count} account{'s' if count > 1 else ''} with '{name.strip()}' as the name."
@@ -24,9 +30,6 @@ def checkUser(name: str):
 
     except Exception as e:
         return f"Error checking user: {str(e)}"
-    finally:
-        if client:
-            client.close()
 
 # @mcp.tool()
 # def checkUser(name : str):
@@ -44,24 +47,37 @@ def checkUser(name: str):
 #         return f"there are no accounts with {name} as its name"
 
 @mcp.tool()
-def loginUser(email : str, password : str):
+async def loginUser(email : str, password : str):
     '''
     check if user has been registered or not, only allow registered individuals to access respective tools
+    on success returns the user's role and a session_token; pass the token to buyer and seller tools instead of a name
     email : string
     password : string
     '''
-    client  = get_mongo_client()
-    db = client[DEFAULT_DATABASE]
+    db = get_async_db()
     prof = db[PROFILE_COLLECTION]
-    user_ls = list(prof.find({"email" : email,"pwd" : password},{"_id" : 0}))
-    count = prof.count_documents({"email" : email,"pwd" : password})
-    if count > 0 :
-        return user_ls[0]["role"]
+    # Emails are stored lower-cased; older accounts may still hold them as typed.
+    emails = list({email, email.strip().lower()})
+    user = await prof.find_one({"email" : {"$in" : emails},"pwd" : password},{"_id" : 0, "role" : 1, "name" : 1, "email" : 1})
+    if user:
+        # Same form as get_email_by_name returns, so carts and holds are keyed alike either way.
+        token = await session_store.issue(user["email"].lower(), user.get("role"), user.get("name"))
+        return to_json({"role" : user.get("role"), "session_token" : token, "expires_in" : SESSION_TTL_SECONDS})
     else:
         return "no user of that email or password"
 
 @mcp.tool()
-def registerUser(name : str, password : str, role : str, email :str , phno : int | None = None, addr : str | None = None ):
+async def logoutUser(session_token : str):
+    '''
+    ends the session started by loginUser; the token stops working immediately
+    session_token : string
+    '''
+    if await session_store.revoke(session_token):
+        return "Logged out"
+    return "no active session for that token"
+
+@mcp.tool()
+async def registerUser(name : str, password : str, role : str, email :str , phno : int | None = None, addr : str | None = None ):
     '''
     if user is not registered to service, requests email, password and role( buyer or seller only allowed) , optionally can ask for anme ,address, phone number, before registering always ask for fiels required, do not add random inputs, make sure all input are of required format,
     when calling tool also ask for all details but mention which are required and which are optional
@@ -73,26 +89,29 @@ def registerUser(name : str, password : str, role : str, email :str , phno : int
     '''
     dict_order = {
     "name" : name,
-    "email" : email,
+    "email" : email.strip().lower(),
     "pwd" : password,
     "phno" : phno,
     "addr" : addr,
     "role" : role.lower(),
-    "balance" : 100.0,
-    "cart" : []
+    "balance" : 100.0
     }
-    client  = get_mongo_client()
-    db = client[DEFAULT_DATABASE]
+    db = get_async_db()
     prof = db[PROFILE_COLLECTION]
-    result = prof.insert_one(dict_order)
+    try:
+        result = await prof.insert_one(dict_order)
+    except DuplicateKeyError:
+        return "An account with that email is already registered"
     if result.inserted_id:
+        # The name may be cached as unknown.
+        name_cache.invalidate(name)
         return "User successfully registered"
     else:
         return "Something went wrong, try again later"
 
 
 @mcp.tool()
-def update_pers_Details(email :str , password : str, name : str | None=None, phono : int | None = None, addr : str | None = None ):
+async def update_pers_Details(email :str , password : str, name : str | None=None, phono : int | None = None, addr : str | None = None ):
     '''
     updates the details of a already registered persons profile
     changes name , phone number, address (any one or more)
@@ -101,34 +120,39 @@ def update_pers_Details(email :str , password : str, name : str | None=None, pho
     addr : string
     
     '''
-    client  = get_mongo_client()
-    db = client[DEFAULT_DATABASE]
+    db = get_async_db()
     prof = db[PROFILE_COLLECTION]
 
 
 
-    user_profile = list(prof.find({"email" : email, "pwd" : password}))
+    # Emails are stored lower-cased; older accounts may still hold them as typed.
+    emails = list({email, email.strip().lower()})
+    user_profile = await prof.find_one({"email" : {"$in" : emails}, "pwd" : password}, {"name" : 1, "phno" : 1, "addr" : 1})
+    if user_profile is None:
+        return "no user profile with given credentials"
 
     if addr is None:
-        addr_1 = user_profile[0]["addr"]
+        addr_1 = user_profile.get("addr")
     else:
         addr_1 = addr
 
     if phono is None:
-        phono_1 = user_profile[0]["phno"]
+        phono_1 = user_profile.get("phno")
     else:
         phono_1 = phono
 
 
     if name is None:
-        name_1 = user_profile[0]["name"]
+        name_1 = user_profile["name"]
     else:
         name_1 = name
     
-    search_query = { "email" : email, "pwd" : password}
+    search_query = { "_id" : user_profile["_id"], "pwd" : password}
     change_query = { "phno" : phono_1 , "addr" : addr_1, "name" : name_1}
 
-    result = prof.update_one(search_query,{"$set":change_query})
+    result = await prof.update_one(search_query,{"$set":change_query})
+    if result.modified_count > 0 and name_1 != user_profile["name"]:
+        name_cache.invalidate(user_profile["name"], name_1)
     if result.matched_count > 0:
         if result.modified_count > 0:
             return "personal details updated"
@@ -140,11 +164,10 @@ def update_pers_Details(email :str , password : str, name : str | None=None, pho
 
 
 def main():
-    print("user_server running")
+    mcp.run()
 
 if __name__ == "__main__":
     main()
-    mcp.run()
 
 # client  = get_mongo_client()
 # db = client[DEFAULT_DATABASE]
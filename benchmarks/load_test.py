@@ -0,0 +1,394 @@
+"""
+Load test for the MCP tools of all three services.
+
+Seeds a scratch database with synthetic buyers, sellers and products, then
+drives the real tools through in-process MCP client sessions (the protocol
+path a remote client takes, minus the network) and reports per-tool latency
+percentiles, throughput, errors and Mongo round trips as JSON.
+
+Built-in scenarios:
+
+    login            loginUser for random buyers
+    catalog          concurrent walks through every page of view_all_products
+    search           search_products for words taken from the catalog
+    seller_products  view_seller_products for random sellers
+    add_to_cart      concurrent add_to_cart from many buyers
+    place_order      checkout of carts holding --cart-size products each
+
+A trace of tool calls can be replayed instead with --trace, one JSON object
+per line:
+
+    {"server": "buyer", "tool": "add_to_cart", "arguments": {"name": "{buyer_name}", "product_id": "{product_id}", "quantity": 1}}
+
+String arguments are formatted with buyer_name, buyer_email, seller_name,
+seller_email and product_id picked at random from the seeded data.
+
+Against a local mongod. add_to_cart and place_order need transactions, so
+run it as a single-node replica set (mongod --replSet rs0, then rs.initiate()):
+
+    python -m benchmarks.load_test --uri mongodb://localhost:27017 --products 100000 --cart-size 50
+
+Against mongomock (needs mongomock-motor). It has no sessions, so add_to_cart
+and place_order report errors, and it sends no commands, so round trips are
+not counted:
+
+    python -m benchmarks.load_test --mongomock
+
+The scratch database is dropped afterwards unless --keep is given.
+"""
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import time
+from contextlib import AsyncExitStack
+from pymongo import monitoring
+
+SCENARIOS = ("login", "catalog", "search", "seller_products", "add_to_cart", "place_order")
+
+current_tool = contextvars.ContextVar("current_tool", default=None)
+
+class RoundTripCounter(monitoring.CommandListener):
+    """Counts commands sent to Mongo per tool; the listener runs in the task issuing the command."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def started(self, event):
+        tool = current_tool.get()
+        if tool is not None:
+            self.counts[tool] = self.counts.get(tool, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def attribute_tools(service: str, server):
+    """Wraps each tool so the commands it sends are attributed to it."""
+    for tool in server._tool_manager.list_tools():
+        tool.fn = _attributed(f"{service}.{tool.name}", tool.fn)
+
+def _attributed(key: str, fn):
+    async def call(**kwargs):
+        token = current_tool.set(key)
+        try:
+            return await fn(**kwargs)
+        finally:
+            current_tool.reset(token)
+    return call
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    return samples[max(0, math.ceil(pct / 100 * len(samples)) - 1)]
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.first_error = {}
+
+    def record(self, key: str, elapsed_ms: float, result):
+        self.samples.setdefault(key, []).append(elapsed_ms)
+        if result.isError:
+            self.errors[key] = self.errors.get(key, 0) + 1
+            self.first_error.setdefault(key, result.content[0].text if result.content else "")
+
+    def report(self, elapsed_s: float, round_trips: dict | None) -> dict:
+        calls = sum(len(samples) for samples in self.samples.values())
+        tools = {}
+        for key, samples in sorted(self.samples.items()):
+            samples.sort()
+            tools[key] = {
+                "calls": len(samples),
+                "errors": self.errors.get(key, 0),
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+                "p99_ms": round(percentile(samples, 99), 3),
+                "mean_ms": round(statistics.fmean(samples), 3),
+                "max_ms": round(samples[-1], 3),
+                "round_trips_per_call": (
+                    round(round_trips.get(key, 0) / len(samples), 2) if round_trips is not None else None
+                ),
+            }
+            if key in self.first_error:
+                tools[key]["first_error"] = self.first_error[key][:300]
+        return {
+            "elapsed_s": round(elapsed_s, 3),
+            "calls": calls,
+            "throughput_calls_per_s": round(calls / elapsed_s, 1) if elapsed_s else None,
+            "tools": tools,
+        }
+
+class Fixtures:
+    """The seeded entities tool arguments are drawn from."""
+
+    def __init__(self, buyers, sellers, product_ids, words, rng):
+        self.buyers = buyers
+        self.sellers = sellers
+        self.product_ids = product_ids
+        self.words = words
+        self.rng = rng
+
+    def pick(self) -> dict:
+        buyer = self.rng.choice(self.buyers)
+        seller = self.rng.choice(self.sellers)
+        return {
+            "buyer_name": buyer["name"],
+            "buyer_email": buyer["email"],
+            "seller_name": seller["name"],
+            "seller_email": seller["email"],
+            "product_id": str(self.rng.choice(self.product_ids)),
+        }
+
+def fill_placeholders(value, fixture: dict):
+    if isinstance(value, str):
+        return value.format(**fixture)
+    if isinstance(value, list):
+        return [fill_placeholders(item, fixture) for item in value]
+    if isinstance(value, dict):
+        return {key: fill_placeholders(item, fixture) for key, item in value.items()}
+    return value
+
+async def seed(db, args, rng) -> Fixtures:
+    from benchmarks.search_benchmark import make_catalog
+    from utils.constants import PROFILE_COLLECTION, INVENTORY_COLLECTION
+
+    buyers = [
+        {"name": f"Buyer {i}", "email": f"buyer{i}@bench.local", "pwd": "bench", "phno": None, "addr": None,
+         "role": "buyer", "balance": 1e12}
+        for i in range(args.buyers)
+    ]
+    sellers = [
+        {"name": f"Seller {i}", "email": f"seller{i}@bench.local", "pwd": "bench", "phno": None, "addr": None,
+         "role": "seller", "balance": 0.0}
+        for i in range(args.sellers)
+    ]
+    await db[PROFILE_COLLECTION].insert_many(buyers + sellers)
+
+    catalog = make_catalog(args.products, args.seed)
+    for doc in catalog:
+        doc["seller_email"] = rng.choice(sellers)["email"]
+        # Enough stock that the scenarios measure the happy path, not sell-outs.
+        doc["quantity"] = 10 ** 9
+    for start in range(0, len(catalog), 10000):
+        await db[INVENTORY_COLLECTION].insert_many(catalog[start:start + 10000])
+
+    words = sorted({word for doc in catalog[:1000] for word in doc["name"].lower().split() if word.isalpha()})
+    return Fixtures(buyers, sellers, [doc["_id"] for doc in catalog], words, rng)
+
+async def drive(clients, calls, concurrency: int, recorder: Recorder) -> float:
+    """Runs (service, tool, arguments) calls on `concurrency` workers; returns the wall time."""
+    calls = iter(calls)
+
+    async def worker():
+        for service, tool, arguments in calls:
+            start = time.perf_counter()
+            result = await clients[service].call_tool(tool, arguments)
+            recorder.record(f"{service}.{tool}", (time.perf_counter() - start) * 1000, result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+async def walk_catalog(clients, args, recorder: Recorder) -> float:
+    async def walker():
+        token = None
+        for _ in range(args.max_pages):
+            arguments = {"page_size": args.page_size}
+            if token:
+                arguments["page_token"] = token
+            start = time.perf_counter()
+            result = await clients["buyer"].call_tool("view_all_products", arguments)
+            recorder.record("buyer.view_all_products", (time.perf_counter() - start) * 1000, result)
+            if result.isError:
+                return
+            try:
+                token = json.loads(result.content[0].text)["next_page_token"]
+            except (ValueError, KeyError):
+                return
+            if not token:
+                return
+
+    start = time.perf_counter()
+    await asyncio.gather(*(walker() for _ in range(args.concurrency)))
+    return time.perf_counter() - start
+
+async def fill_carts(clients, fixtures: Fixtures, buyers: list, cart_size: int):
+    """Untimed setup for place_order: one add_to_cart call per buyer with `cart_size` distinct products."""
+    for buyer in buyers:
+        items = [
+            {"product_id": str(pid), "quantity": 1}
+            for pid in fixtures.rng.sample(fixtures.product_ids, min(cart_size, len(fixtures.product_ids)))
+        ]
+        await clients["buyer"].call_tool("add_to_cart", {"name": buyer["name"], "items": items})
+
+async def run_scenario(name: str, clients, fixtures: Fixtures, args, counter) -> dict:
+    rng = fixtures.rng
+    recorder = Recorder()
+    if name == "place_order":
+        buyers = rng.sample(fixtures.buyers, min(args.orders, len(fixtures.buyers)))
+        await fill_carts(clients, fixtures, buyers, args.cart_size)
+    before = dict(counter.counts) if counter else None
+
+    if name == "catalog":
+        elapsed = await walk_catalog(clients, args, recorder)
+    elif name == "place_order":
+        calls = [("buyer", "place_order", {"name": buyer["name"]}) for buyer in buyers]
+        elapsed = await drive(clients, calls, args.concurrency, recorder)
+    else:
+        calls = []
+        for _ in range(args.calls):
+            fixture = fixtures.pick()
+            if name == "login":
+                calls.append(("auth", "loginUser", {"email": fixture["buyer_email"], "password": "bench"}))
+            elif name == "search":
+                query = " ".join(rng.sample(fixtures.words, 2))
+                calls.append(("buyer", "search_products", {"query": query}))
+            elif name == "seller_products":
+                calls.append(("seller", "view_seller_products", {"seller_name": fixture["seller_name"]}))
+            elif name == "add_to_cart":
+                calls.append(("buyer", "add_to_cart", {
+                    "name": fixture["buyer_name"], "product_id": fixture["product_id"], "quantity": 1
+                }))
+        elapsed = await drive(clients, calls, args.concurrency, recorder)
+
+    round_trips = None
+    if counter:
+        round_trips = {key: count - before.get(key, 0) for key, count in counter.counts.items()}
+    return recorder.report(elapsed, round_trips)
+
+def load_trace(path: str, fixtures: Fixtures) -> list:
+    calls = []
+    with open(path, encoding="utf-8") as trace:
+        for line in trace:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            arguments = fill_placeholders(entry.get("arguments", {}), fixtures.pick())
+            calls.append((entry["server"], entry["tool"], arguments))
+    return calls
+
+async def wait_for_search_index(timeout: float):
+    from utils.search_index import search_index
+    deadline = time.monotonic() + timeout
+    while not search_index.ready and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+async def main(args):
+    # Environment first: db_utils reads it when the services are imported.
+    os.environ["MONGODB_DATABASE"] = args.database
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(max(50, args.concurrency * 4)))
+    if args.uri:
+        os.environ["MONGODB_URI"] = args.uri
+
+    counter = None
+    if not args.mongomock:
+        counter = RoundTripCounter()
+        monitoring.register(counter)
+
+    from mcp.shared.memory import create_connected_server_and_client_session
+    from utils import db_utils
+    import auth_server
+    import buyer_server
+    import seller_server
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        # Stands in for the shared client get_async_client() would create on this loop.
+        db_utils._async_client = AsyncMongoMockClient()
+        db_utils._async_loop = asyncio.get_running_loop()
+
+    services = {"auth": auth_server.mcp, "seller": seller_server.mcp, "buyer": buyer_server.mcp}
+    for service, server in services.items():
+        attribute_tools(service, server)
+
+    rng = random.Random(args.seed)
+    db = db_utils.get_async_db()
+    if await db.list_collection_names():
+        raise SystemExit(f"Database '{args.database}' is not empty; pick another --database.")
+
+    results = {
+        "label": args.label,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "backend": "mongomock" if args.mongomock else "mongod",
+        "config": {
+            "buyers": args.buyers, "sellers": args.sellers, "products": args.products,
+            "cart_size": args.cart_size, "orders": args.orders, "calls": args.calls,
+            "concurrency": args.concurrency, "page_size": args.page_size, "seed": args.seed,
+        },
+        "scenarios": {},
+    }
+    try:
+        start = time.perf_counter()
+        fixtures = await seed(db, args, rng)
+        results["seed_s"] = round(time.perf_counter() - start, 3)
+
+        async with AsyncExitStack() as stack:
+            clients = {
+                service: await stack.enter_async_context(create_connected_server_and_client_session(server._mcp_server))
+                for service, server in services.items()
+            }
+            await wait_for_search_index(timeout=60)
+
+            if args.trace:
+                recorder = Recorder()
+                before = dict(counter.counts) if counter else None
+                elapsed = await drive(clients, load_trace(args.trace, fixtures), args.concurrency, recorder)
+                round_trips = (
+                    {key: count - before.get(key, 0) for key, count in counter.counts.items()} if counter else None
+                )
+                results["scenarios"]["trace"] = recorder.report(elapsed, round_trips)
+            else:
+                for name in args.scenarios:
+                    results["scenarios"][name] = await run_scenario(name, clients, fixtures, args, counter)
+    finally:
+        if not args.keep:
+            await db_utils.get_async_client().drop_database(args.database)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            out.write(output + "\n")
+    print(output)
+
+def _scenario_list(value: str) -> list:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--uri", default=os.getenv("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+    backend.add_argument("--mongomock", action="store_true", help="run against mongomock-motor instead of mongod")
+    parser.add_argument("--database", default="superstore_load")
+    parser.add_argument("--scenarios", type=_scenario_list, default=list(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--trace", help="replay this JSONL trace of tool calls instead of the scenarios")
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--sellers", type=int, default=20)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--cart-size", type=int, default=20, help="products per cart for place_order")
+    parser.add_argument("--orders", type=int, default=100, help="checkouts for place_order (at most --buyers)")
+    parser.add_argument("--calls", type=int, default=500, help="calls per call-count scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent callers")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--max-pages", type=int, default=1000, help="pages per catalog walk")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--label", help="free-form tag stored with the results, e.g. a commit id")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database afterwards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
@@ -0,0 +1,97 @@
+"""
+Concurrency benchmark for stock reservations on a single hot product.
+
+Many simulated buyers race to reserve units of one product. The "transactional"
+mode runs add_to_cart's reservation: one read of the product, then the guarded
+$inc, the hold and the cart line in one transaction (buyer_server._reserve_lines);
+the "naive" mode reads the stock and then decrements it, which is what
+place_order used to do. Transactions need a replica set, e.g. a single-node one.
+
+    python -m benchmarks.reservation_benchmark --uri mongodb://localhost:27017 --buyers 64
+
+Runs against a scratch database that is dropped afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from pymongo import AsyncMongoClient
+from buyer_server import PRODUCT_PROJECTION, StockChanged, _reserve_lines
+from utils.constants import CART_COLLECTION, INVENTORY_COLLECTION, RESERVATION_COLLECTION
+
+async def transactional_reserve(db, buyer_email, product_id, quantity):
+    product = await db[INVENTORY_COLLECTION].find_one({"_id": product_id}, PRODUCT_PROJECTION)
+    if product is None or product["quantity"] < quantity:
+        return None
+    try:
+        async with db.client.start_session() as session:
+            await session.with_transaction(lambda s: _reserve_lines(s, db, buyer_email, [(product, quantity)]))
+    except StockChanged:
+        return None
+    return product
+
+async def naive_reserve(db, buyer_email, product_id, quantity):
+    product = await db[INVENTORY_COLLECTION].find_one({"_id": product_id})
+    if product["quantity"] < quantity:
+        return None
+    await db[INVENTORY_COLLECTION].update_one({"_id": product_id}, {"$inc": {"quantity": -quantity}})
+    return product
+
+async def run(db, mode: str, buyers: int, attempts: int, stock: int, units: int) -> dict:
+    await db[INVENTORY_COLLECTION].delete_many({})
+    await db[RESERVATION_COLLECTION].delete_many({})
+    await db[CART_COLLECTION].delete_many({})
+    inserted = await db[INVENTORY_COLLECTION].insert_one({
+        "name": "hot product", "price": 1.0, "quantity": stock, "seller_email": "bench@seller"
+    })
+    product_id = inserted.inserted_id
+    reserve = transactional_reserve if mode == "transactional" else naive_reserve
+
+    async def buyer(i):
+        won = 0
+        for _ in range(attempts):
+            if await reserve(db, f"buyer{i}@bench", product_id, units):
+                won += 1
+        return won
+
+    start = time.perf_counter()
+    wins = sum(await asyncio.gather(*(buyer(i) for i in range(buyers))))
+    elapsed = time.perf_counter() - start
+
+    remaining = (await db[INVENTORY_COLLECTION].find_one({"_id": product_id}))["quantity"]
+    sold = wins * units
+    return {
+        "mode": mode,
+        "buyers": buyers,
+        "attempts": buyers * attempts,
+        "successful_reservations": wins,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops_per_s": round(buyers * attempts / elapsed, 1),
+        "initial_stock": stock,
+        "remaining_stock": remaining,
+        "oversell_units": max(0, sold - stock),
+        "stock_consistent": remaining == stock - sold,
+    }
+
+async def main(args):
+    client = AsyncMongoClient(args.uri, maxPoolSize=max(args.buyers, 10))
+    db = client[args.database]
+    modes = ["transactional", "naive"] if args.mode == "both" else [args.mode]
+    try:
+        for mode in modes:
+            print(json.dumps(await run(db, mode, args.buyers, args.attempts, args.stock, args.units)))
+    finally:
+        await client.drop_database(args.database)
+        await client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--database", default="superstore_bench")
+    parser.add_argument("--mode", choices=["transactional", "naive", "both"], default="both")
+    parser.add_argument("--buyers", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=50, help="reservation attempts per buyer")
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--units", type=int, default=1, help="units per reservation")
+    asyncio.run(main(parser.parse_args()))
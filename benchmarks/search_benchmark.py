@@ -0,0 +1,110 @@
+"""
+Benchmark for search_products' in-process index against scan-and-filter.
+
+Builds a synthetic catalog in memory, then runs the same queries through
+ProductSearchIndex and through a full scan that lower-cases every name and
+checks each term, which is what a client has to do with the output of
+view_all_products. No database is needed.
+
+    python -m benchmarks.search_benchmark --products 100000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from bson import ObjectId
+from utils.search_index import ProductSearchIndex, tokenize
+
+ADJECTIVES = ["wireless", "portable", "organic", "stainless", "compact", "premium", "classic",
+              "smart", "ergonomic", "waterproof", "vintage", "heavy", "duty", "mini", "ultra"]
+NOUNS = ["laptop", "keyboard", "headphones", "bottle", "backpack", "charger", "blender",
+         "jacket", "lamp", "speaker", "notebook", "monitor", "kettle", "sneakers", "camera"]
+BRANDS = ["acme", "zenith", "orbit", "nimbus", "vertex", "quartz", "lumen", "atlas"]
+
+QUERIES = [
+    ("laptop", {}),
+    ("wireless head", {}),
+    ("stainles bottle", {}),
+    ("acme", {"min_price": 100, "max_price": 500}),
+    ("smart speaker", {"in_stock_only": True, "sort_by": "price_asc"}),
+    ("keybord", {}),
+    ("ultra compact camera", {"sort_by": "price_desc"}),
+    ("no such thing", {}),
+]
+
+def make_catalog(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    sellers = [f"seller{i}@example.com" for i in range(200)]
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"{rng.choice(BRANDS).title()} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randint(100, 9999)}",
+            "price": round(rng.uniform(1, 2000), 2),
+            "quantity": rng.randint(0, 50),
+            "seller_email": rng.choice(sellers),
+        }
+        for _ in range(count)
+    ]
+
+def scan_search(catalog, query, min_price=None, max_price=None, seller_email=None,
+                in_stock_only=False, sort_by="relevance", limit=20):
+    terms = tokenize(query)
+    hits = []
+    for doc in catalog:
+        name = doc["name"].casefold()
+        if not all(term in name for term in terms):
+            continue
+        if min_price is not None and doc["price"] < min_price:
+            continue
+        if max_price is not None and doc["price"] > max_price:
+            continue
+        if seller_email and doc["seller_email"] != seller_email:
+            continue
+        if in_stock_only and doc["quantity"] <= 0:
+            continue
+        hits.append(doc)
+    if sort_by == "price_asc":
+        hits.sort(key=lambda doc: doc["price"])
+    elif sort_by == "price_desc":
+        hits.sort(key=lambda doc: -doc["price"])
+    else:
+        hits.sort(key=lambda doc: doc["name"].lower())
+    return hits[:limit]
+
+def time_queries(search, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        for query, options in QUERIES:
+            start = time.perf_counter()
+            search(query, **options)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "queries": len(samples),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the query set")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.products, args.seed)
+
+    start = time.perf_counter()
+    index = ProductSearchIndex()
+    for doc in catalog:
+        index.add(doc)
+    build_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "products": args.products,
+        "index_build_s": round(build_s, 3),
+        "index": time_queries(index.search, args.repeat),
+        "scan": time_queries(lambda query, **options: scan_search(catalog, query, **options), max(1, args.repeat // 10)),
+    }, indent=2))
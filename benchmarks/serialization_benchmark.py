@@ -0,0 +1,93 @@
+"""
+Benchmark for utils.serialization against the serializer it replaced.
+
+Builds a synthetic list of inventory-shaped documents (ObjectId _id, nested
+cart-style lists) and encodes it with the previous approach, a recursive
+ObjectId-to-string pass followed by json.dumps(indent=2), and with to_json in
+compact and pretty modes on both the standard-library and orjson paths.
+No database is needed.
+
+    python -m benchmarks.serialization_benchmark --docs 10000
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import time
+from bson import ObjectId
+from utils import serialization
+from utils.serialization import to_json
+
+def legacy_serialize_doc(doc):
+    """The recursive pre-pass the servers used before utils.serialization."""
+    if isinstance(doc, dict):
+        return {
+            key: str(value) if isinstance(value, ObjectId) else legacy_serialize_doc(value)
+            if isinstance(value, dict) else [
+                legacy_serialize_doc(item) if isinstance(item, dict) else item
+                for item in value
+            ] if isinstance(value, list) else value
+            for key, value in doc.items()
+        }
+    return doc
+
+def legacy_encode(docs) -> str:
+    return json.dumps({"products": [legacy_serialize_doc(doc) for doc in docs]}, indent=2)
+
+def make_docs(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    now = datetime.datetime(2025, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"Product {i} {rng.choice(['laptop', 'kettle', 'lamp', 'jacket'])}",
+            "price": round(rng.uniform(1, 2000), 2),
+            "quantity": rng.randint(0, 50),
+            "seller_email": f"seller{rng.randint(0, 199)}@example.com",
+            "tags": [{"_id": ObjectId(), "label": f"tag{j}"} for j in range(2)],
+            "dimensions": {"w": rng.randint(1, 100), "h": rng.randint(1, 100)},
+            "created_at": now,
+        }
+        for i in range(count)
+    ]
+
+def time_encoder(encode, docs, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = encode(docs)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "bytes": len(payload.encode()),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    docs = make_docs(args.docs, args.seed)
+    # The legacy path can't encode datetimes, so it gets the same documents without them.
+    legacy_docs = [{key: value for key, value in doc.items() if key != "created_at"} for doc in docs]
+
+    results = {"docs": args.docs, "orjson_available": serialization.orjson is not None}
+    results["legacy"] = time_encoder(legacy_encode, legacy_docs, args.repeat)
+
+    use_orjson = serialization.RESPONSE_USE_ORJSON
+    try:
+        serialization.RESPONSE_USE_ORJSON = False
+        results["stdlib_compact"] = time_encoder(lambda d: to_json({"products": d}, pretty=False), docs, args.repeat)
+        results["stdlib_pretty"] = time_encoder(lambda d: to_json({"products": d}, pretty=True), docs, args.repeat)
+        if serialization.orjson is not None:
+            serialization.RESPONSE_USE_ORJSON = True
+            results["orjson_compact"] = time_encoder(lambda d: to_json({"products": d}, pretty=False), docs, args.repeat)
+            results["orjson_pretty"] = time_encoder(lambda d: to_json({"products": d}, pretty=True), docs, args.repeat)
+    finally:
+        serialization.RESPONSE_USE_ORJSON = use_orjson
+
+    print(json.dumps(results, indent=2))
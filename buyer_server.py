@@ -1,311 +1,579 @@
-import json
-from mcp.server.fastmcp import FastMCP
+import asyncio
+import re
+from datetime import datetime, timezone
 from bson import ObjectId
-from utils.db_utils import get_mongo_client
-from utils.constants import DEFAULT_DATABASE, PROFILE_COLLECTION, INVENTORY_COLLECTION
-from utils.helpers import get_email_by_name
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from utils.db_utils import get_async_db, warm_up, start_health_monitor
+from utils.carts import add_lines, remove_line, cart_lines, clear_cart, migrate_embedded_carts
+from utils.catalog_cache import catalog_cache
+from utils.catalog_sync import catalog_changes as read_catalog_changes, stamp_unversioned_products
+from utils.constants import PROFILE_COLLECTION, INVENTORY_COLLECTION, ORDER_COLLECTION, PAYMENT_COLLECTION, BUYER_ROLE
+from utils.helpers import resolve_identity
+from utils.indexes import ensure_indexes
+from utils.inventory_events import start_inventory_watcher
+from utils.lifespan import startup_lifespan
+from utils.metrics import InstrumentedFastMCP
+from utils.orders import build_order, order_page, find_order
+from utils.sales import record_sales
+from utils.search_index import search_index, start_search_index, tokenize, SORT_OPTIONS
+from utils.serialization import to_json
+from utils.single_flight import coalesce
+from utils.sessions import INVALID_SESSION_MESSAGE
+from utils.reservations import take_stock_many, record_holds, held_quantities, consume_holds, release_holds, start_reservation_sweeper
+
+STARTUP_HOOKS = (start_health_monitor, warm_up, ensure_indexes, stamp_unversioned_products, migrate_embedded_carts, start_reservation_sweeper, start_inventory_watcher, start_search_index)
+
+mcp = InstrumentedFastMCP("Buyer Service", lifespan=startup_lifespan(*STARTUP_HOOKS))
+
+PRODUCT_PROJECTION = {"name": 1, "price": 1, "quantity": 1, "seller_email": 1}
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+MAX_CHANGES_PAGE_SIZE = 1000
+MAX_CART_BATCH = 100
+ADD_TO_CART_ATTEMPTS = 3
+
+def _unknown_buyer(name: str | None, session_token: str | None) -> str:
+    if session_token:
+        return INVALID_SESSION_MESSAGE
+    if not name:
+        return "Provide the buyer's name or a session_token from loginUser."
+    return f"No buyer found with name: {name}"
 
-mcp = FastMCP("Buyer Service")
+@mcp.tool()
+@coalesce
+async def view_all_products(
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: str | None = None,
+    seller_email: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock_only: bool = False
+) -> str:
+    """
+    Fetch one page of products available in the store, ordered by product id.
+    Optional filters: seller_email, min_price/max_price and in_stock_only.
+    Pass the returned next_page_token back as page_token to get the next page;
+    it is null on the last page. page_size is capped at 100.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    query = {}
+    if page_token:
+        try:
+            query["_id"] = {"$gt": ObjectId(page_token)}
+        except InvalidId:
+            return "Invalid page_token."
+    if seller_email:
+        query["seller_email"] = seller_email.strip().lower()
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        query["price"] = price
+    if in_stock_only:
+        query["quantity"] = {"$gt": 0}
+
+    # One extra document tells us whether another page follows.
+    cursor = get_async_db()[INVENTORY_COLLECTION].find(
+        query, PRODUCT_PROJECTION, sort=[("_id", 1)], limit=page_size + 1, batch_size=page_size + 1
+    )
+
+    products = []
+    has_more = False
+    async for product in cursor:
+        if len(products) == page_size:
+            has_more = True
+            break
+        products.append({
+            "product_id": str(product["_id"]),
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": product["quantity"],
+            "seller_email": product["seller_email"]
+        })
+
+    if not products:
+        return "No products found in the store."
+
+    return to_json({
+        "products": products,
+        "next_page_token": products[-1]["product_id"] if has_more else None
+    })
 
 @mcp.tool()
-def view_all_products() -> str:
-    """Fetch and display all products available in the store."""
-    client = get_mongo_client()
+@coalesce
+async def catalog_changes(since: str | None = None, limit: int = MAX_PAGE_SIZE) -> str:
+    """
+    Products added, changed or deleted since a cursor, oldest first, for keeping a
+    copy of the catalog up to date without re-reading it. Pass the returned cursor
+    as `since` next time; without one the feed starts from the beginning, which is
+    a full sync. Deleted products come back with "deleted": true. While has_more is
+    true, call again at once. If reset is true the cursor is too old: drop the copy
+    and sync again without `since`. Changes show up a few seconds after they are
+    made. limit is capped at 1000.
+    """
+    limit = max(1, min(limit, MAX_CHANGES_PAGE_SIZE))
     try:
-        db = client[DEFAULT_DATABASE]
-        products_cursor = db[INVENTORY_COLLECTION].find()
+        return to_json(await read_catalog_changes(get_async_db(), since, limit))
+    except ValueError as e:
+        return str(e)
+
+async def _search_database(terms, min_price, max_price, seller_email, in_stock_only, sort_by, limit):
+    """Unindexed fallback used until the in-process search index has been built."""
+    query = {"$and": [{"name": {"$regex": re.escape(term), "$options": "i"}} for term in terms]}
+    if seller_email:
+        query["seller_email"] = seller_email.strip().lower()
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        query["price"] = price
+    if in_stock_only:
+        query["quantity"] = {"$gt": 0}
+    sort = {
+        "price_asc": [("price", 1)],
+        "price_desc": [("price", -1)],
+        "name": [("name", 1)],
+    }.get(sort_by, [("_id", 1)])
+    return await get_async_db()[INVENTORY_COLLECTION].find(query, PRODUCT_PROJECTION, sort=sort, limit=limit).to_list()
 
-        products = []
-        for product in products_cursor:
-            products.append({
+@mcp.tool()
+async def search_products(
+    query: str,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    seller_email: str | None = None,
+    in_stock_only: bool = False,
+    sort_by: str = "relevance",
+    limit: int = 20
+) -> str:
+    """
+    Search products by name. Every word must match a word of the product name,
+    either exactly, as a prefix ("lap" finds "laptop") or with a small typo.
+    Optional filters: min_price/max_price, seller_email, in_stock_only.
+    sort_by is one of relevance, price_asc, price_desc, name; limit is capped at 100.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return "Provide at least one word to search for."
+    if sort_by not in SORT_OPTIONS:
+        return f"Invalid sort_by. Choose from: {', '.join(SORT_OPTIONS)}."
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if search_index.ready:
+        docs = search_index.index.search(query, min_price, max_price, seller_email, in_stock_only, sort_by, limit)
+    else:
+        docs = await _search_database(terms, min_price, max_price, seller_email, in_stock_only, sort_by, limit)
+
+    if not docs:
+        return f"No products match '{query}'."
+
+    return to_json({
+        "query": query,
+        "count": len(docs),
+        "products": [
+            {
                 "product_id": str(product["_id"]),
                 "name": product["name"],
                 "price": product["price"],
                 "quantity": product["quantity"],
                 "seller_email": product["seller_email"]
-            })
-
-        if not products:
-            return "No products found in the store."
-
-        return json.dumps(products, indent=2)
-
-    finally:
-        client.close()
+            }
+            for product in docs
+        ]
+    })
 
 @mcp.tool()
-def view_cart(buyer_name: str) -> str:
-    """View the contents of the buyer's cart by identifying the user with their name."""
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        profile_coll = db[PROFILE_COLLECTION]
-
-        profile = profile_coll.find_one({
-            "name": {"$regex": f"^{buyer_name.strip()}$", "$options": "i"},
-            "role": {"$regex": "^buyer$", "$options": "i"}
-        })
-
-        if not profile:
-            return f"No buyer found with name: {buyer_name}"
-
-        cart = profile.get("cart", [])
-        if not cart:
-            return f"{buyer_name}'s cart is empty."
-
-        def serialize_cart_item(item):
-            if isinstance(item, dict):
-                return {
-                    key: (str(value) if isinstance(value, ObjectId) else value)
-                    for key, value in item.items()
-                }
-            return item
+async def view_cart(buyer_name: str | None = None, session_token: str | None = None) -> str:
+    """View the contents of the buyer's cart, identifying the user by session_token from loginUser or by name."""
+    # Resolving through the name cache lets a run of tools for the same buyer share one lookup.
+    email, buyer_name = await resolve_identity(buyer_name, session_token, BUYER_ROLE)
+    if not email:
+        return _unknown_buyer(buyer_name, session_token)
 
-        serialized_cart = [serialize_cart_item(item) for item in cart]
+    cart = await cart_lines(get_async_db(), email)
+    if not cart:
+        return f"{buyer_name}'s cart is empty."
 
-        return json.dumps({
-            "buyer_name": profile["name"],
-            "buyer_email": profile["email"],
-            "cart_count": len(serialized_cart),
-            "cart": serialized_cart
-        }, indent=2)
-    finally:
-        client.close()
+    return to_json({
+        "buyer_name": buyer_name,
+        "buyer_email": email,
+        "cart_count": len(cart),
+        "cart": cart
+    })
 
 @mcp.tool()
-def view_product_details(product_id: str) -> str:
+@coalesce
+async def view_product_details(product_id: str) -> str:
     """View details of a specific product"""
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        product = db[INVENTORY_COLLECTION].find_one({"_id": ObjectId(product_id)})
+    oid = ObjectId(product_id)
+    product = catalog_cache.get(oid)
+    if product is None:
+        generation = catalog_cache.generation
+        product = await get_async_db()[INVENTORY_COLLECTION].find_one({"_id": oid})
         if not product:
             return "Product not found."
+        catalog_cache.fill(product, generation)
 
-        details = {
-            "product_id": str(product["_id"]),
-            "name": product["name"],
-            "price": product["price"],
-            "quantity": product["quantity"],
-            "seller_email": product["seller_email"]
-        }
-        return json.dumps(details, indent=2)
-    finally:
-        client.close()
+    details = {
+        "product_id": str(product["_id"]),
+        "name": product["name"],
+        "price": product["price"],
+        "quantity": product["quantity"],
+        "seller_email": product["seller_email"]
+    }
+    return to_json(details)
 
 @mcp.tool()
-def check_balance(name: str) -> str:
-    """Check balance of a buyer using name"""
-    email = get_email_by_name(name)
+async def check_balance(name: str | None = None, session_token: str | None = None) -> str:
+    """Check balance of a buyer using session_token from loginUser or name"""
+    email, name = await resolve_identity(name, session_token, BUYER_ROLE)
     if not email:
-        return f"No buyer found with name: {name}"
+        return _unknown_buyer(name, session_token)
 
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        user = db[PROFILE_COLLECTION].find_one({"email": email})
-        return f"{name} has ₹{user.get('balance')} in their account."
-    finally:
-        client.close()
+    db = get_async_db()
+    user = await db[PROFILE_COLLECTION].find_one({"email": email}, {"balance": 1})
+    if not user:
+        return f"No buyer found with email: {email}"
+    return f"{name} has ₹{user.get('balance')} in their account."
 
 @mcp.tool()
-def add_balance(name: str, amount: float) -> str:
-    """Add amount to buyer's balance using name"""
+async def add_balance(amount: float, name: str | None = None, session_token: str | None = None) -> str:
+    """Add amount to buyer's balance using session_token from loginUser or name"""
     if amount <= 0:
         return "Amount must be greater than zero."
 
-    email = get_email_by_name(name)
+    email, name = await resolve_identity(name, session_token, BUYER_ROLE)
     if not email:
-        return f"No buyer found with name: {name}"
+        return _unknown_buyer(name, session_token)
 
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        result = db[PROFILE_COLLECTION].update_one({"email": email}, {"$inc": {"balance": amount}})
-        if result.modified_count == 0:
-            return f"No buyer found with email: {email}"
+    db = get_async_db()
+    user = await db[PROFILE_COLLECTION].find_one_and_update(
+        {"email": email},
+        {"$inc": {"balance": amount}},
+        projection={"balance": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        return f"No buyer found with email: {email}"
 
-        user = db[PROFILE_COLLECTION].find_one({"email": email})
-        return f"Balance updated. New balance for {name}: ₹{user.get('balance')}"
-    finally:
-        client.close()
+    return f"Balance updated. New balance for {name}: ₹{user.get('balance')}"
 
+class StockChanged(Exception):
+    """Raised inside the add_to_cart transaction when stock moved since it was read."""
+
+async def _reserve_lines(session, db, email: str, lines):
+    if not await take_stock_many(db, [(product["_id"], qty) for product, qty in lines], session):
+        raise StockChanged()
+    await record_holds(db, email, [(product["_id"], qty) for product, qty in lines], session=session)
+    await add_lines(db, email, lines, session=session)
 
 @mcp.tool()
-def add_to_cart(name: str, product_id: str = None, quantity: int = None, items: list = None) -> str:
+async def add_to_cart(name: str = None, product_id: str = None, quantity: int = None, items: list = None, session_token: str = None) -> str:
     """
     Add single or multiple products to the buyer's cart.
-    Either pass 'product_id' and 'quantity', or 'items' as a list of {"product_id", "quantity"}.
+    Identify the buyer by session_token from loginUser or by name.
+    Either pass 'product_id' and 'quantity', or 'items' as a list of {"product_id", "quantity"}
+    (up to 100; repeated product_ids are merged). For 'items' the reply reports every
+    item, in request order, with its "index" in 'items'.
+    Added quantities are reserved in inventory until checkout or until the hold expires.
     """
+    report = []
+    wanted = {}
+    # Request positions of each product, as (index, quantity); repeats share the product's outcome.
+    positions = {}
+
+    if items:
+        if len(items) > MAX_CART_BATCH:
+            return f"Too many items. Add at most {MAX_CART_BATCH} per call."
+        for index, item in enumerate(items):
+            pid = item.get("product_id") if isinstance(item, dict) else None
+            qty = item.get("quantity", 0) if isinstance(item, dict) else 0
+            try:
+                oid = ObjectId(pid)
+            except (InvalidId, TypeError):
+                report.append({"index": index, "product_id": pid, "status": "invalid_product_id"})
+                continue
+            if not isinstance(qty, int) or qty <= 0:
+                report.append({"index": index, "product_id": pid, "status": "invalid_quantity"})
+                continue
+            wanted[oid] = wanted.get(oid, 0) + qty
+            positions.setdefault(oid, []).append((index, qty))
+
+    elif product_id and quantity and quantity > 0:
+        try:
+            oid = ObjectId(product_id)
+        except InvalidId:
+            return "Invalid product_id."
+        wanted[oid] = quantity
+        positions[oid] = [(0, quantity)]
+
+    else:
+        return "Invalid input. Provide either a product_id with quantity, or a list of items."
+
+    db = get_async_db()
+    inventory = db[INVENTORY_COLLECTION]
+
+    async def fetch():
+        if not wanted:
+            return {}
+        return {
+            product["_id"]: product
+            async for product in inventory.find({"_id": {"$in": list(wanted)}}, PRODUCT_PROJECTION)
+        }
 
-    email = get_email_by_name(name)
+    # The buyer lookup and the product fetch don't depend on each other.
+    (email, name), products = await asyncio.gather(resolve_identity(name, session_token, BUYER_ROLE), fetch())
     if not email:
-        return f"No buyer found with name: {name}"
+        return _unknown_buyer(name, session_token)
+
+    # Stock is checked against one read and then taken in one guarded bulk
+    # write; if a concurrent buyer got there first the transaction is aborted
+    # and the products are read again.
+    for _ in range(ADD_TO_CART_ATTEMPTS):
+        lines = [(products[oid], qty) for oid, qty in wanted.items() if oid in products and products[oid]["quantity"] >= qty]
+        if not lines:
+            break
+        try:
+            async with db.client.start_session() as session:
+                await session.with_transaction(lambda s: _reserve_lines(s, db, email, lines))
+            break
+        except StockChanged:
+            products = await fetch()
+    else:
+        lines = []
+        if not items:
+            return "Stock changed while adding to the cart. Please try again."
+
+    added = {product["_id"] for product, _ in lines}
+    for oid, qty in wanted.items():
+        product = products.get(oid)
+        outcome = {}
+        if product is None:
+            outcome["status"] = "not_found"
+        else:
+            outcome["name"] = product["name"]
+            if oid in added:
+                outcome["status"] = "added"
+            elif product["quantity"] >= qty:
+                outcome["status"] = "stock_changed"
+            else:
+                outcome["status"] = "insufficient_stock"
+                outcome["available"] = product["quantity"]
+        for index, item_qty in positions[oid]:
+            report.append({"index": index, "product_id": str(oid), "requested": item_qty, **outcome})
+    report.sort(key=lambda entry: entry["index"])
+
+    if not items:
+        entry = report[0]
+        if entry["status"] == "not_found":
+            return "Product not found."
+        if entry["status"] == "insufficient_stock":
+            return f"Insufficient stock for '{entry['name']}'. Available: {entry['available']}, requested: {quantity}."
+        return f"Added {quantity} of '{entry['name']}' to {name}'s cart."
 
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        inventory = db[INVENTORY_COLLECTION]
-        profile = db[PROFILE_COLLECTION]
-
-        cart_items = []
-
-        if items: 
-            for item in items:
-                pid = item.get("product_id")
-                qty = item.get("quantity", 0)
-                if not pid or qty <= 0:
-                    continue
-                product = inventory.find_one({"_id": ObjectId(pid)})
-                if not product:
-                    continue
-                cart_items.append({
-                    "product_id": str(product["_id"]),
-                    "name": product["name"],
-                    "price": product["price"],
-                    "quantity": qty,
-                    "seller_email": product["seller_email"]
-                })
-
-            if not cart_items:
-                return "No valid items to add to cart."
-
-            profile.update_one(
-                {"email": email},
-                {"$push": {"cart": {"$each": cart_items}}}
-            )
-            return f"Added {len(cart_items)} item(s) to {name}'s cart."
-
-        elif product_id and quantity and quantity > 0: 
-            product = inventory.find_one({"_id": ObjectId(product_id)})
-            if not product:
-                return "Product not found."
-
-            cart_item = {
-                "product_id": str(product["_id"]),
-                "name": product["name"],
-                "price": product["price"],
-                "quantity": quantity,
-                "seller_email": product["seller_email"]
-            }
+    return to_json({
+        "buyer_name": name,
+        "added": len(added),
+        "requested": len(items),
+        "items": report
+    })
 
-            profile.update_one(
-                {"email": email},
-                {"$push": {"cart": cart_item}}
-            )
-            return f"Added {quantity} of '{product['name']}' to {name}'s cart."
+@mcp.tool()
+async def delete_from_cart(product_id: str, name: str | None = None, session_token: str | None = None) -> str:
+    """
+    Remove an item from the buyer's cart by product_id, releasing its reserved stock.
+    Identify the buyer by session_token from loginUser or by name.
+    """
+    email, name = await resolve_identity(name, session_token, BUYER_ROLE)
+    if not email:
+        return _unknown_buyer(name, session_token)
+
+    db = get_async_db()
+    oid = ObjectId(product_id)
+    removed, _ = await asyncio.gather(
+        remove_line(db, email, oid),
+        release_holds(db, email, oid)
+    )
+    if not removed:
+        return "Item not found in cart."
+    return f"Item {product_id} removed from {name}'s cart."
+
+class CheckoutError(Exception):
+    """Raised inside the checkout transaction to abort it with a user-facing message."""
+
+async def _checkout(session, db, email: str, name: str) -> str:
+    profile_coll = db[PROFILE_COLLECTION]
+    inventory_coll = db[INVENTORY_COLLECTION]
+
+    buyer = await profile_coll.find_one({"email": email}, {"balance": 1}, session=session)
+    if not buyer:
+        raise CheckoutError("Buyer profile not found.")
+
+    cart = await cart_lines(db, email, session=session)
+    if not cart:
+        raise CheckoutError(f"{name}'s cart is empty. Nothing to order.")
+
+    balance = buyer.get("balance", 0.0)
+
+    # Cart lines are unique per product.
+    requested = {item["product_id"]: item["quantity"] for item in cart}
+
+    products = {
+        product["_id"]: product
+        async for product in inventory_coll.find(
+            {"_id": {"$in": list(requested)}},
+            {"name": 1, "quantity": 1},
+            session=session
+        )
+    }
 
-        else:
-            return "Invalid input. Provide either a product_id with quantity, or a list of items."
+    # Units already held for this buyer by add_to_cart were taken out of
+    # inventory then, so only the difference is decremented (or returned) now.
+    held = await held_quantities(db, email, session=session)
+
+    for oid, quantity in requested.items():
+        product = products.get(oid)
+        if not product:
+            raise CheckoutError(f"Product {oid} not found in inventory.")
+        available_qty = product.get("quantity", 0) + held.get(oid, 0)
+        if quantity > available_qty:
+            raise CheckoutError(f"Insufficient stock for '{product['name']}'. Available: {available_qty}, requested: {quantity}.")
+
+    total_cost = sum(item.get("price", 0) * item.get("quantity", 0) for item in cart)
+
+    # Deduct the balance only if it still covers the total.
+    charged = await profile_coll.update_one(
+        {"email": email, "balance": {"$gte": total_cost}},
+        {"$inc": {"balance": -total_cost}},
+        session=session
+    )
+    if charged.matched_count == 0:
+        raise CheckoutError(f"Insufficient balance. Total cost is ₹{total_cost}, but you have ₹{balance}.")
+    await clear_cart(db, email, session=session)
+
+    now = datetime.now(timezone.utc)
+
+    # Each decrement only applies while enough stock remains, so a concurrent
+    # checkout that got there first makes the whole transaction abort.
+    stock_ops = []
+    surplus_ops = []
+    for oid in set(requested) | set(held):
+        delta = requested.get(oid, 0) - held.get(oid, 0)
+        if delta > 0:
+            stock_ops.append(UpdateOne(
+                {"_id": oid, "quantity": {"$gte": delta}},
+                {"$inc": {"quantity": -delta}, "$set": {"updated_at": now}}
+            ))
+        elif delta < 0:
+            surplus_ops.append(UpdateOne({"_id": oid}, {"$inc": {"quantity": -delta}, "$set": {"updated_at": now}}))
+    if stock_ops:
+        stock_result = await inventory_coll.bulk_write(stock_ops, ordered=False, session=session)
+        if stock_result.matched_count != len(stock_ops):
+            raise CheckoutError("Stock changed while placing the order. Please review your cart and try again.")
+    if surplus_ops:
+        await inventory_coll.bulk_write(surplus_ops, ordered=False, session=session)
+    await consume_holds(db, email, session=session)
+
+    await record_sales(db, cart, now, session=session)
+    order = await db[ORDER_COLLECTION].insert_one(build_order(email, cart, now), session=session)
+
+    payments_map = {}
+    for item in cart:
+        seller = item.get("seller_email")
+        amount = item.get("price") * item.get("quantity")
+        payments_map[seller] = payments_map.get(seller, 0) + amount
+
+    await db[PAYMENT_COLLECTION].insert_many([
+        {
+            "buyer_email": email,
+            "seller_email": seller_email,
+            "amount": amount
+        }
+        for seller_email, amount in payments_map.items()
+    ], session=session)
 
-    finally:
-        client.close()
+    return f"Order {order.inserted_id} placed successfully! Total amount deducted: ₹{total_cost}."
 
 @mcp.tool()
-def delete_from_cart(name: str, product_id: str) -> str:
-    """Remove an item from the buyer's cart using their name and product_id."""
-    email = get_email_by_name(name)
+async def place_order(name: str | None = None, session_token: str | None = None) -> str:
+    """
+    Place an order for everything in the buyer's cart, identifying the buyer
+    by session_token from loginUser or by name.
+    The whole checkout runs in one transaction with a fixed number of round trips.
+    """
+    email, name = await resolve_identity(name, session_token, BUYER_ROLE)
     if not email:
-        return f"No buyer found with name: {name}"
+        return _unknown_buyer(name, session_token)
 
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        buyer = db[PROFILE_COLLECTION].find_one({"email": email})
-        if buyer:
-            print("Current cart:", buyer.get("cart"))
-
-        result = db[PROFILE_COLLECTION].update_one(
-            {"email": email},
-            {"$pull": {"cart": {"product_id": product_id}}}
-        )
-        if result.modified_count == 0:
-            return "Item not found in cart."
-        return f"Item {product_id} removed from {name}'s cart."
-    finally:
-        client.close()
+    db = get_async_db()
+    async with db.client.start_session() as session:
+        try:
+            return await session.with_transaction(lambda s: _checkout(s, db, email, name))
+        except CheckoutError as e:
+            return str(e)
 
 @mcp.tool()
-def place_order(name: str) -> str:
-    email = get_email_by_name(name)
+async def order_history(
+    name: str | None = None,
+    session_token: str | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    page_token: str | None = None
+) -> str:
+    """
+    List the buyer's orders, newest first, identifying the buyer by session_token
+    from loginUser or by name. Each entry gives the order_id, time, status, total
+    and number of items; use order_details for the items. Pass the returned
+    next_page_token back as page_token for older orders. page_size is capped at 100.
+    """
+    email, name = await resolve_identity(name, session_token, BUYER_ROLE)
     if not email:
-        return f"No buyer found with name: {name}"
+        return _unknown_buyer(name, session_token)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
 
-    client = get_mongo_client()
     try:
-        db = client[DEFAULT_DATABASE]
-        profile_coll = db[PROFILE_COLLECTION]
-        inventory_coll = db[INVENTORY_COLLECTION]
-        order_coll = db["order"]
-        payment_coll = db["payment"]
-
-        buyer = profile_coll.find_one({"email": email})
-        if not buyer:
-            return "Buyer profile not found."
-
-        cart = buyer.get("cart", [])
-        if not cart:
-            return f"{name}'s cart is empty. Nothing to order."
-
-        balance = buyer.get("balance", 0.0)
-
-        total_cost = 0.0
-        for item in cart:
-            product_id = item.get("product_id")
-            quantity = item.get("quantity", 0)
-
-            product = inventory_coll.find_one({"_id": ObjectId(product_id)})
-            if not product:
-                return f"Product {product_id} not found in inventory."
-
-            available_qty = product.get("quantity", 0)
-            if quantity > available_qty:
-                return f"Insufficient stock for '{product['name']}'. Available: {available_qty}, requested: {quantity}."
-
-            total_cost += item.get("price", 0) * quantity
-
-        if total_cost > balance:
-            return f"Insufficient balance. Total cost is ₹{total_cost}, but you have ₹{balance}."
-
-        profile_coll.update_one({"email": email}, {"$inc": {"balance": -total_cost}})
-
-        for item in cart:
-            product_id = item.get("product_id")
-            quantity = item.get("quantity", 0)
-            inventory_coll.update_one(
-                {"_id": ObjectId(product_id)},
-                {"$inc": {"quantity": -quantity}}
-            )
-
-        for item in cart:
-            order_doc = {
-                "buyer_email": email,
-                "prod_name": item.get("name"),
-                "quantity": item.get("quantity"),
-                "total_price": item.get("price") * item.get("quantity")
-            }
-            order_coll.insert_one(order_doc)
-
-        payments_map = {}
-        for item in cart:
-            seller = item.get("seller_email")
-            amount = item.get("price") * item.get("quantity")
-            payments_map[seller] = payments_map.get(seller, 0) + amount
-
-        for seller_email, amount in payments_map.items():
-            payment_doc = {
-                "buyer_email": email,
-                "seller_email": seller_email,
-                "amount": amount
+        orders, next_token = await order_page(get_async_db(), email, page_size, page_token)
+    except ValueError as e:
+        return str(e)
+    if not orders and not page_token:
+        return f"{name} has no orders yet."
+
+    return to_json({
+        "buyer_name": name,
+        "orders": [
+            {
+                "order_id": str(order["_id"]),
+                "created_at": order["created_at"],
+                "status": order["status"],
+                "total": order["total"],
+                "item_count": order["item_count"]
             }
-            payment_coll.insert_one(payment_doc)
+            for order in orders
+        ],
+        "next_page_token": next_token
+    })
 
-        profile_coll.update_one({"email": email}, {"$set": {"cart": []}})
-
-        return f"Order placed successfully! Total amount deducted: ₹{total_cost}."
+@mcp.tool()
+async def order_details(order_id: str, name: str | None = None, session_token: str | None = None) -> str:
+    """Show one of the buyer's orders with its items, identifying the buyer by session_token from loginUser or by name."""
+    try:
+        oid = ObjectId(order_id)
+    except InvalidId:
+        return "Invalid order_id."
+    email, name = await resolve_identity(name, session_token, BUYER_ROLE)
+    if not email:
+        return _unknown_buyer(name, session_token)
 
-    finally:
-        client.close()
+    order = await find_order(get_async_db(), email, oid)
+    if not order:
+        return "Order not found."
+    order["order_id"] = order.pop("_id")
+    return to_json(order)
 
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
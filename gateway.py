@@ -0,0 +1,68 @@
+"""
+Single-process entrypoint serving the Login, Seller Service and Buyer Service
+FastMCP apps from one ASGI app, so they share one interpreter, one Mongo
+connection pool and one set of in-process caches.
+
+Each service is mounted under its own prefix with both transports:
+
+    /auth/mcp     /auth/sse     (messages: /auth/messages/)
+    /seller/mcp   /seller/sse   (messages: /seller/messages/)
+    /buyer/mcp    /buyer/sse    (messages: /buyer/messages/)
+
+Tool-call metrics for all three services are served in Prometheus text format
+at /metrics.
+
+Streamable-HTTP and SSE sessions live in the memory of the worker that opened
+them. With GATEWAY_WORKERS > 1 streamable HTTP therefore runs stateless by
+default, and SSE clients need sticky routing in front of the workers.
+"""
+import contextlib
+import os
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+import auth_server
+import buyer_server
+import seller_server
+from utils.lifespan import run_startup
+from utils.metrics import metrics_endpoint
+
+GATEWAY_HOST = os.getenv("GATEWAY_HOST", "0.0.0.0")
+GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "8000"))
+GATEWAY_WORKERS = int(os.getenv("GATEWAY_WORKERS", "1"))
+MCP_STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", str(GATEWAY_WORKERS > 1)).strip().lower() in ("1", "true", "yes")
+
+SERVICES = {
+    "auth": auth_server,
+    "seller": seller_server,
+    "buyer": buyer_server,
+}
+
+def _service_app(server) -> Starlette:
+    server.settings.stateless_http = MCP_STATELESS_HTTP
+    streamable = server.streamable_http_app()
+    # The SSE transport prefixes its message endpoint with the mount's root_path itself.
+    sse = server.sse_app()
+    return Starlette(routes=[*streamable.routes, *sse.routes])
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Mounted sub-apps don't get lifespan events, so the session managers are
+    # started here, and startup work runs before the first session instead of with it.
+    for module in SERVICES.values():
+        await run_startup(module.STARTUP_HOOKS)
+    async with contextlib.AsyncExitStack() as stack:
+        for module in SERVICES.values():
+            await stack.enter_async_context(module.mcp.session_manager.run())
+        yield
+
+app = Starlette(
+    routes=[
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        *(Mount(f"/{name}", app=_service_app(module.mcp)) for name, module in SERVICES.items()),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    uvicorn.run("gateway:app", host=GATEWAY_HOST, port=GATEWAY_PORT, workers=GATEWAY_WORKERS)
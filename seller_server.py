@@ -1,88 +1,179 @@
-import json
-from mcp.server.fastmcp import FastMCP
 from bson import ObjectId
-from utils.db_utils import get_mongo_client
-from utils.constants import DEFAULT_DATABASE, PROFILE_COLLECTION, INVENTORY_COLLECTION
-from utils.helpers import get_email_by_name, serialize_doc
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from utils.db_utils import get_async_db, warm_up, start_health_monitor
+from utils.catalog_cache import catalog_cache
+from utils.catalog_sync import stamp, delete_with_tombstone, start_tombstone_pruner
+from utils.catalog_import import IMPORT_FORMATS, import_file, resolve_import_path, start_import, get_import, end_import
+from utils.constants import INVENTORY_COLLECTION, SELLER_ROLE
+from utils.helpers import get_email_by_name, resolve_identity
+from utils.indexes import ensure_indexes
+from utils.lifespan import startup_lifespan
+from utils.metrics import InstrumentedFastMCP, tool_metrics
+from utils.product_updates import parse_changes, would_modify
+from utils.sales import ROLLUP_COUNTERS, SELLER, backfill_sales_rollups, sales_rollups, product_rollups, since_day
+from utils.serialization import to_json
+from utils.single_flight import SingleFlight, coalesce
+from utils.sessions import INVALID_SESSION_MESSAGE
 
-mcp = FastMCP("Seller Service")
+STARTUP_HOOKS = (start_health_monitor, warm_up, ensure_indexes, backfill_sales_rollups, start_tombstone_pruner)
+MAX_BULK_UPDATES = 1000
+MAX_SUMMARY_DAYS = 366
+MAX_TOP_PRODUCTS = 100
+
+# Seller writes drop affected entries from catalog_cache directly, so a buyer
+# service sharing this process sees them at once; other processes pick them up
+# through the inventory change stream.
+mcp = InstrumentedFastMCP("Seller Service", lifespan=startup_lifespan(*STARTUP_HOOKS))
+
+# This service doesn't follow the inventory change stream, so its reads only
+# share in-flight queries and never reuse a completed result.
+seller_reads = SingleFlight()
+tool_metrics.add_cache("single_flight_seller", seller_reads.stats)
+
+async def _seller_email(seller_email: str | None, session_token: str | None) -> str | None:
+    """The acting seller's email: from the session when a token is given, else as passed."""
+    if session_token:
+        email, _ = await resolve_identity(None, session_token, SELLER_ROLE)
+        return email.lower() if email else None
+    return seller_email.strip().lower() if seller_email else None
+
+def _unknown_seller(session_token: str | None) -> str:
+    if session_token:
+        return to_json({"error": INVALID_SESSION_MESSAGE})
+    return to_json({"error": "Provide seller_email or a session_token from loginUser."})
 
 @mcp.tool()
-def add_product(seller_email, product_name, price, quantity):
+async def add_product(product_name, price, quantity, seller_email=None, session_token=None):
     """
     Add a product to the inventory.
     Args:
-        seller_email: Seller's email (to identify seller)
         product_name: Name of the product
         price: Price of the product
         quantity: Quantity of the product
+        seller_email: Seller's email (to identify seller)
+        session_token: Token from loginUser; identifies the seller instead of seller_email
     """
     try:
-        client = get_mongo_client()
-        db = client[DEFAULT_DATABASE]
+        seller_email = await _seller_email(seller_email, session_token)
+        if not seller_email:
+            return _unknown_seller(session_token)
+
+        db = get_async_db()
         collection = db[INVENTORY_COLLECTION]
 
         product = {
             "name": product_name.strip(),
             "price": float(price),
             "quantity": int(quantity),
-            "seller_email": seller_email.strip().lower(),
+            "seller_email": seller_email,
+            "updated_at": stamp(),
         }
 
-        result = collection.insert_one(product)
+        result = await collection.insert_one(product)
         product["_id"] = str(result.inserted_id)
 
-        return json.dumps({"message": "Product added successfully", "product": product}, indent=2)
+        return to_json({"message": "Product added successfully", "product": product})
 
     except Exception as e:
-        return json.dumps({"error": str(e)})
-    finally:
-        client.close()
+        return to_json({"error": str(e)})
 
 @mcp.tool()
-def add_multiple_products(seller_email: str, products_json: list[dict]) -> str:
+async def add_multiple_products(products_json: list[dict], seller_email: str | None = None, session_token: str | None = None) -> str:
     """
     Add multiple products to the inventory in one go.
+    Identify the seller by session_token from loginUser or by seller_email.
     """
-    client = None
     try:
+        seller_email = await _seller_email(seller_email, session_token)
+        if not seller_email:
+            return _unknown_seller(session_token)
+
         products_data = products_json 
 
         if not isinstance(products_data, list):
-            return json.dumps({"error": "Expected a list of products."})
+            return to_json({"error": "Expected a list of products."})
 
-        client = get_mongo_client()
-        db = client[DEFAULT_DATABASE]
+        db = get_async_db()
         collection = db[INVENTORY_COLLECTION]
 
         products = []
+        now = stamp()
         for p in products_data:
             product = {
                 "name": p["name"].strip(),
                 "price": float(p["price"]),
                 "quantity": int(p["quantity"]),
-                "seller_email": seller_email.strip().lower()
+                "seller_email": seller_email,
+                "updated_at": now
             }
             products.append(product)
 
-        result = collection.insert_many(products)
+        result = await collection.insert_many(products)
 
         for i, product in enumerate(products):
             product["_id"] = str(result.inserted_ids[i])
 
-        return json.dumps({
+        return to_json({
             "message": f"{len(products)} products added successfully",
             "products": products
-        }, indent=2)
+        })
+
+    except Exception as e:
+        return to_json({"error": str(e)})
+
+@mcp.tool()
+async def import_products(format: str = "jsonl", path: str | None = None, data: str | None = None,
+                          import_id: str | None = None, last_chunk: bool = True,
+                          seller_email: str | None = None, session_token: str | None = None) -> str:
+    """
+    Bulk-import products from JSONL or CSV (format "jsonl" or "csv"). Each row needs
+    name, price and quantity; CSV starts with a header row naming them. A product the
+    seller already lists under the same name gets its price and quantity updated.
+    Give either `path`, a file in the server's import directory, or the file content
+    as `data`. Large files can be sent in pieces: the first call returns an import_id
+    to pass with each following piece, in order; set last_chunk to true on the final one.
+    Identify the seller by session_token from loginUser or by seller_email.
+    Returns summary counts and errors for the first 100 bad rows.
+    """
+    try:
+        seller_email = await _seller_email(seller_email, session_token)
+        if not seller_email:
+            return _unknown_seller(session_token)
+
+        fmt = format.strip().lower()
+        if fmt not in IMPORT_FORMATS:
+            return to_json({"error": f"Invalid format. Choose from: {', '.join(IMPORT_FORMATS)}."})
+
+        db = get_async_db()
+        if path:
+            summary = await import_file(db, seller_email, resolve_import_path(path), fmt)
+        elif data is not None or import_id:
+            if import_id:
+                job = get_import(import_id)
+                if job is None or job.seller_email != seller_email:
+                    return to_json({"error": "Unknown or expired import_id."})
+            else:
+                import_id, job = start_import(db, seller_email, fmt)
+            await job.feed(data or "")
+            if not last_chunk:
+                return to_json({"import_id": import_id, "status": "in_progress", **job.summary()})
+            end_import(import_id)
+            summary = await job.finish()
+        else:
+            return to_json({"error": "Provide a path or data to import."})
+
+        if summary["updated"]:
+            # Updated products aren't known by id here; let the cache refill.
+            catalog_cache.clear()
+        return to_json({"status": "complete", **summary})
 
     except Exception as e:
-        return json.dumps({"error": str(e)})
-    finally:
-        if client:
-            client.close()
+        return to_json({"error": str(e)})
 
 @mcp.tool()
-def update_product(product_id, field, new_value):
+async def update_product(product_id, field, new_value):
     """
     Update product details.
     Args:
@@ -91,13 +182,12 @@ def update_product(product_id, field, new_value):
         new_value: New value for the field
     """
     try:
-        client = get_mongo_client()
-        db = client[DEFAULT_DATABASE]
+        db = get_async_db()
         collection = db[INVENTORY_COLLECTION]
 
         update_field = field.strip().lower()
         if update_field not in ["name", "price", "quantity"]:
-            return json.dumps({"error": "Invalid field. Choose from 'name', 'price', or 'quantity'."})
+            return to_json({"error": "Invalid field. Choose from 'name', 'price', or 'quantity'."})
 
         if update_field == "price":
             new_value = float(new_value)
@@ -106,69 +196,226 @@ def update_product(product_id, field, new_value):
         else:
             new_value = new_value.strip()
 
-        result = collection.update_one({"_id": ObjectId(product_id)}, {"$set": {update_field: new_value}})
+        # Matching only a differing value keeps updated_at unchanged for a no-op.
+        result = await collection.update_one(
+            {"_id": ObjectId(product_id), update_field: {"$ne": new_value}},
+            {"$set": {update_field: new_value, "updated_at": stamp()}}
+        )
+        catalog_cache.invalidate(ObjectId(product_id))
         if result.modified_count == 0:
-            return json.dumps({"message": "No changes made. Check product_id."})
-        return json.dumps({"message": f"Product updated: {update_field} set to {new_value}"})
+            return to_json({"message": "No changes made. Check product_id."})
+        return to_json({"message": f"Product updated: {update_field} set to {new_value}"})
 
     except Exception as e:
-        return json.dumps({"error": str(e)})
-    finally:
-        client.close()
+        return to_json({"error": str(e)})
 
 @mcp.tool()
-def delete_product(product_id):
+async def bulk_update_products(updates: list[dict], seller_email: str | None = None, session_token: str | None = None) -> str:
     """
-    Delete a product from the inventory.
+    Update many of the seller's products in one go.
     Args:
-        product_id: ID of the product to delete
+        updates: Up to 1000 entries of {"product_id": ..., "changes": {field: value}}. Fields are
+            name, price and quantity. Price and quantity also take arithmetic on the current
+            value, e.g. {"price": "price * 0.9"}, {"quantity": "-= 5"} or {"quantity": {"$inc": 20}};
+            a bare "-5" is rejected rather than guessed at. A decrement that would take
+            quantity below zero is not applied.
+        seller_email: Seller's email (to identify seller)
+        session_token: Token from loginUser; identifies the seller instead of seller_email
+    Returns matched/modified/failed counts and a status for every product_id.
     """
     try:
-        client = get_mongo_client()
-        db = client[DEFAULT_DATABASE]
+        seller_email = await _seller_email(seller_email, session_token)
+        if not seller_email:
+            return _unknown_seller(session_token)
+
+        if not isinstance(updates, list) or not updates:
+            return to_json({"error": "Expected a non-empty list of updates."})
+        if len(updates) > MAX_BULK_UPDATES:
+            return to_json({"error": f"At most {MAX_BULK_UPDATES} updates per call."})
+
+        results = []
+        planned = []
+        seen = set()
+        for entry in updates:
+            product_id = str(entry.get("product_id", "")) if isinstance(entry, dict) else ""
+            report = {"product_id": product_id}
+            results.append(report)
+            try:
+                oid = ObjectId(product_id)
+                if oid in seen:
+                    raise ValueError("product_id is listed more than once")
+                seen.add(oid)
+                update, guard = parse_changes(entry.get("changes"))
+            except (InvalidId, TypeError, ValueError) as e:
+                report.update(status="failed", error=str(e) or "invalid product_id")
+                continue
+            planned.append((report, oid, update, guard))
+
+        db = get_async_db()
         collection = db[INVENTORY_COLLECTION]
 
-        result = collection.delete_one({"_id": ObjectId(product_id)})
-        if result.deleted_count == 0:
-            return json.dumps({"message": "No product found with given ID."})
-        return json.dumps({"message": "Product deleted successfully."})
+        # The current values tell which updates will match and change something;
+        # the write reports totals only.
+        current = {}
+        if planned:
+            cursor = collection.find(
+                {"_id": {"$in": [oid for _, oid, _, _ in planned]}, "seller_email": seller_email},
+                {"name": 1, "price": 1, "quantity": 1}
+            )
+            current = {doc["_id"]: doc for doc in await cursor.to_list()}
+
+        ops = []
+        applied = []
+        now = stamp()
+        for report, oid, update, guard in planned:
+            doc = current.get(oid)
+            if doc is None:
+                report.update(status="failed", error="No product with this ID among the seller's products.")
+            elif any(doc.get(field, 0) < bound["$gte"] for field, bound in guard.items()):
+                report.update(status="failed", error="Not enough quantity for this decrement.")
+            else:
+                changed = would_modify(doc, update)
+                if changed:
+                    update.setdefault("$set", {})["updated_at"] = now
+                ops.append(UpdateOne({"_id": oid, "seller_email": seller_email, **guard}, update))
+                applied.append((report, oid, changed))
+
+        matched = modified = 0
+        if ops:
+            try:
+                result = await collection.bulk_write(ops, ordered=False)
+                matched, modified = result.matched_count, result.modified_count
+            except BulkWriteError as e:
+                matched, modified = e.details["nMatched"], e.details["nModified"]
+                for error in e.details["writeErrors"]:
+                    applied[error["index"]][0].update(status="failed", error=error.get("errmsg", "write failed"))
+            for report, oid, changed in applied:
+                catalog_cache.invalidate(oid)
+                report.setdefault("status", "modified" if changed else "unchanged")
+
+        response = {
+            "requested": len(updates),
+            "matched": matched,
+            "modified": modified,
+            "failed": sum(report["status"] == "failed" for report in results),
+            "results": results,
+        }
+        expected = sum(report["status"] != "failed" for report, _, _ in applied)
+        if matched < expected:
+            response["warning"] = (f"{expected - matched} updates no longer matched when written; "
+                                   "their products changed concurrently. Check them with view_seller_products.")
+        return to_json(response)
 
     except Exception as e:
-        return json.dumps({"error": str(e)})
-    finally:
-        client.close()
+        return to_json({"error": str(e)})
 
 @mcp.tool()
-def view_seller_products(seller_name):
+async def delete_product(product_id):
+    """
+    Delete a product from the inventory.
+    Args:
+        product_id: ID of the product to delete
+    """
+    try:
+        # The tombstone tells catalog_changes clients about the deletion.
+        deleted = await delete_with_tombstone(get_async_db(), ObjectId(product_id))
+        catalog_cache.invalidate(ObjectId(product_id))
+        if not deleted:
+            return to_json({"message": "No product found with given ID."})
+        return to_json({"message": "Product deleted successfully."})
+
+    except Exception as e:
+        return to_json({"error": str(e)})
+
+@mcp.tool()
+@coalesce(flight=seller_reads)
+async def view_seller_products(seller_name=None, session_token=None):
     """
     View all products added by a seller.
     Args:
         seller_name: Seller's name (case-insensitive)
+        session_token: Token from loginUser; identifies the seller instead of seller_name
     """
     try:
-        client = get_mongo_client()
-        db = client[DEFAULT_DATABASE]
+        db = get_async_db()
         inventory_collection = db[INVENTORY_COLLECTION]
 
-        seller_email = get_email_by_name(seller_name.strip())
+        if session_token:
+            seller_email, seller_name = await resolve_identity(None, session_token, SELLER_ROLE)
+            if not seller_email:
+                return _unknown_seller(session_token)
+        elif seller_name:
+            seller_email = await get_email_by_name(seller_name.strip())
+        else:
+            return to_json({"error": "Provide seller_name or a session_token from loginUser."})
 
         if not seller_email:
-            return json.dumps({"error": f"No seller email found for name '{seller_name}'."})
+            return to_json({"error": f"No seller email found for name '{seller_name}'."})
 
         cursor = inventory_collection.find({"seller_email": seller_email.lower()})
-        products = [serialize_doc(doc) for doc in cursor]
+        products = await cursor.to_list()
 
-        return json.dumps({
+        return to_json({
             "seller_name": seller_name,
             "seller_email": seller_email,
             "product_count": len(products),
             "products": products
-        }, indent=2)
+        })
+
+    except Exception as e:
+        return to_json({"error": str(e)})
+
+@mcp.tool()
+async def sales_summary(days: int = 30, seller_email: str | None = None, session_token: str | None = None) -> str:
+    """
+    Revenue, units sold and order count of the seller, all-time and per UTC day
+    for the last `days` days (at most 366). Days without sales are left out.
+    Identify the seller by session_token from loginUser or by seller_email.
+    """
+    try:
+        seller_email = await _seller_email(seller_email, session_token)
+        if not seller_email:
+            return _unknown_seller(session_token)
+        days = max(1, min(int(days), MAX_SUMMARY_DAYS))
+
+        rollups = await sales_rollups(get_async_db(), seller_email, since_day(days))
+        empty = {counter: 0 for counter in ROLLUP_COUNTERS}
+        total = next((r for r in rollups if r["scope"] == SELLER), empty)
+        daily = [{"day": r["day"], **{c: r.get(c, 0) for c in ROLLUP_COUNTERS}} for r in rollups if r["scope"] != SELLER]
+
+        return to_json({
+            "seller_email": seller_email,
+            "all_time": {c: total.get(c, 0) for c in ROLLUP_COUNTERS},
+            "period": {"days": days, **{c: sum(d[c] for d in daily) for c in ROLLUP_COUNTERS}},
+            "daily": daily
+        })
+
+    except Exception as e:
+        return to_json({"error": str(e)})
+
+@mcp.tool()
+async def top_products(sort_by: str = "revenue", limit: int = 10, seller_email: str | None = None, session_token: str | None = None) -> str:
+    """
+    The seller's best-selling products of all time.
+    Args:
+        sort_by: "revenue" or "units"
+        limit: Number of products to return (at most 100)
+        seller_email: Seller's email (to identify seller)
+        session_token: Token from loginUser; identifies the seller instead of seller_email
+    """
+    try:
+        seller_email = await _seller_email(seller_email, session_token)
+        if not seller_email:
+            return _unknown_seller(session_token)
+        if sort_by not in ("revenue", "units"):
+            return to_json({"error": "Invalid sort_by. Choose from 'revenue' or 'units'."})
+        limit = max(1, min(int(limit), MAX_TOP_PRODUCTS))
+
+        products = await product_rollups(get_async_db(), seller_email, sort_by, limit)
+        return to_json({"seller_email": seller_email, "sort_by": sort_by, "products": products})
 
     except Exception as e:
-        return json.dumps({"error": str(e)})
-    finally:
-        client.close()
+        return to_json({"error": str(e)})
 
 if __name__ == "__main__":
     mcp.run()
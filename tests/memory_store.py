@@ -0,0 +1,973 @@
+"""
+In-process stand-in for AsyncMongoClient, for tests that run the tools
+without a MongoDB server. Install it the way benchmarks/load_test.py installs
+mongomock, as the shared client get_async_client() hands out:
+
+    db_utils._async_client = MemoryClient()
+    db_utils._async_loop = asyncio.get_running_loop()
+
+It implements the part of the database and collection API the tools and
+helpers use: find with projection, sort, skip, limit and case-insensitive
+collation; the insert, update, replace, delete and find_one_and_* writes,
+including upserts, $set/$unset/$inc/$mul/$setOnInsert and $set pipeline
+updates; bulk_write; create_index with unique keys; and transactions through
+start_session().with_transaction. The query operators are the ones the tree
+uses: $eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $exists, $type, $regex, $or,
+$and and $nor. Anything else fails loudly rather than being imitated: watch()
+raises the error a standalone mongod gives, so the inventory watcher polls;
+TTL indexes are created but never expire anything.
+
+Documents go through a BSON round trip on the way in and out, so callers see
+what Mongo would return: naive UTC datetimes truncated to milliseconds, and
+copies rather than the stored objects. Queries run on the index that reads
+the fewest entries, the _id index being the collection scan. Single
+operations run without yielding; a transaction holds the engine lock until
+its callback returns, and an exception rolls back every document it touched.
+
+test_memory_store.py runs its cases against this client and, with
+MONGODB_TEST_URI set, against that server too, so the two stay in step.
+"""
+import asyncio
+import bisect
+import contextvars
+import itertools
+import re
+from datetime import datetime
+import bson
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, InvalidOperation, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+_active_txn = contextvars.ContextVar("memory_store_txn", default=None)
+
+def _normalize(value):
+    """Round-trips a value through BSON, as sending it to mongod would."""
+    return bson.decode(bson.encode({"v": value}))["v"]
+
+def _clone(doc: dict) -> dict:
+    return bson.decode(bson.encode(doc))
+
+def _get(doc, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _set(doc: dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+def _unset(doc: dict, path: str):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(leaf, None)
+
+# Mongo's cross-type ordering, reduced to the types stored here.
+def _bracket(value) -> int:
+    if value is _MISSING or value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+def _sort_key(value):
+    bracket = _bracket(value)
+    if bracket == 1:
+        return (1, 0)
+    if bracket in (4, 5, 10):
+        return (bracket, repr(value))
+    return (bracket, value)
+
+def _equals(value, target, ci: bool) -> bool:
+    if value is _MISSING:
+        return target is None
+    if _bracket(value) != _bracket(target):
+        return False
+    if ci and isinstance(value, str):
+        return value.casefold() == target.casefold()
+    return value == target
+
+def _equals_any(value, target, ci: bool) -> bool:
+    """Equality as in a query: an array field matches if any element does."""
+    if isinstance(value, list) and not isinstance(target, list):
+        return any(_equals(item, target, ci) for item in value)
+    return _equals(value, target, ci)
+
+def _compare(value, target, op: str, ci: bool) -> bool:
+    if isinstance(value, list):
+        return any(_compare(item, target, op, ci) for item in value)
+    bracket = _bracket(value)
+    if bracket != _bracket(target) or bracket in (1, 4, 5, 10):
+        return False
+    if ci and isinstance(value, str):
+        value, target = value.casefold(), target.casefold()
+    if op == "$gt":
+        return value > target
+    if op == "$gte":
+        return value >= target
+    if op == "$lt":
+        return value < target
+    return value <= target
+
+_TYPES = {
+    "date": datetime, "string": str, "objectId": ObjectId, "object": dict,
+    "array": list, "bool": bool, "double": float, "int": int, "long": int, "null": type(None),
+}
+
+def _is_operator_doc(cond) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(key.startswith("$") for key in cond)
+
+def _match_field(value, cond, ci: bool) -> bool:
+    if not _is_operator_doc(cond):
+        return _equals_any(value, cond, ci)
+    for op, arg in cond.items():
+        if op == "$eq":
+            matched = _equals_any(value, arg, ci)
+        elif op == "$ne":
+            matched = not _equals_any(value, arg, ci)
+        elif op == "$in":
+            matched = any(_equals_any(value, item, ci) for item in arg)
+        elif op == "$nin":
+            matched = not any(_equals_any(value, item, ci) for item in arg)
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            matched = value is not _MISSING and _compare(value, arg, op, ci)
+        elif op == "$exists":
+            matched = (value is not _MISSING) == bool(arg)
+        elif op == "$type":
+            expected = _TYPES.get(arg)
+            if expected is None:
+                raise OperationFailure(f"Unsupported $type {arg!r} in the memory backend")
+            matched = value is not _MISSING and isinstance(value, expected) and not (
+                expected is int and isinstance(value, bool)
+            )
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+            pattern = arg.pattern if hasattr(arg, "pattern") else arg
+            matched = isinstance(value, str) and re.search(pattern, value, flags) is not None
+        elif op == "$options":
+            continue
+        else:
+            raise OperationFailure(f"Unsupported query operator {op} in the memory backend")
+        if not matched:
+            return False
+    return True
+
+def _matches(doc: dict, query: dict, ci: bool) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, clause, ci) for clause in cond):
+                return False
+        elif key == "$and":
+            if not all(_matches(doc, clause, ci) for clause in cond):
+                return False
+        elif key == "$nor":
+            if any(_matches(doc, clause, ci) for clause in cond):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"Unsupported query operator {key} in the memory backend")
+        elif not _match_field(_get(doc, key), cond, ci):
+            return False
+    return True
+
+def _truthy(value) -> bool:
+    return value not in (_MISSING, None, False, 0)
+
+def _evaluate(expr, doc: dict):
+    """Evaluates the aggregation expressions used in pipeline updates."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _get(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_evaluate(item, doc) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1 and next(iter(expr)).startswith("$"):
+        op, args = next(iter(expr.items()))
+        if op == "$literal":
+            return args
+        if op == "$cond":
+            if isinstance(args, dict):
+                args = [args["if"], args["then"], args["else"]]
+            return _evaluate(args[1] if _truthy(_evaluate(args[0], doc)) else args[2], doc)
+        if op in ("$eq", "$ne"):
+            left, right = (_evaluate(arg, doc) for arg in args)
+            equal = left is right if _MISSING in (left, right) else _equals(left, right, False)
+            return equal if op == "$eq" else not equal
+        if op == "$and":
+            return all(_truthy(_evaluate(arg, doc)) for arg in args)
+        if op == "$or":
+            return any(_truthy(_evaluate(arg, doc)) for arg in args)
+        raise OperationFailure(f"Unsupported expression {op} in the memory backend")
+    return {key: _evaluate(value, doc) for key, value in expr.items()}
+
+def _number(value, op: str, path: str):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise OperationFailure(f"Cannot apply {op} to a value of non-numeric type at {path}")
+    return value
+
+def _apply_update(doc: dict, update, inserting: bool) -> dict:
+    """Returns the updated copy of a stored document."""
+    new = _clone(doc)
+    if isinstance(update, list):
+        for stage in update:
+            (op, spec), = stage.items()
+            if op in ("$set", "$addFields"):
+                values = {path: _evaluate(expr, new) for path, expr in spec.items()}
+                for path, value in values.items():
+                    _unset(new, path) if value is _MISSING else _set(new, path, value)
+            elif op == "$unset":
+                for path in [spec] if isinstance(spec, str) else spec:
+                    _unset(new, path)
+            else:
+                raise OperationFailure(f"Unsupported pipeline stage {op} in the memory backend")
+    else:
+        for op, spec in update.items():
+            for path, arg in spec.items():
+                current = _get(new, path)
+                if op == "$set" or (op == "$setOnInsert" and inserting):
+                    _set(new, path, arg)
+                elif op == "$setOnInsert":
+                    continue
+                elif op == "$unset":
+                    _unset(new, path)
+                elif op == "$inc":
+                    _set(new, path, arg if current is _MISSING else _number(current, op, path) + _number(arg, op, path))
+                elif op == "$mul":
+                    _set(new, path, arg * 0 if current is _MISSING else _number(current, op, path) * _number(arg, op, path))
+                elif op == "$min":
+                    if current is _MISSING or _sort_key(arg) < _sort_key(current):
+                        _set(new, path, arg)
+                elif op == "$max":
+                    if current is _MISSING or _sort_key(arg) > _sort_key(current):
+                        _set(new, path, arg)
+                else:
+                    raise OperationFailure(f"Unsupported update operator {op} in the memory backend")
+    if "_id" in doc and new.get("_id") != doc["_id"]:
+        raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+    return new
+
+def _upsert_seed(query: dict) -> dict:
+    """The equality fields of an upsert's filter, which the inserted document starts from."""
+    seed = {}
+    for key, cond in query.items():
+        if key.startswith("$"):
+            continue
+        if _is_operator_doc(cond):
+            if "$eq" in cond:
+                _set(seed, key, cond["$eq"])
+            continue
+        _set(seed, key, cond)
+    return seed
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and not all(fields.values()) or (not fields and not include_id):
+        out = dict(doc)
+        for field, keep in fields.items():
+            if not keep:
+                _unset(out, field)
+        if not include_id:
+            out.pop("_id", None)
+        return out
+    out = {"_id": doc["_id"]} if include_id and "_id" in doc else {}
+    for field in fields:
+        value = _get(doc, field)
+        if value is not _MISSING:
+            _set(out, field, value)
+    return out
+
+def _sort_spec(sort) -> list:
+    if not sort:
+        return []
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    if isinstance(sort, dict):
+        return list(sort.items())
+    return [tuple(item) for item in sort]
+
+def _sorted(docs: list, sort) -> list:
+    for field, direction in reversed(_sort_spec(sort)):
+        docs.sort(key=lambda doc: _sort_key(_get(doc, field)), reverse=direction in (-1, "-1", "descending"))
+    return docs
+
+def _hashable(value, ci: bool = False):
+    if value is _MISSING or value is None:
+        return None
+    if isinstance(value, bool):
+        return ("bool", value)
+    if ci and isinstance(value, str):
+        return value.casefold()
+    if isinstance(value, (dict, list)):
+        return ("bson", repr(value))
+    return value
+
+class _Bound:
+    """Sorts below (_LOW) or above (_HIGH) every index key, to bound range scans."""
+
+    def __init__(self, high: bool):
+        self.high = high
+
+    def __lt__(self, other):
+        return other is not self and not self.high
+
+    def __gt__(self, other):
+        return other is not self and self.high
+
+    def __le__(self, other):
+        return other is self or not self.high
+
+    def __ge__(self, other):
+        return other is self or self.high
+
+_LOW = _Bound(False)
+_HIGH = _Bound(True)
+
+def _index_key(value, ci: bool):
+    if ci and isinstance(value, str):
+        return (3, value.casefold())
+    return _sort_key(value)
+
+def _descending(direction) -> bool:
+    return direction in (-1, "-1", "descending")
+
+class _Index:
+    """
+    A sorted list of (key..., _id) entries. Equality and $in conditions on a
+    prefix of the fields, plus a range on the next one, become bisected
+    intervals that are read in index order, so a sort on the following fields
+    needs no sorting and a limited query stops early. Keys are stored
+    ascending whatever the declared direction; descending sorts scan backwards.
+    """
+
+    def __init__(self, name: str, keys: list, unique: bool, ci: bool):
+        self.name = name
+        self.fields = [field for field, _ in keys]
+        self.unique = unique
+        self.ci = ci
+        self.multikey = False
+        self.entries = []
+        self.keys = {}
+
+    def _entries(self, doc: dict) -> list:
+        choices = []
+        for field in self.fields:
+            value = _get(doc, field)
+            if isinstance(value, list) and value:
+                # One entry per element, as a multikey index has.
+                self.multikey = True
+                choices.append(sorted({_index_key(item, self.ci) for item in value}))
+            else:
+                choices.append([_index_key(None if isinstance(value, list) else value, self.ci)])
+        tail = (_sort_key(doc["_id"]), _hashable(doc["_id"]))
+        return [(*keys, *tail) for keys in itertools.product(*choices)]
+
+    def _unique_key(self, doc: dict) -> tuple:
+        return tuple(_hashable(_get(doc, field), self.ci) for field in self.fields)
+
+    def check(self, doc: dict, namespace: str):
+        if not self.unique:
+            return
+        owner = self.keys.get(self._unique_key(doc), _MISSING)
+        if owner is not _MISSING and owner != doc["_id"]:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {namespace} index: {self.name}",
+                11000,
+                {"code": 11000, "keyPattern": {field: 1 for field in self.fields}},
+            )
+
+    def add(self, doc: dict):
+        for entry in self._entries(doc):
+            bisect.insort(self.entries, entry)
+        if self.unique:
+            self.keys[self._unique_key(doc)] = doc["_id"]
+
+    def remove(self, doc: dict):
+        for entry in self._entries(doc):
+            position = bisect.bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+        if self.unique and self.keys.get(self._unique_key(doc)) == doc["_id"]:
+            del self.keys[self._unique_key(doc)]
+
+    def _span(self, low: tuple, high: tuple) -> tuple:
+        return bisect.bisect_left(self.entries, low), bisect.bisect_right(self.entries, high)
+
+    def count(self, intervals: list) -> int:
+        return sum(stop - start for start, stop in (self._span(low, high) for low, high in intervals))
+
+    def scan(self, intervals: list, reverse: bool = False):
+        """Yields the document keys within the intervals, in index order."""
+        seen = set() if self.multikey else None
+        for low, high in reversed(intervals) if reverse else intervals:
+            start, stop = self._span(low, high)
+            for position in range(stop - 1, start - 1, -1) if reverse else range(start, stop):
+                key = self.entries[position][-1]
+                if seen is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                yield key
+
+def _equality_values(cond):
+    if _is_operator_doc(cond):
+        if set(cond) == {"$in"}:
+            return None if any(isinstance(item, (dict, list)) for item in cond["$in"]) else list(cond["$in"])
+        if set(cond) == {"$eq"} and not isinstance(cond["$eq"], (dict, list)):
+            return [cond["$eq"]]
+        return None
+    if isinstance(cond, (dict, list)):
+        return None
+    return [cond]
+
+_RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+# Cap on the intervals an $in over index fields expands into.
+_MAX_INTERVALS = 1000
+
+def _range_bounds(cond, ci: bool, index_ci: bool):
+    """(low, high) keys bounding a range condition within its type, or None."""
+    if not _is_operator_doc(cond) or not set(cond) <= _RANGE_OPERATORS:
+        return None
+    low = high = None
+    for op, value in cond.items():
+        if isinstance(value, (dict, list)) or (isinstance(value, str) and ci != index_ci):
+            return None
+        # Every condition must hold, so any one lower and one upper bound will do.
+        if op in ("$gt", "$gte"):
+            low = _index_key(value, index_ci)
+        else:
+            high = _index_key(value, index_ci)
+    bracket = (low or high)[0]
+    return (low or (bracket, _LOW)), ((high, _HIGH) if high else ((bracket, _HIGH),))
+
+class MemoryCursor:
+    """The part of AsyncCursor the tools use: to_list, async iteration and chained limit/skip/sort."""
+
+    def __init__(self, collection, query, projection, sort, skip, limit, ci):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = sort
+        self._skip = skip
+        self._limit = limit
+        self._ci = ci
+        self._docs = None
+        self._position = 0
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else key_or_list
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    async def _load(self) -> list:
+        if self._docs is None:
+            await self._collection.database.client._wait_for_transactions()
+            docs = self._collection._select(self._query, self._ci, self._sort, self._skip, self._limit)
+            self._docs = [_clone(_project(doc, self._projection)) for doc in docs]
+        return self._docs
+
+    async def to_list(self, length=None) -> list:
+        docs = await self._load()
+        end = len(docs) if length is None else min(len(docs), self._position + length)
+        taken = docs[self._position:end]
+        self._position = end
+        return taken
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        docs = await self._load()
+        if self._position >= len(docs):
+            raise StopAsyncIteration
+        self._position += 1
+        return docs[self._position - 1]
+
+    async def close(self):
+        self._docs = []
+        self._position = 0
+
+class MemoryCollection:
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._docs = {}
+        # The _id index doubles as the collection scan: _id order, like ObjectIds' insertion order.
+        self._indexes = {"_id_": _Index("_id_", [("_id", 1)], False, False)}
+
+    # Internal operations; each runs to completion without yielding.
+
+    def _plan(self, index: _Index, query: dict, ci: bool, sort: list, wanted: int) -> tuple:
+        """(estimated cost, index, intervals, reverse, sorted) for answering the query with one index."""
+        prefixes = [()]
+        pinned = set()
+        used = set()
+        for field in index.fields:
+            values = _equality_values(query[field]) if field in query else None
+            if not values or (ci and not index.ci and any(isinstance(value, str) for value in values)):
+                break
+            keys = sorted({_index_key(value, index.ci) for value in values})
+            if len(prefixes) * len(keys) > _MAX_INTERVALS:
+                break
+            prefixes = [(*prefix, key) for prefix in prefixes for key in keys]
+            if len(keys) == 1:
+                pinned.add(field)
+            used.add(field)
+        position = len(next(iter(prefixes)))
+        bounds = None
+        if position < len(index.fields) and index.fields[position] in query:
+            bounds = _range_bounds(query[index.fields[position]], ci, index.ci)
+            if bounds is not None:
+                used.add(index.fields[position])
+        if bounds is None:
+            intervals = [(prefix, (*prefix, _HIGH)) for prefix in prefixes]
+        else:
+            low, high = bounds
+            intervals = [((*prefix, low), (*prefix, *high)) for prefix in prefixes]
+
+        rest = [(field, direction) for field, direction in sort if field not in pinned]
+        directions = {_descending(direction) for _, direction in rest}
+        # Entries end with the _id, so the index is also ordered by it after its own fields.
+        order = index.fields if "_id" in index.fields else [*index.fields, "_id"]
+        served = not rest or (
+            len(prefixes) == 1 and not index.multikey and index.ci == ci and len(directions) == 1
+            and [field for field, _ in rest] == order[position:position + len(rest)]
+        )
+        count = index.count(intervals)
+        if served and wanted:
+            # Read in order and stop at the limit; other conditions make it read further.
+            residual = any(key not in used for key in query)
+            cost = min(count, wanted * (8 if residual else 1))
+        else:
+            cost = count if served else 2 * count
+        return cost, index, intervals, served and directions == {True}, served
+
+    def _select(self, query, ci: bool, sort=None, skip: int = 0, limit: int = 0) -> list:
+        query = _normalize(query or {})
+        sort = _sort_spec(sort)
+        limit = abs(limit)
+        wanted = skip + limit if limit else 0
+        _, index, intervals, reverse, served = min(
+            (self._plan(index, query, ci, sort, wanted) for index in self._indexes.values()),
+            key=lambda plan: plan[0]
+        )
+        docs = []
+        for key in index.scan(intervals, reverse):
+            doc = self._docs[key]
+            if _matches(doc, query, ci):
+                docs.append(doc)
+                if served and wanted and len(docs) == wanted:
+                    break
+        if not served:
+            docs = _sorted(docs, sort)
+        return docs[skip:wanted] if limit else docs[skip:]
+
+    def _record(self, key):
+        self.database.client._record(self, key)
+
+    def _check_unique(self, doc: dict):
+        for index in self._indexes.values():
+            index.check(doc, self.full_name)
+
+    def _insert(self, doc: dict):
+        key = _hashable(doc["_id"])
+        if key in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} index: _id_", 11000,
+                                    {"code": 11000, "keyPattern": {"_id": 1}})
+        self._check_unique(doc)
+        self._record(key)
+        self._docs[key] = doc
+        for index in self._indexes.values():
+            index.add(doc)
+
+    def _replace(self, old: dict, new: dict):
+        self._check_unique(new)
+        key = _hashable(old["_id"])
+        self._record(key)
+        for index in self._indexes.values():
+            index.remove(old)
+            index.add(new)
+        self._docs[key] = new
+
+    def _delete(self, doc: dict):
+        key = _hashable(doc["_id"])
+        self._record(key)
+        for index in self._indexes.values():
+            index.remove(doc)
+        del self._docs[key]
+
+    def _restore(self, key, doc):
+        """Puts back a document as it was before a rolled-back transaction."""
+        current = self._docs.pop(key, None)
+        if current is not None:
+            for index in self._indexes.values():
+                index.remove(current)
+        if doc is not None:
+            self._docs[key] = doc
+            for index in self._indexes.values():
+                index.add(doc)
+
+    def _prepare(self, document: dict) -> dict:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        return _clone(document)
+
+    def _update(self, query, update, upsert: bool, multi: bool, ci: bool, sort=None) -> tuple:
+        """Returns (matched, modified, upserted_id, [(before, after)])."""
+        update = _normalize(update)
+        if not isinstance(update, list) and not _is_operator_doc(update):
+            raise OperationFailure("update only works with $ operators")
+        docs = self._select(query, ci, sort, 0, 0 if multi else 1)
+        changes = []
+        modified = 0
+        for doc in docs:
+            new = _apply_update(doc, update, inserting=False)
+            if new != doc:
+                self._replace(doc, new)
+                modified += 1
+            changes.append((doc, new))
+        if docs or not upsert:
+            return len(docs), modified, None, changes
+        seed = _upsert_seed(_normalize(query or {}))
+        new = _apply_update(seed, update, inserting=True)
+        new.setdefault("_id", ObjectId())
+        new = {"_id": new.pop("_id"), **new}
+        self._insert(new)
+        return 0, 0, new["_id"], [(None, new)]
+
+    def _replace_matching(self, query, replacement: dict, upsert: bool, ci: bool) -> tuple:
+        replacement = _normalize(replacement)
+        if _is_operator_doc(replacement):
+            raise OperationFailure("replacement document must not contain $ operators")
+        docs = self._select(query, ci, None, 0, 1)
+        if docs:
+            new = {"_id": docs[0]["_id"], **{k: v for k, v in replacement.items() if k != "_id"}}
+            if new != docs[0]:
+                self._replace(docs[0], new)
+                return 1, 1, None
+            return 1, 0, None
+        if not upsert:
+            return 0, 0, None
+        new = {**_upsert_seed(_normalize(query or {})), **replacement}
+        new = {"_id": new.pop("_id", ObjectId()), **new}
+        self._insert(new)
+        return 0, 0, new["_id"]
+
+    # The pymongo API.
+
+    @staticmethod
+    def _ci(collation) -> bool:
+        return bool(collation) and collation.get("strength") in (1, 2)
+
+    async def _ready(self):
+        await self.database.client._wait_for_transactions()
+
+    def find(self, filter=None, projection=None, skip: int = 0, limit: int = 0, sort=None,
+             collation=None, session=None, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter, projection, sort, skip, limit, self._ci(collation))
+
+    async def find_one(self, filter=None, projection=None, *args, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        docs = await self.find(filter, projection, *args, **kwargs).limit(1).to_list()
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter, session=None, collation=None, skip: int = 0, limit: int = 0, **kwargs) -> int:
+        await self._ready()
+        return len(self._select(filter, self._ci(collation), None, skip, limit))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def insert_one(self, document: dict, session=None, **kwargs) -> InsertOneResult:
+        await self._ready()
+        self._insert(self._prepare(document))
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents, ordered: bool = True, session=None, **kwargs) -> InsertManyResult:
+        await self._ready()
+        documents = list(documents)
+        result = await self.bulk_write([InsertOne(doc) for doc in documents], ordered=ordered)
+        return InsertManyResult([doc["_id"] for doc in documents], result.acknowledged)
+
+    async def update_one(self, filter, update, upsert: bool = False, collation=None, session=None, sort=None,
+                         **kwargs) -> UpdateResult:
+        await self._ready()
+        matched, modified, upserted_id, _ = self._update(filter, update, upsert, False, self._ci(collation), sort)
+        return UpdateResult(_raw_update(matched, modified, upserted_id), True)
+
+    async def update_many(self, filter, update, upsert: bool = False, collation=None, session=None,
+                          **kwargs) -> UpdateResult:
+        await self._ready()
+        matched, modified, upserted_id, _ = self._update(filter, update, upsert, True, self._ci(collation))
+        return UpdateResult(_raw_update(matched, modified, upserted_id), True)
+
+    async def replace_one(self, filter, replacement, upsert: bool = False, collation=None, session=None,
+                          **kwargs) -> UpdateResult:
+        await self._ready()
+        matched, modified, upserted_id = self._replace_matching(filter, replacement, upsert, self._ci(collation))
+        return UpdateResult(_raw_update(matched, modified, upserted_id), True)
+
+    async def delete_one(self, filter, collation=None, session=None, **kwargs) -> DeleteResult:
+        await self._ready()
+        docs = self._select(filter, self._ci(collation), None, 0, 1)
+        for doc in docs:
+            self._delete(doc)
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def delete_many(self, filter, collation=None, session=None, **kwargs) -> DeleteResult:
+        await self._ready()
+        docs = self._select(filter, self._ci(collation))
+        for doc in docs:
+            self._delete(doc)
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, collation=None, session=None, **kwargs):
+        await self._ready()
+        _, _, _, changes = self._update(filter, update, upsert, False, self._ci(collation), sort)
+        if not changes:
+            return None
+        before, after = changes[0]
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return None if doc is None else _clone(_project(doc, projection))
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None, collation=None, session=None, **kwargs):
+        await self._ready()
+        docs = self._select(filter, self._ci(collation), sort, 0, 1)
+        if not docs:
+            return None
+        self._delete(docs[0])
+        return _clone(_project(docs[0], projection))
+
+    async def bulk_write(self, requests, ordered: bool = True, session=None, **kwargs) -> BulkWriteResult:
+        await self._ready()
+        result = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(self._prepare(request._doc))
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    matched, modified, upserted_id, _ = self._update(
+                        request._filter, request._doc, request._upsert, isinstance(request, UpdateMany),
+                        self._ci(request._collation), getattr(request, "_sort", None)
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": upserted_id})
+                elif isinstance(request, ReplaceOne):
+                    matched, modified, upserted_id = self._replace_matching(
+                        request._filter, request._doc, request._upsert, self._ci(request._collation)
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    docs = self._select(request._filter, self._ci(request._collation), None, 0,
+                                        0 if isinstance(request, DeleteMany) else 1)
+                    for doc in docs:
+                        self._delete(doc)
+                    result["nRemoved"] += len(docs)
+                else:
+                    raise InvalidOperation(f"Unsupported bulk operation {request!r}")
+            except (DuplicateKeyError, OperationFailure) as e:
+                result["writeErrors"].append({
+                    "index": index, "code": e.code or 2, "errmsg": str(e), "op": getattr(request, "_doc", None)
+                })
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_index(self, keys, name=None, unique: bool = False, collation=None,
+                           expireAfterSeconds=None, session=None, **kwargs) -> str:
+        await self._ready()
+        keys = _sort_spec(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if name in self._indexes:
+            return name
+        index = _Index(name, keys, unique, self._ci(collation))
+        for doc in self._docs.values():
+            index.check(doc, self.full_name)
+            index.add(doc)
+        self._indexes[name] = index
+        return name
+
+    async def drop_index(self, index_or_name, session=None, **kwargs):
+        await self._ready()
+        if index_or_name == "_id_" or self._indexes.pop(index_or_name, None) is None:
+            raise OperationFailure(f"index not found with name [{index_or_name}]", 27)
+
+    async def drop(self, **kwargs):
+        await self.database.drop_collection(self.name)
+
+    async def watch(self, *args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+
+def _raw_update(matched: int, modified: int, upserted_id) -> dict:
+    raw = {"n": matched if upserted_id is None else 1, "nModified": modified}
+    if upserted_id is not None:
+        raw["upserted"] = upserted_id
+    return raw
+
+class MemoryDatabase:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.get_collection(name)
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello", "isMaster"):
+            return {"ok": 1.0}
+        raise OperationFailure(f"Command {name} is not supported by MemoryClient")
+
+    async def list_collection_names(self, **kwargs) -> list:
+        return [name for name, collection in self._collections.items() if collection._docs or len(collection._indexes) > 1]
+
+    async def drop_collection(self, name: str, **kwargs):
+        await self.client._wait_for_transactions()
+        self._collections.pop(name, None)
+
+class MemorySession:
+    """start_session() stand-in; with_transaction runs the callback with the engine to itself."""
+
+    def __init__(self, client):
+        self.client = client
+        self._undo = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._undo is not None
+
+    async def with_transaction(self, callback, *args, **kwargs):
+        if _active_txn.get() is not None:
+            raise InvalidOperation("Transaction already in progress")
+        async with self.client._engine_lock():
+            self._undo = {}
+            token = _active_txn.set(self)
+            try:
+                result = await callback(self)
+            except BaseException:
+                for (collection, key), doc in reversed(list(self._undo.items())):
+                    collection._restore(key, doc)
+                raise
+            finally:
+                _active_txn.reset(token)
+                self._undo = None
+            return result
+
+    async def end_session(self):
+        pass
+
+class MemoryClient:
+    """AsyncMongoClient stand-in holding every database in process memory."""
+
+    def __init__(self):
+        self._databases = {}
+        self._lock = None
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        return self.get_database(name)
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    @property
+    def admin(self) -> MemoryDatabase:
+        return self.get_database("admin")
+
+    def start_session(self, **kwargs) -> MemorySession:
+        return MemorySession(self)
+
+    async def drop_database(self, name, **kwargs):
+        await self._wait_for_transactions()
+        self._databases.pop(getattr(name, "name", name), None)
+
+    async def list_database_names(self, **kwargs) -> list:
+        return list(self._databases)
+
+    async def close(self):
+        pass
+
+    def _engine_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _wait_for_transactions(self):
+        """Waits while another task's transaction holds the engine; returns at once otherwise."""
+        lock = self._engine_lock()
+        txn = _active_txn.get()
+        if lock.locked() and (txn is None or txn.client is not self):
+            async with lock:
+                pass
+
+    def _record(self, collection: MemoryCollection, key):
+        txn = _active_txn.get()
+        if txn is not None and txn.client is self and txn.in_transaction and (collection, key) not in txn._undo:
+            # Stored documents are replaced, never changed in place, so keeping the reference is enough.
+            txn._undo[(collection, key)] = collection._docs.get(key)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import unittest
+from bson import ObjectId
+from memory_store import MemoryClient
+import buyer_server
+from utils import db_utils
+from utils.constants import CART_COLLECTION, INVENTORY_COLLECTION, ORDER_COLLECTION, PROFILE_COLLECTION, RESERVATION_COLLECTION
+from utils.name_cache import name_cache
+
+class BuyerToolTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Installed the way benchmarks/load_test.py installs mongomock.
+        db_utils._async_client = MemoryClient()
+        db_utils._async_loop = asyncio.get_running_loop()
+        name_cache.invalidate("Asha")
+        self.db = db_utils.get_async_db()
+        await self.db[PROFILE_COLLECTION].insert_one(
+            {"name": "Asha", "email": "asha@example.com", "role": "buyer", "balance": 100.0}
+        )
+        self.lamp, self.desk = ObjectId(), ObjectId()
+        await self.db[INVENTORY_COLLECTION].insert_many([
+            {"_id": self.lamp, "name": "Lamp", "price": 10.0, "quantity": 5, "seller_email": "s@example.com"},
+            {"_id": self.desk, "name": "Desk", "price": 60.0, "quantity": 1, "seller_email": "s@example.com"},
+        ])
+
+    async def asyncTearDown(self):
+        db_utils._async_client = db_utils._async_loop = None
+
+    async def stock(self, product_id) -> int:
+        return (await self.db[INVENTORY_COLLECTION].find_one({"_id": product_id}))["quantity"]
+
+class AddToCartTests(BuyerToolTestCase):
+    async def test_items_are_reserved_or_reported(self):
+        reply = json.loads(await buyer_server.add_to_cart(name="Asha", items=[
+            {"product_id": str(self.lamp), "quantity": 2},
+            {"product_id": str(self.desk), "quantity": 3},
+            {"product_id": "not-an-id", "quantity": 1},
+        ]))
+        statuses = [(entry["index"], entry["status"]) for entry in reply["items"]]
+        self.assertEqual(statuses, [(0, "added"), (1, "insufficient_stock"), (2, "invalid_product_id")])
+        self.assertEqual((await self.stock(self.lamp), await self.stock(self.desk)), (3, 1))
+        holds = await self.db[RESERVATION_COLLECTION].find({}, {"_id": 0, "product_id": 1, "quantity": 1}).to_list()
+        self.assertEqual(holds, [{"product_id": self.lamp, "quantity": 2}])
+
+    async def test_repeated_products_are_merged_and_reported_per_item(self):
+        reply = json.loads(await buyer_server.add_to_cart(name="Asha", items=[
+            {"product_id": str(self.lamp), "quantity": 1},
+            {"product_id": str(self.desk), "quantity": 0},
+            {"product_id": str(self.lamp), "quantity": 2},
+        ]))
+        entries = [(entry["index"], entry["status"], entry.get("requested")) for entry in reply["items"]]
+        self.assertEqual(entries, [(0, "added", 1), (1, "invalid_quantity", None), (2, "added", 2)])
+        self.assertEqual(await self.stock(self.lamp), 2)
+
+class PlaceOrderTests(BuyerToolTestCase):
+    async def test_checkout_charges_the_buyer_and_keeps_reserved_stock(self):
+        await buyer_server.add_to_cart(name="Asha", product_id=str(self.lamp), quantity=3)
+        reply = await buyer_server.place_order(name="Asha")
+        self.assertIn("placed successfully", reply)
+        self.assertEqual(await self.stock(self.lamp), 2)
+        profile = await self.db[PROFILE_COLLECTION].find_one({"name": "Asha"})
+        self.assertEqual(profile["balance"], 70.0)
+        self.assertEqual(await self.db[CART_COLLECTION].count_documents({}), 0)
+        self.assertEqual(await self.db[ORDER_COLLECTION].count_documents({"buyer_email": "asha@example.com"}), 1)
+
+    async def test_failed_checkout_rolls_back(self):
+        await buyer_server.add_to_cart(name="Asha", items=[
+            {"product_id": str(self.lamp), "quantity": 5}, {"product_id": str(self.desk), "quantity": 1},
+        ])
+        reply = await buyer_server.place_order(name="Asha")
+        self.assertTrue(reply.startswith("Insufficient balance"), reply)
+        profile = await self.db[PROFILE_COLLECTION].find_one({"name": "Asha"})
+        self.assertEqual(profile["balance"], 100.0)
+        self.assertEqual(await self.db[CART_COLLECTION].count_documents({}), 2)
+        self.assertEqual(await self.db[ORDER_COLLECTION].count_documents({}), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from memory_store import MemoryClient
+from utils.catalog_sync import CATALOG_TOMBSTONE_RETENTION_SECONDS, _cursor, catalog_changes, prune_tombstones
+from utils.constants import INVENTORY_COLLECTION, INVENTORY_TOMBSTONE_COLLECTION
+from utils.indexes import ensure_indexes
+
+def _ago(**delta) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(**delta)
+
+class CatalogChangesTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = MemoryClient()["test"]
+        await ensure_indexes(self.db)
+        self.product = ObjectId()
+        await self.db[INVENTORY_COLLECTION].insert_one(
+            {"_id": self.product, "name": "Lamp", "price": 10.0, "quantity": 1, "seller_email": "s@example.com",
+             "updated_at": _ago(days=30)}
+        )
+        self.retention = timedelta(seconds=CATALOG_TOMBSTONE_RETENTION_SECONDS)
+
+    async def test_an_old_cursor_survives_when_nothing_was_deleted(self):
+        old = _cursor(_ago(days=60), ObjectId())
+        page = await catalog_changes(self.db, old, 10)
+        self.assertFalse(page["reset"])
+        self.assertEqual([change["product_id"] for change in page["changes"]], [str(self.product)])
+        self.assertFalse(page["has_more"])
+
+    async def test_only_cursors_before_a_pruned_tombstone_reset(self):
+        gone = self.retention + timedelta(days=1)
+        await self.db[INVENTORY_TOMBSTONE_COLLECTION].insert_many([
+            {"_id": ObjectId(), "seller_email": "s@example.com", "updated_at": _ago() - gone},
+            {"_id": ObjectId(), "seller_email": "s@example.com", "updated_at": _ago(days=1)},
+        ])
+        self.assertEqual(await prune_tombstones(self.db), 1)
+        self.assertEqual(await prune_tombstones(self.db), 0)
+
+        before = await catalog_changes(self.db, _cursor(_ago() - gone - timedelta(days=1), ObjectId()), 10)
+        self.assertEqual(before, {"reset": True, "changes": [], "cursor": None, "has_more": False})
+        after = await catalog_changes(self.db, _cursor(_ago() - gone + timedelta(days=1), ObjectId()), 10)
+        self.assertFalse(after["reset"])
+        self.assertEqual(sum(change.get("deleted", False) for change in after["changes"]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+import unittest
+from bson import ObjectId
+from pymongo import AsyncMongoClient, ReturnDocument, UpdateOne, InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from memory_store import MemoryClient
+from utils.constants import CASE_INSENSITIVE_COLLATION
+
+# A replica set (transactions) to run the same cases against, e.g.
+# mongodb://localhost:27017/?replicaSet=rs0; the Server* classes skip without it.
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI")
+
+class MemoryStoreTestCase(unittest.IsolatedAsyncioTestCase):
+    uri = None
+
+    async def asyncSetUp(self):
+        self.client = AsyncMongoClient(self.uri) if self.uri else MemoryClient()
+        self.db = self.client[f"memory_store_test_{ObjectId()}"]
+        self.items = self.db["items"]
+
+    async def asyncTearDown(self):
+        await self.client.drop_database(self.db.name)
+        await self.client.close()
+
+class TransactionTests(MemoryStoreTestCase):
+    async def test_commit_applies_every_write(self):
+        await self.items.insert_one({"_id": 1, "n": 1})
+
+        async def work(session):
+            await self.items.update_one({"_id": 1}, {"$inc": {"n": 1}}, session=session)
+            await self.items.insert_one({"_id": 2, "n": 0}, session=session)
+            return "done"
+
+        async with self.client.start_session() as session:
+            self.assertEqual(await session.with_transaction(work), "done")
+        self.assertEqual(await self.items.find({}, sort=[("_id", 1)]).to_list(), [{"_id": 1, "n": 2}, {"_id": 2, "n": 0}])
+
+    async def test_exception_rolls_back_inserts_updates_and_deletes(self):
+        await self.items.create_index([("k", 1)], unique=True, name="k_unique")
+        await self.items.insert_many([{"_id": 1, "k": "a", "n": 1}, {"_id": 2, "k": "b"}])
+
+        async def work(session):
+            await self.items.update_one({"_id": 1}, {"$set": {"k": "c"}, "$inc": {"n": 5}}, session=session)
+            await self.items.delete_one({"_id": 2}, session=session)
+            await self.items.insert_one({"_id": 3, "k": "b"}, session=session)
+            raise RuntimeError("abort")
+
+        async with self.client.start_session() as session:
+            with self.assertRaises(RuntimeError):
+                await session.with_transaction(work)
+        self.assertEqual(await self.items.find({}, sort=[("_id", 1)]).to_list(),
+                         [{"_id": 1, "k": "a", "n": 1}, {"_id": 2, "k": "b"}])
+        # The unique index was rolled back too: "c" is free again and "b" still taken.
+        await self.items.insert_one({"_id": 4, "k": "c"})
+        with self.assertRaises(DuplicateKeyError):
+            await self.items.insert_one({"_id": 5, "k": "b"})
+
+    async def test_other_operations_never_see_uncommitted_writes(self):
+        await self.items.insert_one({"_id": 1, "n": 0})
+        seen = []
+
+        async def work(session):
+            await self.items.update_one({"_id": 1}, {"$set": {"n": 1}}, session=session)
+            await asyncio.sleep(0.01)
+            await self.items.update_one({"_id": 1}, {"$set": {"n": 2}}, session=session)
+
+        async def read():
+            await asyncio.sleep(0)
+            seen.append((await self.items.find_one({"_id": 1}))["n"])
+
+        async with self.client.start_session() as session:
+            await asyncio.gather(session.with_transaction(work), read())
+        # MemoryClient makes the read wait for the commit; mongod serves it from the snapshot before.
+        self.assertIn(seen, ([0], [2]))
+
+class UpdateTests(MemoryStoreTestCase):
+    async def test_upsert_starts_from_the_filter_and_applies_set_on_insert(self):
+        result = await self.items.update_one(
+            {"seller": "s", "name": "a"}, {"$set": {"price": 1}, "$setOnInsert": {"created": True}}, upsert=True
+        )
+        self.assertIsNotNone(result.upserted_id)
+        doc = await self.items.find_one({"_id": result.upserted_id}, {"_id": 0})
+        self.assertEqual(doc, {"seller": "s", "name": "a", "price": 1, "created": True})
+
+        result = await self.items.update_one(
+            {"seller": "s", "name": "a"}, {"$set": {"price": 2}, "$setOnInsert": {"created": False}}, upsert=True
+        )
+        self.assertEqual((result.matched_count, result.modified_count, result.upserted_id), (1, 1, None))
+        self.assertTrue((await self.items.find_one({"name": "a"}))["created"])
+
+    async def test_replace_one_upsert_and_find_one_and_update(self):
+        await self.items.replace_one({"_id": "x"}, {"v": 1}, upsert=True)
+        await self.items.replace_one({"_id": "x"}, {"v": 2}, upsert=True)
+        self.assertEqual(await self.items.find({}).to_list(), [{"_id": "x", "v": 2}])
+        after = await self.items.find_one_and_update(
+            {"_id": "x", "v": {"$gte": 2}}, {"$inc": {"v": -2}}, return_document=ReturnDocument.AFTER
+        )
+        self.assertEqual(after, {"_id": "x", "v": 0})
+        self.assertIsNone(await self.items.find_one_and_update({"_id": "x", "v": {"$gte": 2}}, {"$inc": {"v": -2}}))
+
+    async def test_pipeline_update_keeps_fields_when_unchanged(self):
+        await self.items.insert_one({"_id": 1, "price": 5, "updated_at": "old"})
+        update = [{"$set": {"updated_at": {"$cond": [{"$eq": ["$price", 5]}, "$updated_at", "new"]}, "price": 5}}]
+        result = await self.items.update_one({"_id": 1}, update)
+        self.assertEqual(result.modified_count, 0)
+        self.assertEqual((await self.items.find_one({"_id": 1}))["updated_at"], "old")
+
+    async def test_bulk_write_reports_errors_by_index(self):
+        await self.items.create_index([("k", 1)], unique=True, name="k_unique")
+        await self.items.insert_one({"_id": 1, "k": "a"})
+        with self.assertRaises(BulkWriteError) as raised:
+            await self.items.bulk_write([
+                InsertOne({"k": "b"}),
+                UpdateOne({"_id": 1}, {"$set": {"k": "b"}}),
+                UpdateOne({"_id": 2}, {"$set": {"k": "c"}}, upsert=True),
+            ], ordered=False)
+        details = raised.exception.details
+        self.assertEqual([error["index"] for error in details["writeErrors"]], [1])
+        self.assertEqual((details["nInserted"], details["nUpserted"]), (1, 1))
+        self.assertEqual(details["upserted"][0]["index"], 2)
+
+class CollationTests(MemoryStoreTestCase):
+    async def test_case_insensitive_queries_with_and_without_an_index(self):
+        await self.items.insert_many([{"name": "Alice", "role": "buyer"}, {"name": "bob", "role": "seller"}])
+        for indexed in (False, True):
+            if indexed:
+                await self.items.create_index([("name", 1), ("role", 1)], name="name_role_ci",
+                                              collation=CASE_INSENSITIVE_COLLATION)
+            found = await self.items.find_one({"name": "ALICE"}, {"_id": 0}, collation=CASE_INSENSITIVE_COLLATION)
+            self.assertEqual(found, {"name": "Alice", "role": "buyer"})
+            self.assertIsNone(await self.items.find_one({"name": "ALICE"}))
+            self.assertEqual(await self.items.count_documents({"name": {"$in": ["BOB", "carol"]}},
+                                                              collation=CASE_INSENSITIVE_COLLATION), 1)
+
+class IndexTests(MemoryStoreTestCase):
+    async def test_indexed_queries_match_a_full_scan(self):
+        rng = random.Random(7)
+        docs = [{"seller": f"s{rng.randrange(5)}", "price": rng.choice([rng.randrange(100), rng.random() * 100, None]),
+                 "day": f"2026-01-{rng.randrange(1, 29):02d}"} for _ in range(500)]
+        await self.items.insert_many(docs)
+        plain = self.db["plain"]
+        await plain.insert_many(docs)
+        await self.items.create_index([("seller", 1), ("price", -1)], name="seller_price")
+        await self.items.create_index([("day", 1)], name="day")
+
+        middle = sorted(doc["_id"] for doc in docs)[250]
+        cases = [
+            ({"seller": "s1"}, [("price", -1), ("_id", -1)], 0),
+            ({"seller": {"$in": ["s2", "s3"]}, "price": {"$gte": 20, "$lt": 60}}, [("price", 1), ("_id", 1)], 0),
+            ({"seller": "s4", "price": {"$gt": 50}}, [("price", -1), ("_id", -1)], 5),
+            ({"_id": {"$gt": middle}}, [("_id", 1)], 51),
+            ({"_id": {"$gt": middle}, "price": {"$lte": 30}}, [("_id", 1)], 10),
+            ({"day": {"$gte": "2026-01-10", "$lte": "2026-01-12"}}, [("day", 1), ("_id", 1)], 0),
+            ({"price": None}, [("_id", 1)], 0),
+        ]
+        for query, sort, limit in cases:
+            with self.subTest(query=query):
+                expected = await plain.find(query, sort=sort, limit=limit).to_list()
+                self.assertEqual(await self.items.find(query, sort=sort, limit=limit).to_list(), expected)
+                self.assertEqual(await self.items.count_documents(query), len(await plain.find(query).to_list()))
+
+    async def test_cursor_iterates_in_batches(self):
+        await self.items.insert_many([{"_id": i} for i in range(10)])
+        cursor = self.items.find({}, sort=[("_id", -1)])
+        self.assertEqual(await cursor.to_list(3), [{"_id": 9}, {"_id": 8}, {"_id": 7}])
+        self.assertEqual([doc["_id"] async for doc in cursor], [6, 5, 4, 3, 2, 1, 0])
+
+@unittest.skipUnless(MONGODB_TEST_URI, "MONGODB_TEST_URI is not set")
+class ServerTransactionTests(TransactionTests):
+    uri = MONGODB_TEST_URI
+
+@unittest.skipUnless(MONGODB_TEST_URI, "MONGODB_TEST_URI is not set")
+class ServerUpdateTests(UpdateTests):
+    uri = MONGODB_TEST_URI
+
+@unittest.skipUnless(MONGODB_TEST_URI, "MONGODB_TEST_URI is not set")
+class ServerCollationTests(CollationTests):
+    uri = MONGODB_TEST_URI
+
+@unittest.skipUnless(MONGODB_TEST_URI, "MONGODB_TEST_URI is not set")
+class ServerIndexTests(IndexTests):
+    uri = MONGODB_TEST_URI
+
+if __name__ == "__main__":
+    unittest.main()
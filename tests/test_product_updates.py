@@ -0,0 +1,25 @@
+import unittest
+from utils.product_updates import parse_changes
+
+class ParseChangesTests(unittest.TestCase):
+    def test_relative_changes_need_an_explicit_operator(self):
+        decrement = ({"$inc": {"quantity": -5}}, {"quantity": {"$gte": 5}})
+        self.assertEqual(parse_changes({"quantity": "-= 5"}), decrement)
+        self.assertEqual(parse_changes({"quantity": "quantity - 5"}), decrement)
+        self.assertEqual(parse_changes({"quantity": {"$inc": -5}}), decrement)
+        self.assertEqual(parse_changes({"price": {"$mul": 0.9}}), ({"$mul": {"price": 0.9}}, {}))
+        self.assertEqual(parse_changes({"price": "price * 0.9"}), ({"$mul": {"price": 0.9}}, {}))
+
+    def test_signed_values_without_an_operator_are_rejected(self):
+        for value in ("-5", "+5", "*2", -5):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_changes({"quantity": value})
+        self.assertEqual(parse_changes({"quantity": "5"}), ({"$set": {"quantity": 5}}, {}))
+
+    def test_operator_documents_are_checked(self):
+        for value in ({"$set": 1}, {"$inc": 1, "$mul": 2}, {"$inc": "1"}, {"$inc": 1.5}, {"$mul": -1}):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_changes({"quantity": value})
+
+if __name__ == "__main__":
+    unittest.main()
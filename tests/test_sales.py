@@ -0,0 +1,53 @@
+import asyncio
+import os
+import unittest
+from datetime import datetime, timezone
+from bson import ObjectId
+from memory_store import MemoryClient
+from utils import db_utils, sales
+from utils.constants import INVENTORY_COLLECTION, ORDER_COLLECTION, SALES_ROLLUP_COLLECTION
+
+def _line_id(second: int) -> ObjectId:
+    """An ObjectId minted `second` seconds into 2024-01-01, as a legacy checkout line would be."""
+    stamp = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()) + second
+    return ObjectId(stamp.to_bytes(4, "big") + os.urandom(8))
+
+class BackfillTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        db_utils._async_client = MemoryClient()
+        db_utils._async_loop = asyncio.get_running_loop()
+        self.db = db_utils.get_async_db()
+
+    async def asyncTearDown(self):
+        db_utils._async_client = db_utils._async_loop = None
+
+    async def test_legacy_lines_of_one_checkout_count_as_one_order(self):
+        await self.db[INVENTORY_COLLECTION].insert_many([
+            {"name": name, "seller_email": "s@example.com"} for name in ("Lamp", "Desk", "Chair")
+        ])
+
+        def line(second, buyer, name, price):
+            return {"_id": _line_id(second), "buyer_email": buyer, "prod_name": name, "quantity": 1, "total_price": price}
+
+        await self.db[ORDER_COLLECTION].insert_many([
+            # a's first checkout, interleaved with b's, and a's second one a minute later.
+            line(0, "a", "Lamp", 10), line(0, "b", "Lamp", 10), line(1, "a", "Desk", 60), line(2, "a", "Chair", 30),
+            line(60, "a", "Lamp", 10),
+        ])
+        batch, sales.SALES_BACKFILL_BATCH = sales.SALES_BACKFILL_BATCH, 2
+        try:
+            await sales.backfill_sales_rollups()
+        finally:
+            sales.SALES_BACKFILL_BATCH = batch
+
+        rollups = self.db[SALES_ROLLUP_COLLECTION]
+        seller = await rollups.find_one({"seller_email": "s@example.com", "scope": sales.SELLER})
+        self.assertEqual((seller["revenue"], seller["units"], seller["orders"]), (120, 5, 3))
+        day = await rollups.find_one({"seller_email": "s@example.com", "scope": sales.DAY, "day": "2024-01-01"})
+        self.assertEqual(day["orders"], 3)
+        lamp = await rollups.find_one({"seller_email": "s@example.com", "scope": sales.PRODUCT, "name": "Lamp"})
+        self.assertEqual((lamp["units"], lamp["orders"]), (3, 3))
+        self.assertEqual(await self.db[ORDER_COLLECTION].count_documents({"rolled_up": True}), 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+
+def _limits(spec: str) -> dict:
+    """Parses "tool=n,tool=n" into {tool: n}."""
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tool, limit = item.split("=", 1)
+            limits[tool.strip()] = int(limit)
+    return limits
+
+# Calls admitted at once across all tools of the process; sized to the Mongo
+# pool so queued calls wait here instead of for a connection.
+MAX_CONCURRENT_TOOL_CALLS = int(os.getenv("MAX_CONCURRENT_TOOL_CALLS", os.getenv("MONGO_MAX_POOL_SIZE", "50")))
+# Per-tool caps for the heavy writers. Listed tools queue behind cheap reads for
+# the shared slots; unlisted tools have no cap of their own.
+TOOL_CONCURRENCY = _limits(os.getenv(
+    "TOOL_CONCURRENCY",
+    "place_order=8,add_to_cart=16,add_multiple_products=4,import_products=2,bulk_update_products=4"
+))
+# Calls one user (session token, name or email) may have admitted at once.
+USER_CONCURRENCY = int(os.getenv("USER_CONCURRENCY", "4"))
+# Calls that may wait for each limit before new ones are turned away.
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+# Longest a call waits for admission in total.
+ADMISSION_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_TIMEOUT_SECONDS", "10"))
+
+# Admin and observability tools stay available under overload.
+EXEMPT_TOOLS = {"server_stats"}
+# Arguments that identify the calling user, most specific first.
+USER_ARGUMENTS = ("session_token", "seller_email", "name", "buyer_name", "seller_name", "email")
+
+READ = 0
+WRITE = 1
+
+class Overloaded(Exception):
+    """Raised when a call is turned away or waited too long for admission."""
+
+class Limiter:
+    """
+    Counting semaphore with a bounded wait queue. Waiters are served by
+    priority and then in arrival order; a freed slot is handed straight to the
+    next waiter, so a newcomer can never overtake the queue.
+    """
+
+    def __init__(self, name: str, capacity: int, queue_size: int):
+        self.name = name
+        self.capacity = capacity
+        self.queue_size = queue_size
+        self.in_use = 0
+        self._waiters = []
+        self._order = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return self.in_use == 0 and not self._waiters
+
+    async def acquire(self, priority: int, deadline: float):
+        if self.in_use < self.capacity and not self._waiters:
+            self.in_use += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise Overloaded(f"{self.name} is at capacity ({self.in_use} running, {len(self._waiters)} waiting)")
+        waiter = [priority, next(self._order), asyncio.get_running_loop().create_future()]
+        heapq.heappush(self._waiters, waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[2]), max(0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter[2].done() and not waiter[2].cancelled():
+                # The slot arrived as the wait ended; pass it on.
+                self.release()
+            else:
+                waiter[2].cancel()
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise Overloaded(f"timed out waiting for {self.name}")
+        self.admitted += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+class AdmissionControl:
+    """
+    Admits tool calls through up to three limits, always taken in this order:
+    the caller's per-user limit, the tool's own limit if it has one, and the
+    process-wide limit. Tools with their own limit count as heavy writes and
+    wait behind reads for process-wide slots. One deadline covers all three.
+    """
+
+    def __init__(self, max_concurrent: int, tool_limits: dict, user_limit: int, queue_size: int, timeout: float):
+        self.user_limit = user_limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.shared = Limiter("the server", max_concurrent, queue_size)
+        self.tools = {tool: Limiter(tool, limit, queue_size) for tool, limit in tool_limits.items()}
+        self._users = {}
+        self.user_rejected = 0
+        self.user_timed_out = 0
+
+    def _user_limiter(self, user: str) -> Limiter:
+        limiter = self._users.get(user)
+        if limiter is None:
+            limiter = self._users[user] = Limiter("your request limit", self.user_limit, self.queue_size)
+        return limiter
+
+    def _drop_if_idle(self, user: str, limiter: Limiter):
+        # Per-user limiters only live while the user has calls running or waiting.
+        if limiter.idle and self._users.get(user) is limiter:
+            self.user_rejected += limiter.rejected
+            self.user_timed_out += limiter.timed_out
+            del self._users[user]
+
+    def _release_user(self, user: str, limiter: Limiter):
+        limiter.release()
+        self._drop_if_idle(user, limiter)
+
+    @asynccontextmanager
+    async def admit(self, tool: str, arguments: dict):
+        if tool in EXEMPT_TOOLS:
+            yield
+            return
+        deadline = time.monotonic() + self.timeout
+        tool_limiter = self.tools.get(tool)
+        priority = WRITE if tool_limiter is not None else READ
+        user = next((f"{key}:{arguments[key]}".strip() for key in USER_ARGUMENTS if arguments.get(key)), None)
+        if user is not None and not user.startswith("session_token:"):
+            user = user.lower()
+
+        taken = []
+        try:
+            if user is not None and self.user_limit > 0:
+                user_limiter = self._user_limiter(user)
+                try:
+                    await user_limiter.acquire(priority, deadline)
+                except BaseException:
+                    self._drop_if_idle(user, user_limiter)
+                    raise
+                taken.append(functools.partial(self._release_user, user, user_limiter))
+            for limiter in (tool_limiter, self.shared):
+                if limiter is not None:
+                    await limiter.acquire(priority, deadline)
+                    taken.append(limiter.release)
+        except Overloaded as e:
+            for release in reversed(taken):
+                release()
+            raise Overloaded(f"Server busy: {e}. Please retry {tool} shortly.")
+        except BaseException:
+            for release in reversed(taken):
+                release()
+            raise
+        try:
+            yield
+        finally:
+            for release in reversed(taken):
+                release()
+
+    def stats(self) -> dict:
+        users = list(self._users.values())
+        return {
+            "shared": self.shared.stats(),
+            "tools": {tool: limiter.stats() for tool, limiter in sorted(self.tools.items())},
+            "users": {
+                "limit": self.user_limit,
+                "active": len(users),
+                "waiting": sum(limiter.waiting for limiter in users),
+                "rejected": self.user_rejected + sum(limiter.rejected for limiter in users),
+                "timed_out": self.user_timed_out + sum(limiter.timed_out for limiter in users),
+            },
+        }
+
+admission = AdmissionControl(
+    MAX_CONCURRENT_TOOL_CALLS, TOOL_CONCURRENCY, USER_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_TIMEOUT_SECONDS
+)
@@ -0,0 +1,89 @@
+import logging
+from datetime import datetime, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from .db_utils import get_async_db
+from .constants import CART_COLLECTION, PROFILE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# One document per (buyer_email, product_id); the unique index makes every
+# cart write a single indexed upsert or delete.
+CART_LINE_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "quantity": 1, "seller_email": 1}
+
+async def add_lines(db, buyer_email: str, taken, session=None):
+    """
+    Adds (product, quantity) pairs to the buyer's cart. A product already in the
+    cart has its quantity increased and its name, price and seller refreshed.
+    """
+    now = datetime.now(timezone.utc)
+    await db[CART_COLLECTION].bulk_write([
+        UpdateOne(
+            {"buyer_email": buyer_email, "product_id": product["_id"]},
+            {
+                "$inc": {"quantity": quantity},
+                "$set": {"name": product["name"], "price": product["price"], "seller_email": product["seller_email"]},
+                "$setOnInsert": {"added_at": now},
+            },
+            upsert=True
+        )
+        for product, quantity in taken
+    ], ordered=False, session=session)
+
+async def remove_line(db, buyer_email: str, product_id) -> bool:
+    result = await db[CART_COLLECTION].delete_one({"buyer_email": buyer_email, "product_id": product_id})
+    return result.deleted_count > 0
+
+async def cart_lines(db, buyer_email: str, session=None) -> list:
+    return await db[CART_COLLECTION].find(
+        {"buyer_email": buyer_email},
+        CART_LINE_PROJECTION,
+        sort=[("added_at", 1)],
+        session=session
+    ).to_list()
+
+async def clear_cart(db, buyer_email: str, session=None):
+    await db[CART_COLLECTION].delete_many({"buyer_email": buyer_email}, session=session)
+
+async def migrate_embedded_carts():
+    """
+    Moves carts still embedded in profile documents into the cart collection,
+    merging repeated products, and unsets the profile field. Quantities are set
+    rather than incremented, so a migration interrupted between the two writes
+    can simply run again; it runs as a startup hook.
+    """
+    db = get_async_db()
+    profiles = db[PROFILE_COLLECTION]
+    moved = 0
+    async for profile in profiles.find({"cart": {"$exists": True}}, {"email": 1, "cart": 1}):
+        email = profile.get("email", "").lower()
+        lines = {}
+        for item in profile.get("cart") or []:
+            try:
+                product_id = ObjectId(item["product_id"])
+            except (InvalidId, KeyError, TypeError):
+                logger.warning("Dropping malformed cart item %r of %s", item, email)
+                continue
+            line = lines.setdefault(product_id, {"quantity": 0})
+            line.update(name=item.get("name"), price=item.get("price", 0), seller_email=item.get("seller_email"))
+            line["quantity"] += item.get("quantity", 0)
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"buyer_email": email, "product_id": product_id},
+                {"$set": line, "$setOnInsert": {"added_at": now}},
+                upsert=True
+            )
+            for product_id, line in lines.items()
+        ]
+        try:
+            if ops:
+                await db[CART_COLLECTION].bulk_write(ops, ordered=False)
+            await profiles.update_one({"_id": profile["_id"]}, {"$unset": {"cart": ""}})
+            moved += 1
+        except PyMongoError as e:
+            logger.warning("Could not migrate the cart of %s: %s", email, e)
+    if moved:
+        logger.info("Moved %d embedded carts into the %s collection", moved, CART_COLLECTION)
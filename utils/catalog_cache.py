@@ -0,0 +1,87 @@
+import os
+from collections import OrderedDict
+from .inventory_events import add_listener
+from .metrics import tool_metrics
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "10000"))
+
+class CatalogCache:
+    """
+    Bounded LRU of inventory documents keyed by product _id, filled on read.
+    Only touched from the event loop, so it needs no locking.
+
+    Readers take `generation` before querying and pass it back when filling; a
+    fill is dropped if any change was applied in between, so a slow read can
+    never overwrite a newer change-stream update.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._docs = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _store(self, doc: dict):
+        self._docs[doc["_id"]] = doc
+        self._docs.move_to_end(doc["_id"])
+        while len(self._docs) > self.max_size:
+            self._docs.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, product_id):
+        doc = self._docs.get(product_id)
+        if doc is None:
+            self.misses += 1
+            return None
+        self._docs.move_to_end(product_id)
+        self.hits += 1
+        return doc
+
+    def fill(self, doc: dict, generation: int):
+        """Caches a document read from the database."""
+        if generation == self.generation:
+            self._store(doc)
+
+    def put(self, doc: dict):
+        """Applies a known-current version of a product."""
+        self.generation += 1
+        self._store(doc)
+
+    def invalidate(self, product_id):
+        """Drops a product that changed or was deleted."""
+        self.generation += 1
+        self._docs.pop(product_id, None)
+        self.invalidations += 1
+
+    def apply_change(self, change: dict):
+        """Applies an inventory change-stream event."""
+        if change["operationType"] in ("insert", "update", "replace") and change.get("fullDocument") is not None:
+            self.put(change["fullDocument"])
+        elif "documentKey" in change:
+            self.invalidate(change["documentKey"]["_id"])
+        else:
+            # drop, rename or invalidate: the collection itself changed.
+            self.clear()
+
+    def clear(self):
+        self.generation += 1
+        self._docs.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._docs),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE)
+add_listener(catalog_cache.apply_change, catalog_cache.clear)
+tool_metrics.add_cache("catalog", catalog_cache.stats)
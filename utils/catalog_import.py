@@ -0,0 +1,193 @@
+import csv
+import json
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .constants import INVENTORY_COLLECTION
+
+IMPORT_FORMATS = ("jsonl", "csv")
+# Rows per unordered bulk_write; also the most pending rows held in memory.
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Directory that path imports may read from; path imports are off when unset.
+CATALOG_IMPORT_DIR = os.getenv("CATALOG_IMPORT_DIR")
+# Chunked imports left without a new chunk for this long are discarded.
+IMPORT_IDLE_SECONDS = int(os.getenv("IMPORT_IDLE_SECONDS", "3600"))
+MAX_REPORTED_ERRORS = 100
+
+def _product_fields(row) -> tuple:
+    """Validates one row; returns (name, price, quantity) or raises ValueError."""
+    if not isinstance(row, dict):
+        raise ValueError("row is not an object")
+    name = row.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("name is missing")
+    try:
+        price = float(row.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError(f"price {row.get('price')!r} is not a number")
+    try:
+        quantity = int(row.get("quantity"))
+    except (TypeError, ValueError):
+        raise ValueError(f"quantity {row.get('quantity')!r} is not an integer")
+    if price < 0 or quantity < 0:
+        raise ValueError("price and quantity must not be negative")
+    return name.strip(), price, quantity
+
+class ProductImport:
+    """
+    Streams JSONL or CSV rows into a seller's inventory. Rows are validated as
+    they arrive and written as upserts on (seller_email, name) in unordered
+    chunks of IMPORT_CHUNK_SIZE, so memory stays bounded whatever the input
+    size and one bad row never aborts the rest.
+
+    CSV input needs a header row naming name, price and quantity; quoted
+    fields may not contain line breaks.
+    """
+
+    def __init__(self, db, seller_email: str, fmt: str):
+        self.db = db
+        self.seller_email = seller_email
+        self.format = fmt
+        self.last_used = time.monotonic()
+        self.line = 0
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.invalid = 0
+        self.failed = 0
+        self.errors = []
+        self._pending = []
+        self._header = None
+        self._partial = ""
+
+    def _error(self, line: int, message: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def _parse(self, text: str):
+        if self.format == "jsonl":
+            try:
+                return json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"invalid JSON: {e}")
+        values = next(csv.reader([text]))
+        if self._header is None:
+            self._header = [column.strip().lower() for column in values]
+            return None
+        if len(values) != len(self._header):
+            raise ValueError(f"expected {len(self._header)} columns, got {len(values)}")
+        return dict(zip(self._header, values))
+
+    async def feed_line(self, text: str):
+        self.line += 1
+        if not text.strip():
+            return
+        try:
+            row = self._parse(text)
+            if row is None:
+                return
+            self.rows += 1
+            name, price, quantity = _product_fields(row)
+        except ValueError as e:
+            self.invalid += 1
+            self._error(self.line, str(e))
+            return
+        # A pipeline update, so updated_at only moves when price or quantity
+        # actually change and re-importing an unchanged file stays a no-op.
+        unchanged = {"$and": [{"$eq": ["$price", price]}, {"$eq": ["$quantity", quantity]}]}
+        self._pending.append((self.line, UpdateOne(
+            {"seller_email": self.seller_email, "name": name},
+            [{"$set": {
+                "updated_at": {"$cond": [unchanged, "$updated_at", datetime.now(timezone.utc)]},
+                "price": price,
+                "quantity": quantity,
+            }}],
+            upsert=True
+        )))
+        if len(self._pending) >= IMPORT_CHUNK_SIZE:
+            await self.flush()
+
+    async def feed(self, data: str):
+        """Feeds a piece of the input; a trailing partial line is kept for the next piece."""
+        self.last_used = time.monotonic()
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+        for text in lines:
+            await self.feed_line(text.rstrip("\r"))
+
+    async def finish(self) -> dict:
+        if self._partial:
+            await self.feed_line(self._partial.rstrip("\r"))
+            self._partial = ""
+        await self.flush()
+        return self.summary()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            result = await self.db[INVENTORY_COLLECTION].bulk_write([op for _, op in pending], ordered=False)
+            upserted, matched, modified = result.upserted_count, result.matched_count, result.modified_count
+        except BulkWriteError as e:
+            details = e.details
+            upserted, matched, modified = details["nUpserted"], details["nMatched"], details["nModified"]
+            for error in details["writeErrors"]:
+                self.failed += 1
+                self._error(pending[error["index"]][0], error.get("errmsg", "write failed"))
+        self.inserted += upserted
+        self.updated += modified
+        self.unchanged += matched - modified
+
+    def summary(self) -> dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.invalid + self.failed > len(self.errors),
+        }
+
+async def import_file(db, seller_email: str, path: str, fmt: str) -> dict:
+    """Imports a file from CATALOG_IMPORT_DIR line by line."""
+    job = ProductImport(db, seller_email, fmt)
+    with open(path, encoding="utf-8", newline="") as source:
+        for text in source:
+            await job.feed_line(text.rstrip("\r\n"))
+    return await job.finish()
+
+def resolve_import_path(path: str) -> str:
+    """Returns the absolute path if it lies inside CATALOG_IMPORT_DIR, else raises ValueError."""
+    if not CATALOG_IMPORT_DIR:
+        raise ValueError("Path imports are disabled on this server; send the file as data chunks instead.")
+    root = os.path.realpath(CATALOG_IMPORT_DIR)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError("Path must be inside the server's import directory.")
+    if not os.path.isfile(full):
+        raise ValueError(f"No such file: {path}")
+    return full
+
+_imports = {}
+
+def start_import(db, seller_email: str, fmt: str) -> tuple:
+    """Registers a chunked import; returns (import_id, job)."""
+    now = time.monotonic()
+    for import_id in [i for i, job in _imports.items() if now - job.last_used > IMPORT_IDLE_SECONDS]:
+        del _imports[import_id]
+    import_id = secrets.token_urlsafe(12)
+    job = _imports[import_id] = ProductImport(db, seller_email, fmt)
+    return import_id, job
+
+def get_import(import_id: str):
+    return _imports.get(import_id)
+
+def end_import(import_id: str):
+    _imports.pop(import_id, None)
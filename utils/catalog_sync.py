@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+from .db_utils import get_async_db
+from .constants import INVENTORY_COLLECTION, INVENTORY_TOMBSTONE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Every inventory write sets updated_at; deleting a product leaves a tombstone
+# with the same _id. catalog_changes walks both in (updated_at, _id) order.
+#
+# updated_at comes from the writing process's clock, and a write may become
+# visible after later-stamped ones. Changes are therefore only handed out once
+# they are CATALOG_SYNC_LAG_SECONDS old, which must cover clock skew between
+# the services plus the longest inventory write.
+CATALOG_SYNC_LAG_SECONDS = float(os.getenv("CATALOG_SYNC_LAG_SECONDS", "5"))
+# How long tombstones are kept, and how often older ones are removed. A cursor
+# from before a removed tombstone has to start over.
+CATALOG_TOMBSTONE_RETENTION_SECONDS = int(os.getenv("CATALOG_TOMBSTONE_RETENTION_SECONDS", str(7 * 86400)))
+CATALOG_TOMBSTONE_PRUNE_INTERVAL = int(os.getenv("CATALOG_TOMBSTONE_PRUNE_INTERVAL", "3600"))
+# Kept among the tombstones: expired_through is the newest updated_at pruned so far.
+_WATERMARK = {"_id": "retention_watermark"}
+
+CHANGE_PROJECTION = {"name": 1, "price": 1, "quantity": 1, "seller_email": 1, "updated_at": 1}
+
+def stamp() -> datetime:
+    """The updated_at for an inventory write made now."""
+    return datetime.now(timezone.utc)
+
+async def delete_with_tombstone(db, product_id) -> bool:
+    """Deletes a product and records its tombstone in one transaction. Returns False if it didn't exist."""
+    async def delete(session):
+        product = await db[INVENTORY_COLLECTION].find_one_and_delete(
+            {"_id": product_id}, projection={"seller_email": 1}, session=session
+        )
+        if product is None:
+            return False
+        await db[INVENTORY_TOMBSTONE_COLLECTION].replace_one(
+            {"_id": product_id},
+            {"seller_email": product.get("seller_email"), "updated_at": stamp()},
+            upsert=True,
+            session=session
+        )
+        return True
+
+    async with db.client.start_session() as session:
+        return await session.with_transaction(delete)
+
+async def stamp_unversioned_products():
+    """
+    Gives products written before updated_at existed a version, so the change
+    feed includes them. Runs as a startup hook; the (updated_at, _id) index
+    makes it a short index scan once nothing is left to stamp.
+    """
+    result = await get_async_db()[INVENTORY_COLLECTION].update_many(
+        {"updated_at": None}, {"$set": {"updated_at": stamp()}}
+    )
+    if result.modified_count:
+        logger.info("Stamped updated_at on %d products", result.modified_count)
+
+async def prune_tombstones(db=None) -> int:
+    """
+    Removes tombstones older than CATALOG_TOMBSTONE_RETENTION_SECONDS. The
+    watermark is raised to the newest of them before they go, so catalog_changes
+    resets exactly the cursors that could have missed one, and a catalog with no
+    deletions never resets anyone. Returns the number of tombstones removed.
+    """
+    db = get_async_db() if db is None else db
+    tombstones = db[INVENTORY_TOMBSTONE_COLLECTION]
+    cutoff = stamp() - timedelta(seconds=CATALOG_TOMBSTONE_RETENTION_SECONDS)
+    newest = await tombstones.find_one(
+        {"updated_at": {"$lt": cutoff}}, {"updated_at": 1}, sort=[("updated_at", -1), ("_id", -1)]
+    )
+    if newest is None:
+        return 0
+    await tombstones.update_one(_WATERMARK, {"$max": {"expired_through": newest["updated_at"]}}, upsert=True)
+    result = await tombstones.delete_many({"updated_at": {"$lte": newest["updated_at"]}})
+    return result.deleted_count
+
+async def _prune_forever(interval: int):
+    while True:
+        try:
+            pruned = await prune_tombstones()
+            if pruned:
+                logger.info("Pruned %d catalog tombstone(s)", pruned)
+        except PyMongoError as e:
+            logger.warning("Tombstone pruning failed: %s", e)
+        await asyncio.sleep(interval)
+
+_pruners = {}
+
+async def start_tombstone_pruner(interval: int = CATALOG_TOMBSTONE_PRUNE_INTERVAL):
+    """Starts the background task that removes expired tombstones, once per event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _pruners:
+        _pruners[loop] = loop.create_task(_prune_forever(interval))
+
+# Sorts after every real _id, so a cursor at the horizon covers all changes stamped up to it.
+_LAST_ID = ObjectId("f" * 24)
+
+def _cursor(updated_at: datetime, oid) -> str:
+    updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return f"{int(updated_at.timestamp() * 1000)}-{oid}"
+
+def _parse_cursor(cursor: str) -> tuple:
+    try:
+        millis, oid = cursor.split("-", 1)
+        return datetime.fromtimestamp(int(millis) / 1000, timezone.utc), ObjectId(oid)
+    except (ValueError, InvalidId):
+        raise ValueError("Invalid cursor.")
+
+def _change(doc: dict, deleted: bool) -> dict:
+    change = {"product_id": str(doc["_id"])}
+    if deleted:
+        change.update(deleted=True, seller_email=doc.get("seller_email"))
+    else:
+        change.update(
+            name=doc.get("name"),
+            price=doc.get("price"),
+            quantity=doc.get("quantity"),
+            seller_email=doc.get("seller_email")
+        )
+    change["updated_at"] = doc["updated_at"]
+    return change
+
+async def catalog_changes(db, since: str | None, limit: int) -> dict:
+    """
+    Products written or deleted after the `since` cursor, oldest first, at most
+    `limit` of them, with the cursor to pass next time. Without a cursor the
+    feed starts from the beginning, so paging through it is a full sync.
+    """
+    now = datetime.now(timezone.utc)
+    horizon = now - timedelta(seconds=CATALOG_SYNC_LAG_SECONDS)
+    query = {"updated_at": {"$lte": horizon}}
+    if since:
+        updated_at, oid = _parse_cursor(since)
+        watermark = await db[INVENTORY_TOMBSTONE_COLLECTION].find_one(_WATERMARK)
+        if watermark and updated_at <= watermark["expired_through"].replace(tzinfo=timezone.utc):
+            # A deletion after the cursor may have lost its tombstone.
+            return {"reset": True, "changes": [], "cursor": None, "has_more": False}
+        query["$or"] = [
+            {"updated_at": {"$gt": updated_at}},
+            {"updated_at": updated_at, "_id": {"$gt": oid}},
+        ]
+
+    sort = [("updated_at", 1), ("_id", 1)]
+    products = await db[INVENTORY_COLLECTION].find(query, CHANGE_PROJECTION, sort=sort, limit=limit + 1).to_list()
+    tombstones = await db[INVENTORY_TOMBSTONE_COLLECTION].find(query, sort=sort, limit=limit + 1).to_list()
+    docs = sorted(
+        [(doc, False) for doc in products] + [(doc, True) for doc in tombstones],
+        key=lambda entry: (entry[0]["updated_at"], entry[0]["_id"])
+    )
+    page = docs[:limit]
+    has_more = len(docs) > limit
+    if has_more:
+        cursor = _cursor(page[-1][0]["updated_at"], page[-1][0]["_id"])
+    else:
+        # Everything up to the horizon has been handed out, so a quiet catalog
+        # still moves the cursor forward and never ages into a reset.
+        cursor = _cursor(horizon, _LAST_ID)
+    return {
+        "reset": False,
+        "changes": [_change(doc, deleted) for doc, deleted in page],
+        "cursor": cursor,
+        "has_more": has_more,
+    }
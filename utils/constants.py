@@ -1,5 +1,18 @@
 DEFAULT_DATABASE = "superstore"
 PROFILE_COLLECTION = "profile"
 INVENTORY_COLLECTION = "inventory"
+INVENTORY_TOMBSTONE_COLLECTION = "inventory_tombstone"
 ORDER_COLLECTION = "order"
-PAYMENT_COLLECTION = "payment"
\ No newline at end of file
+PAYMENT_COLLECTION = "payment"
+RESERVATION_COLLECTION = "reservation"
+SESSION_COLLECTION = "session"
+CART_COLLECTION = "cart"
+SALES_ROLLUP_COLLECTION = "sales_rollup"
+
+# Profile roles; sessions carry the role they were issued for.
+BUYER_ROLE = "buyer"
+SELLER_ROLE = "seller"
+
+# Case-insensitive comparison for identity fields; queries must pass the same
+# collation as the index for the index to be used.
+CASE_INSENSITIVE_COLLATION = {"locale": "en", "strength": 2}
@@ -1,19 +1,106 @@
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import AsyncMongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError
+import asyncio
 import os
+import pymongo
 from dotenv import load_dotenv
+from .constants import DEFAULT_DATABASE
+from .health import mongo_breaker, TopologyHealthListener, MONGO_HEALTH_INTERVAL, MONGO_RECOVERY_INTERVAL, MONGO_PROBE_TIMEOUT
+from .metrics import MONGO_LISTENERS
 
 load_dotenv()
 
 MONGODB_USER = os.getenv("MONGODB_USER")
 MONGODB_PASS = os.getenv("MONGODB_PASS")
 MONGODB_CLUSTER = os.getenv("MONGODB_CLUSTER")
-MONGODB_URI = f"mongodb+srv://{MONGODB_USER}:{MONGODB_PASS}@{MONGODB_CLUSTER}/"
+# MONGODB_URI points the services at any other deployment, e.g. a local mongod.
+MONGODB_URI = os.getenv("MONGODB_URI") or f"mongodb+srv://{MONGODB_USER}:{MONGODB_PASS}@{MONGODB_CLUSTER}/"
+MONGODB_DATABASE = os.getenv("MONGODB_DATABASE", DEFAULT_DATABASE)
 
-def get_mongo_client():
+# Connection pool tuning, overridable per deployment.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WARMUP = os.getenv("MONGO_WARMUP", "true").strip().lower() in ("1", "true", "yes")
+# Connections opened concurrently by warm_up, so the first requests find them
+# with DNS, TLS and authentication already done.
+MONGO_WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS", str(min(4, MONGO_MAX_POOL_SIZE))))
+
+_async_client = None
+_async_loop = None
+
+def _client_options():
+    return {
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "event_listeners": [*MONGO_LISTENERS, TopologyHealthListener(mongo_breaker)],
+    }
+
+def get_async_client():
+    """
+    Returns the AsyncMongoClient shared by every tool on the running event loop.
+    An AsyncMongoClient is tied to the loop it first ran on, so a different loop
+    gets a client of its own.
+
+    Raises DatabaseUnavailable at once while the circuit breaker is open, rather
+    than letting every query wait out server selection.
+    """
+    mongo_breaker.check()
+    return _loop_client()
+
+def _loop_client():
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        _async_client = AsyncMongoClient(MONGODB_URI, **_client_options())
+        _async_loop = loop
+    return _async_client
+
+def get_async_db():
+    """Returns the default database on the shared async client."""
+    return get_async_client()[MONGODB_DATABASE]
+
+async def warm_up():
+    """
+    Opens MONGO_WARMUP_CONNECTIONS pooled connections ahead of the first tool
+    call when MONGO_WARMUP is set. Concurrent pings each check out a connection
+    of their own, so the pool ends up holding that many.
+    """
+    if not MONGO_WARMUP:
+        return
+    admin = get_async_client().admin
     try:
-        client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        return client
+        await asyncio.gather(*(admin.command('ping') for _ in range(max(1, MONGO_WARMUP_CONNECTIONS))))
     except ConnectionFailure as e:
-        raise Exception(f"MongoDB connection failed: {str(e)}")
\ No newline at end of file
+        mongo_breaker.trip(e)
+        raise Exception(f"MongoDB connection failed: {str(e)}")
+
+async def _probe() -> bool:
+    try:
+        with pymongo.timeout(MONGO_PROBE_TIMEOUT):
+            await _loop_client().admin.command('ping')
+    except PyMongoError as e:
+        mongo_breaker.record_failure(e)
+        return False
+    mongo_breaker.record_success()
+    return True
+
+async def _monitor_forever():
+    while True:
+        await asyncio.sleep(MONGO_RECOVERY_INTERVAL if mongo_breaker.is_open else MONGO_HEALTH_INTERVAL)
+        await _probe()
+
+_monitors = {}
+
+async def start_health_monitor():
+    """
+    Starts the background task that pings MongoDB and drives the circuit
+    breaker, once per event loop. It probes every MONGO_HEALTH_INTERVAL seconds,
+    and every MONGO_RECOVERY_INTERVAL seconds while the breaker is open.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _monitors:
+        _monitors[loop] = loop.create_task(_monitor_forever())
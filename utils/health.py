@@ -0,0 +1,120 @@
+import logging
+import os
+import time
+from pymongo import monitoring
+from pymongo.errors import ConnectionFailure
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failed health probes that open the breaker.
+MONGO_BREAKER_FAILURES = int(os.getenv("MONGO_BREAKER_FAILURES", "2"))
+# Seconds between health probes while the database is reachable, and while it isn't.
+MONGO_HEALTH_INTERVAL = float(os.getenv("MONGO_HEALTH_INTERVAL", "10"))
+MONGO_RECOVERY_INTERVAL = float(os.getenv("MONGO_RECOVERY_INTERVAL", "2"))
+# Deadline of one probe; well below serverSelectionTimeoutMS so an outage is noticed quickly.
+MONGO_PROBE_TIMEOUT = float(os.getenv("MONGO_PROBE_TIMEOUT", "2"))
+
+CLOSED = "closed"
+OPEN = "open"
+
+class DatabaseUnavailable(ConnectionFailure):
+    """
+    Raised instead of waiting for server selection while the breaker is open.
+    A ConnectionFailure, so the existing handlers of background jobs treat it
+    like any other outage.
+    """
+
+def _describe(error) -> str:
+    # Server selection errors append timeouts and the whole topology description.
+    text = str(error).split(" (configured timeouts")[0].split(", Timeout:")[0]
+    return text[:200] or type(error).__name__
+
+class CircuitBreaker:
+    """
+    Tracks whether MongoDB is reachable. It opens after MONGO_BREAKER_FAILURES
+    failed probes in a row, or at once when the driver can reach no server at
+    all, and closes on the first successful probe or when the driver reaches a
+    server again. Touched from the event loop and from driver monitor
+    threads; each update is a single assignment, so it needs no locking.
+    """
+
+    def __init__(self, failure_threshold: int):
+        self.failure_threshold = failure_threshold
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.times_opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def check(self):
+        """Raises DatabaseUnavailable while the breaker is open."""
+        if self.state == OPEN:
+            down_for = int(time.monotonic() - self.opened_at)
+            raise DatabaseUnavailable(
+                f"The database has been unreachable for {down_for}s ({self.last_error}). "
+                "Requests fail immediately until it recovers; please retry shortly."
+            )
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state == OPEN:
+            logger.info("MongoDB reachable again after %.1fs; closing the circuit breaker",
+                        time.monotonic() - self.opened_at)
+            self.state = CLOSED
+            self.opened_at = None
+
+    def record_failure(self, error):
+        self.consecutive_failures += 1
+        self.last_error = _describe(error)
+        if self.consecutive_failures >= self.failure_threshold:
+            self.trip(error)
+
+    def trip(self, error):
+        self.last_error = _describe(error)
+        if self.state == OPEN:
+            return
+        logger.warning("MongoDB unreachable (%s); opening the circuit breaker", self.last_error)
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+            "last_error": self.last_error,
+            "times_opened": self.times_opened,
+        }
+
+class TopologyHealthListener(monitoring.TopologyListener):
+    """
+    Follows the driver's own server monitoring: when every server turns unknown
+    the breaker opens without waiting for a probe, and it closes once one is
+    known again. A primary election keeps the secondaries known, so failover is
+    left to the driver's server selection. The initial unknown topology is not
+    a transition, so a client that is still connecting does not count as down.
+    """
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        was_known = event.previous_description.has_known_servers
+        is_known = event.new_description.has_known_servers
+        if is_known and not was_known:
+            self.breaker.record_success()
+        elif was_known and not is_known:
+            self.breaker.trip("no MongoDB server reachable")
+
+    def closed(self, event):
+        pass
+
+mongo_breaker = CircuitBreaker(MONGO_BREAKER_FAILURES)
@@ -1,33 +1,40 @@
-from bson import ObjectId
-from .db_utils import get_mongo_client
-from .constants import DEFAULT_DATABASE, PROFILE_COLLECTION
+from .db_utils import get_async_db
+from .constants import PROFILE_COLLECTION, CASE_INSENSITIVE_COLLATION
+from .name_cache import name_cache, MISSING
+from .sessions import session_store
 
-def get_email_by_name(name: str) -> str | None:
+async def get_email_by_name(name: str) -> str | None:
     """
     Resolves and returns the email address associated with the given user's name.
+    Answers, including "no such user", are memoised in name_cache.
     """
-    client = get_mongo_client()
-    try:
-        db = client[DEFAULT_DATABASE]
-        profile = db[PROFILE_COLLECTION].find_one({
-            "name": {"$regex": f"^{name.strip()}$", "$options": "i"}
-        })
-        if not profile:
-            return None
-        return profile.get("email", "").lower()
-    finally:
-        client.close()
+    email = name_cache.get(name)
+    if email is not MISSING:
+        return email
 
-def serialize_doc(doc: dict) -> dict:
-    """Recursively convert ObjectIds to strings"""
-    if isinstance(doc, dict):
-        return {
-            key: str(value) if isinstance(value, ObjectId) else serialize_doc(value)
-            if isinstance(value, dict) else [
-                serialize_doc(item) if isinstance(item, dict) else item
-                for item in value
-            ] if isinstance(value, list) else value
-            for key, value in doc.items()
-        }
-    return doc
+    generation = name_cache.generation
+    db = get_async_db()
+    profile = await db[PROFILE_COLLECTION].find_one(
+        {"name": name.strip()},
+        {"email": 1},
+        collation=CASE_INSENSITIVE_COLLATION
+    )
+    email = profile.get("email", "").lower() if profile else None
+    name_cache.fill(name, email, generation)
+    return email
 
+async def resolve_identity(name: str | None, session_token: str | None, role: str | None = None) -> tuple[str | None, str | None]:
+    """
+    Returns (email, name) for the caller. A session token from loginUser is
+    resolved from memory; otherwise the user is looked up by name. email is
+    None when neither identifies a user, or when the session was issued to a
+    user of another role than the one given.
+    """
+    if session_token:
+        session = await session_store.resolve(session_token)
+        if session is None or (role is not None and (session["role"] or "").lower() != role):
+            return None, name
+        return session["email"], session["name"] or session["email"]
+    if not name:
+        return None, name
+    return await get_email_by_name(name), name
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from .db_utils import get_async_db
+from .constants import PROFILE_COLLECTION, INVENTORY_COLLECTION, INVENTORY_TOMBSTONE_COLLECTION, RESERVATION_COLLECTION, SESSION_COLLECTION, CART_COLLECTION, ORDER_COLLECTION, SALES_ROLLUP_COLLECTION, CASE_INSENSITIVE_COLLATION
+from .reservations import RESERVATION_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (collection, keys, options) for every index the tools rely on.
+INDEXES = [
+    (PROFILE_COLLECTION, [("name", ASCENDING), ("role", ASCENDING)],
+     {"name": "name_role_ci", "collation": CASE_INSENSITIVE_COLLATION}),
+    (PROFILE_COLLECTION, [("email", ASCENDING)],
+     {"name": "email_unique", "unique": True}),
+    # Serves seller lookups and keyset pages of view_all_products filtered by seller.
+    (INVENTORY_COLLECTION, [("seller_email", ASCENDING), ("_id", ASCENDING)],
+     {"name": "seller_email_id"}),
+    # Upsert key of catalog imports. Not unique: existing catalogs may list a name twice.
+    (INVENTORY_COLLECTION, [("seller_email", ASCENDING), ("name", ASCENDING)],
+     {"name": "seller_name"}),
+    # Serves catalog_changes; every inventory write sets updated_at.
+    (INVENTORY_COLLECTION, [("updated_at", ASCENDING), ("_id", ASCENDING)],
+     {"name": "updated_id"}),
+    (INVENTORY_TOMBSTONE_COLLECTION, [("updated_at", ASCENDING), ("_id", ASCENDING)],
+     {"name": "updated_id"}),
+    (CART_COLLECTION, [("buyer_email", ASCENDING), ("product_id", ASCENDING)],
+     {"name": "buyer_product_unique", "unique": True}),
+    # Keyset pages of order_history; _id breaks ties between orders of the same millisecond.
+    (ORDER_COLLECTION, [("buyer_email", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "buyer_created"}),
+    (RESERVATION_COLLECTION, [("buyer_email", ASCENDING), ("status", ASCENDING)],
+     {"name": "buyer_status"}),
+    (RESERVATION_COLLECTION, [("status", ASCENDING), ("expires_at", ASCENDING)],
+     {"name": "status_expiry"}),
+    # Only settled holds carry settled_at, so the TTL never removes a live hold.
+    (RESERVATION_COLLECTION, [("settled_at", ASCENDING)],
+     {"name": "settled_ttl", "expireAfterSeconds": RESERVATION_RETENTION_SECONDS}),
+    # Persisted login sessions (SESSION_PERSIST) are removed once expires_at passes.
+    (SESSION_COLLECTION, [("expires_at", ASCENDING)],
+     {"name": "expires_ttl", "expireAfterSeconds": 0}),
+    # Upsert key of the sales rollups; also serves sales_summary's day range.
+    (SALES_ROLLUP_COLLECTION, [("seller_email", ASCENDING), ("scope", ASCENDING), ("day", ASCENDING), ("product_id", ASCENDING)],
+     {"name": "rollup_key_unique", "unique": True}),
+    (SALES_ROLLUP_COLLECTION, [("seller_email", ASCENDING), ("scope", ASCENDING), ("revenue", DESCENDING)],
+     {"name": "rollup_top_revenue"}),
+    (SALES_ROLLUP_COLLECTION, [("seller_email", ASCENDING), ("scope", ASCENDING), ("units", DESCENDING)],
+     {"name": "rollup_top_units"}),
+]
+
+# (collection, name) of indexes earlier versions created that must not outlive them.
+OBSOLETE_INDEXES = [
+    # Tombstones are pruned by catalog_sync.prune_tombstones, which records how far it went.
+    (INVENTORY_TOMBSTONE_COLLECTION, "tombstone_ttl"),
+]
+_INDEX_NOT_FOUND = 27
+
+async def ensure_indexes(db=None):
+    """
+    Creates the indexes listed in INDEXES and drops those in OBSOLETE_INDEXES.
+    Both are idempotent, so this is run on every server start; a failing index
+    is logged and skipped.
+    """
+    db = get_async_db() if db is None else db
+
+    async def create(collection, keys, options):
+        try:
+            await db[collection].create_index(keys, **options)
+        except PyMongoError as e:
+            logger.warning("Could not create index %s on %s: %s", options.get("name"), collection, e)
+
+    async def drop(collection, name):
+        try:
+            await db[collection].drop_index(name)
+        except OperationFailure as e:
+            if e.code != _INDEX_NOT_FOUND:
+                logger.warning("Could not drop index %s on %s: %s", name, collection, e)
+
+    await asyncio.gather(*(create(*spec) for spec in INDEXES), *(drop(*spec) for spec in OBSOLETE_INDEXES))
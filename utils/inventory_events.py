@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+from pymongo.errors import OperationFailure, PyMongoError
+from .db_utils import get_async_db
+from .constants import INVENTORY_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on staleness of in-process inventory views when change streams
+# are unavailable (standalone mongod) or the stream has to be re-opened.
+INVENTORY_POLL_INTERVAL = int(os.getenv("INVENTORY_POLL_INTERVAL", "30"))
+
+# Server error code for "The $changeStream stage is only supported on replica sets".
+_CHANGE_STREAMS_UNSUPPORTED = 40573
+
+_listeners = []
+
+def add_listener(apply, reset):
+    """
+    Registers an in-process view of inventory. `apply(change)` receives every
+    change-stream event; `reset()` is called whenever events may have been missed
+    and the view has to be rebuilt from scratch.
+    """
+    _listeners.append((apply, reset))
+
+def _reset_all():
+    for _, reset in _listeners:
+        reset()
+
+async def _poll_forever(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        _reset_all()
+
+async def _watch_forever(interval: int):
+    missed = False
+    while True:
+        try:
+            # Inside the try: get_async_db() raises DatabaseUnavailable while the breaker is open.
+            db = get_async_db()
+            async with await db[INVENTORY_COLLECTION].watch(full_document="updateLookup") as stream:
+                if missed:
+                    # Events from while the stream was down are lost; rebuild now it is open again.
+                    _reset_all()
+                    missed = False
+                async for change in stream:
+                    for apply, _ in _listeners:
+                        apply(change)
+        except OperationFailure as e:
+            if e.code != _CHANGE_STREAMS_UNSUPPORTED:
+                # e.g. ChangeStreamHistoryLost or a step-down: reopen the stream.
+                logger.warning("Inventory change stream failed: %s", e)
+                missed = True
+                await asyncio.sleep(interval)
+                continue
+            # Change streams need a replica set; fall back to periodic resets.
+            logger.warning("Inventory change stream unavailable, polling every %ss: %s", interval, e)
+            _reset_all()
+            await _poll_forever(interval)
+        except PyMongoError as e:
+            logger.warning("Inventory change stream interrupted: %s", e)
+            missed = True
+            await asyncio.sleep(interval)
+
+_watchers = {}
+
+async def start_inventory_watcher(interval: int = INVENTORY_POLL_INTERVAL):
+    """Starts the task that feeds inventory changes to the listeners, once per event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _watchers:
+        _watchers[loop] = loop.create_task(_watch_forever(interval))
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from .health import mongo_breaker, MONGO_RECOVERY_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between retries of a startup hook that fails while MongoDB is reachable.
+STARTUP_RETRY_MAX_INTERVAL = 60
+
+_done = {}
+_failed = {}
+_retriers = {}
+_locks = {}
+
+async def run_startup(hooks):
+    """
+    Awaits each startup hook that has not yet succeeded on the running event loop.
+    A failing hook is logged and retried in the background once the circuit
+    breaker is closed, instead of taking the server down; over stdio the
+    lifespan is entered only once, so nothing else would run it again.
+    """
+    loop = asyncio.get_running_loop()
+    done = _done.setdefault(loop, set())
+    failed = _failed.setdefault(loop, [])
+    if all(hook in done for hook in hooks):
+        # Later sessions skip the lock rather than queue behind a retry of a slow hook.
+        return
+    async with _locks.setdefault(loop, asyncio.Lock()):
+        for hook in hooks:
+            if hook in done:
+                continue
+            try:
+                await hook()
+                done.add(hook)
+                if hook in failed:
+                    failed.remove(hook)
+            except Exception as e:
+                logger.warning("Startup step %s failed: %s", hook.__name__, e)
+                if hook not in failed:
+                    failed.append(hook)
+    retrier = _retriers.get(loop)
+    if failed and (retrier is None or retrier.done()):
+        _retriers[loop] = loop.create_task(_retry_failed(failed))
+
+async def _retry_failed(failed: list):
+    delay = MONGO_RECOVERY_INTERVAL
+    while failed:
+        await asyncio.sleep(MONGO_RECOVERY_INTERVAL if mongo_breaker.is_open else delay)
+        if mongo_breaker.is_open:
+            continue
+        await run_startup(list(failed))
+        delay = min(delay * 2, STARTUP_RETRY_MAX_INTERVAL)
+
+def startup_lifespan(*hooks):
+    """
+    Builds a FastMCP lifespan that runs the startup hooks before requests are served.
+    Over the HTTP transports FastMCP enters the lifespan once per session, and
+    services sharing a process share hooks, so each hook only runs once.
+    """
+    @asynccontextmanager
+    async def lifespan(server):
+        await run_startup(hooks)
+        yield {}
+
+    return lifespan
@@ -0,0 +1,353 @@
+import bisect
+import contextvars
+import datetime
+import os
+import time
+from collections import deque
+from mcp.server.fastmcp import FastMCP
+from mcp.types import TextContent
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from .admission import admission
+from .health import mongo_breaker
+from .serialization import to_json
+
+# How many recent calls are kept for the slowest-calls report.
+METRICS_RECENT_CALLS = int(os.getenv("METRICS_RECENT_CALLS", "500"))
+# When set, server_stats only answers callers passing this token.
+METRICS_ADMIN_TOKEN = os.getenv("METRICS_ADMIN_TOKEN")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+class CallStats:
+    """What one tool call cost; filled in by the Mongo listeners while the call runs."""
+
+    __slots__ = ("service", "tool", "started_at", "duration", "commands", "mongo_seconds",
+                 "checkout_seconds", "connections_opened", "response_bytes", "error")
+
+    def __init__(self, service: str, tool: str):
+        self.service = service
+        self.tool = tool
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.commands = {}
+        self.mongo_seconds = 0.0
+        self.checkout_seconds = 0.0
+        self.connections_opened = 0
+        self.response_bytes = 0
+        self.error = None
+
+    @property
+    def command_count(self) -> int:
+        return sum(self.commands.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "service": self.service,
+            "tool": self.tool,
+            "started_at": datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc).isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "mongo_commands": self.commands,
+            "mongo_ms": round(self.mongo_seconds * 1000, 3),
+            "checkout_ms": round(self.checkout_seconds * 1000, 3),
+            "connections_opened": self.connections_opened,
+            "response_bytes": self.response_bytes,
+            "error": self.error,
+        }
+
+class ToolSeries:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.commands = Histogram(COMMAND_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.mongo_seconds = 0.0
+        self.checkout_seconds = 0.0
+        self.connections_opened = 0
+
+class ToolMetrics:
+    """
+    Process-wide registry of tool-call and Mongo command metrics. Services
+    sharing a process (see gateway.py) share it, keyed by service name.
+    """
+
+    def __init__(self, recent_calls: int):
+        self.series = {}
+        self.recent = deque(maxlen=recent_calls)
+        self.mongo_commands = {}
+        self.mongo_failures = {}
+        self.caches = {}
+
+    def add_cache(self, name: str, stats):
+        """Registers an in-process cache whose stats() are reported alongside the tool metrics."""
+        self.caches[name] = stats
+
+    def record_call(self, call: CallStats):
+        series = self.series.get((call.service, call.tool))
+        if series is None:
+            series = self.series[(call.service, call.tool)] = ToolSeries()
+        series.calls += 1
+        if call.error is not None:
+            series.errors += 1
+        series.duration.observe(call.duration)
+        series.commands.observe(call.command_count)
+        series.response_bytes.observe(call.response_bytes)
+        series.mongo_seconds += call.mongo_seconds
+        series.checkout_seconds += call.checkout_seconds
+        series.connections_opened += call.connections_opened
+        self.recent.append(call)
+
+    def record_command(self, name: str, failed: bool = False):
+        counts = self.mongo_failures if failed else self.mongo_commands
+        counts[name] = counts.get(name, 0) + 1
+
+    def slowest(self, top: int) -> list:
+        return [call.as_dict() for call in sorted(self.recent, key=lambda call: call.duration, reverse=True)[:top]]
+
+    def snapshot(self, top: int = 10) -> dict:
+        tools = {}
+        for (service, tool), series in sorted(self.series.items()):
+            calls = series.calls
+            tools[f"{service}/{tool}"] = {
+                "calls": calls,
+                "errors": series.errors,
+                "mean_ms": round(series.duration.sum / calls * 1000, 3),
+                "mean_mongo_commands": round(series.commands.sum / calls, 2),
+                "mean_mongo_ms": round(series.mongo_seconds / calls * 1000, 3),
+                "mean_checkout_ms": round(series.checkout_seconds / calls * 1000, 3),
+                "connections_opened": series.connections_opened,
+                "mean_response_bytes": round(series.response_bytes.sum / calls),
+            }
+        return {
+            "tools": tools,
+            "mongo_commands": dict(sorted(self.mongo_commands.items())),
+            "mongo_command_failures": dict(sorted(self.mongo_failures.items())),
+            "caches": {name: stats() for name, stats in sorted(self.caches.items())},
+            "mongo_breaker": mongo_breaker.stats(),
+            "admission": admission.stats(),
+            "slowest_calls": self.slowest(top),
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, help_text: str, attribute: str):
+            family(name, "histogram", help_text)
+            for (service, tool), series in sorted(self.series.items()):
+                hist = getattr(series, attribute)
+                labels = _labels(service=service, tool=tool)
+                for bound, total in hist.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        family("mcp_tool_calls_total", "counter", "Tool calls by outcome.")
+        for (service, tool), series in sorted(self.series.items()):
+            lines.append(f'mcp_tool_calls_total{{{_labels(service=service, tool=tool)},status="ok"}} {series.calls - series.errors}')
+            lines.append(f'mcp_tool_calls_total{{{_labels(service=service, tool=tool)},status="error"}} {series.errors}')
+        histogram("mcp_tool_duration_seconds", "Wall time per tool call.", "duration")
+        histogram("mcp_tool_mongo_commands", "Mongo commands issued per tool call.", "commands")
+        histogram("mcp_tool_response_bytes", "Size of each tool response.", "response_bytes")
+
+        for name, attribute, help_text in (
+            ("mcp_tool_mongo_seconds_total", "mongo_seconds", "Time spent waiting on Mongo commands."),
+            ("mcp_tool_mongo_checkout_seconds_total", "checkout_seconds", "Time spent checking connections out of the pool."),
+            ("mcp_tool_mongo_connections_opened_total", "connections_opened", "Connections opened while serving tool calls."),
+        ):
+            family(name, "counter", help_text)
+            for (service, tool), series in sorted(self.series.items()):
+                lines.append(f"{name}{{{_labels(service=service, tool=tool)}}} {getattr(series, attribute)}")
+
+        family("mongo_commands_total", "counter", "Mongo commands started, including background work.")
+        for command, count in sorted(self.mongo_commands.items()):
+            lines.append(f"mongo_commands_total{{{_labels(command=command)}}} {count}")
+        family("mongo_command_failures_total", "counter", "Mongo commands that failed.")
+        for command, count in sorted(self.mongo_failures.items()):
+            lines.append(f"mongo_command_failures_total{{{_labels(command=command)}}} {count}")
+
+        limiters = {"shared": admission.shared, **admission.tools}
+        family("mcp_admission_in_use", "gauge", "Tool calls currently admitted, per limit.")
+        for limit, limiter in limiters.items():
+            lines.append(f"mcp_admission_in_use{{{_labels(limit=limit)}}} {limiter.in_use}")
+        family("mcp_admission_queue_depth", "gauge", "Tool calls waiting for admission, per limit.")
+        for limit, limiter in limiters.items():
+            lines.append(f"mcp_admission_queue_depth{{{_labels(limit=limit)}}} {limiter.waiting}")
+        users = admission.stats()["users"]
+        lines.append(f"mcp_admission_queue_depth{{{_labels(limit='user')}}} {users['waiting']}")
+        family("mcp_admission_rejected_total", "counter", "Tool calls turned away, by limit and reason.")
+        for limit, limiter in limiters.items():
+            lines.append(f'mcp_admission_rejected_total{{{_labels(limit=limit)},reason="queue_full"}} {limiter.rejected}')
+            lines.append(f'mcp_admission_rejected_total{{{_labels(limit=limit)},reason="timeout"}} {limiter.timed_out}')
+        lines.append(f'mcp_admission_rejected_total{{{_labels(limit="user")},reason="queue_full"}} {users["rejected"]}')
+        lines.append(f'mcp_admission_rejected_total{{{_labels(limit="user")},reason="timeout"}} {users["timed_out"]}')
+
+        family("mongo_breaker_open", "gauge", "1 while the Mongo circuit breaker fails calls fast.")
+        lines.append(f"mongo_breaker_open {int(mongo_breaker.is_open)}")
+        family("mongo_breaker_opened_total", "counter", "Times the Mongo circuit breaker opened.")
+        lines.append(f"mongo_breaker_opened_total {mongo_breaker.times_opened}")
+
+        caches = {name: stats() for name, stats in sorted(self.caches.items())}
+        for key, kind, help_text in (
+            ("hits", "counter", "Cache lookups answered from memory."),
+            ("misses", "counter", "Cache lookups that went to the database."),
+            ("evictions", "counter", "Entries evicted to stay within the size bound."),
+            ("invalidations", "counter", "Entries dropped because the underlying data changed."),
+            ("coalesced", "counter", "Calls that shared another call's in-flight read."),
+            ("size", "gauge", "Entries currently cached."),
+        ):
+            name = f"mcp_cache_{key}_total" if kind == "counter" else f"mcp_cache_{key}"
+            family(name, kind, help_text)
+            for cache, stats in caches.items():
+                if key in stats:
+                    lines.append(f"{name}{{{_labels(cache=cache)}}} {stats[key]}")
+        return "\n".join(lines) + "\n"
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+tool_metrics = ToolMetrics(METRICS_RECENT_CALLS)
+
+_current_call = contextvars.ContextVar("current_call", default=None)
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Attributes each Mongo command to the tool call that issued it. Listeners
+    run in the task sending the command, and tasks a tool spawns inherit its
+    context, so the current call is visible here.
+    """
+
+    def started(self, event):
+        tool_metrics.record_command(event.command_name)
+        call = _current_call.get()
+        if call is not None:
+            call.commands[event.command_name] = call.commands.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        call = _current_call.get()
+        if call is not None:
+            call.mongo_seconds += event.duration_micros / 1e6
+
+    def failed(self, event):
+        tool_metrics.record_command(event.command_name, failed=True)
+        call = _current_call.get()
+        if call is not None:
+            call.mongo_seconds += event.duration_micros / 1e6
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Attributes connection checkout waits and new connections to the current tool call."""
+
+    def connection_created(self, event):
+        call = _current_call.get()
+        if call is not None:
+            call.connections_opened += 1
+
+    def connection_checked_out(self, event):
+        call = _current_call.get()
+        if call is not None and event.duration is not None:
+            call.checkout_seconds += event.duration
+
+    def connection_check_out_failed(self, event):
+        call = _current_call.get()
+        if call is not None and event.duration is not None:
+            call.checkout_seconds += event.duration
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+MONGO_LISTENERS = [CommandMetricsListener(), PoolMetricsListener()]
+
+async def server_stats(top: int = 10, admin_token: str | None = None) -> str:
+    """
+    Admin: per-tool call counts, mean latency, Mongo commands and response size
+    for this process, plus the slowest recent calls with their Mongo breakdown
+    and the hit/miss counters and sizes of the in-process caches.
+    """
+    if METRICS_ADMIN_TOKEN and admin_token != METRICS_ADMIN_TOKEN:
+        return "Not authorized."
+    return to_json(tool_metrics.snapshot(max(1, min(top, 100))))
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus text exposition of tool_metrics."""
+    return PlainTextResponse(tool_metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+class InstrumentedFastMCP(FastMCP):
+    """
+    FastMCP server that records wall time, Mongo commands and response size
+    for every tool call, and serves them through the server_stats tool and a
+    /metrics route on the HTTP transports. Every call first passes admission
+    control; time spent queued counts towards its wall time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_tool(server_stats)
+        self.custom_route("/metrics", methods=["GET"])(metrics_endpoint)
+
+    async def call_tool(self, name: str, arguments: dict):
+        call = CallStats(self.name, name)
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        try:
+            async with admission.admit(name, arguments):
+                result = await super().call_tool(name, arguments)
+            call.response_bytes = sum(len(item.text.encode()) for item in result if isinstance(item, TextContent))
+            return result
+        except Exception as e:
+            call.error = str(e)[:300]
+            raise
+        finally:
+            call.duration = time.perf_counter() - start
+            _current_call.reset(token)
+            tool_metrics.record_call(call)
@@ -0,0 +1,86 @@
+import os
+import time
+from collections import OrderedDict
+from .metrics import tool_metrics
+
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "10000"))
+NAME_CACHE_TTL_SECONDS = int(os.getenv("NAME_CACHE_TTL_SECONDS", "300"))
+# Unknown names are remembered for less time, so a user who registers on
+# another process becomes visible here quickly.
+NAME_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("NAME_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+
+MISSING = object()
+
+def _key(name: str) -> str:
+    # Mirrors CASE_INSENSITIVE_COLLATION, which the profile lookup uses.
+    return name.strip().casefold()
+
+class NameCache:
+    """
+    Bounded LRU memo of user name -> email, including names that matched no
+    profile. Only touched from the event loop, so it needs no locking.
+
+    Like CatalogCache, readers take `generation` before querying and pass it
+    back when filling, so a lookup that raced an invalidation is not cached.
+    """
+
+    def __init__(self, max_size: int, ttl: int, negative_ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, name: str):
+        """Returns the cached email, None for a cached unknown name, or MISSING."""
+        key = _key(name)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        if entry[0] is None:
+            self.negative_hits += 1
+        return entry[0]
+
+    def fill(self, name: str, email: str | None, generation: int):
+        if generation != self.generation:
+            return
+        ttl = self.ttl if email is not None else self.negative_ttl
+        key = _key(name)
+        self._entries[key] = (email, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *names: str):
+        """Drops the given names after a profile was created or renamed."""
+        self.generation += 1
+        for name in names:
+            if name and self._entries.pop(_key(name), None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+name_cache = NameCache(NAME_CACHE_SIZE, NAME_CACHE_TTL_SECONDS, NAME_CACHE_NEGATIVE_TTL_SECONDS)
+tool_metrics.add_cache("name_to_email", name_cache.stats)
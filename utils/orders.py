@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from .constants import ORDER_COLLECTION
+
+PLACED = "placed"
+
+ORDER_SUMMARY_PROJECTION = {"created_at": 1, "status": 1, "total": 1, "item_count": 1}
+
+def build_order(buyer_email: str, cart, when: datetime) -> dict:
+    """One order document per checkout, with the cart lines embedded as items."""
+    items = [
+        {
+            "product_id": item["product_id"],
+            "name": item.get("name"),
+            "price": item.get("price", 0),
+            "quantity": item.get("quantity", 0),
+            "seller_email": item.get("seller_email"),
+            "total_price": item.get("price", 0) * item.get("quantity", 0)
+        }
+        for item in cart
+    ]
+    return {
+        "buyer_email": buyer_email,
+        "created_at": when,
+        "status": PLACED,
+        "items": items,
+        "item_count": len(items),
+        "total": sum(item["total_price"] for item in items),
+        # Already counted by record_sales; tells the rollup backfill to skip it.
+        "rolled_up": True
+    }
+
+def _page_token(order: dict) -> str:
+    created_at = order["created_at"].replace(tzinfo=timezone.utc)
+    return f"{int(created_at.timestamp() * 1000)}-{order['_id']}"
+
+def _after_token(page_token: str) -> dict:
+    """The keyset condition for orders older than the one the token names; raises ValueError."""
+    try:
+        millis, oid = page_token.split("-", 1)
+        created_at = datetime.fromtimestamp(int(millis) / 1000, timezone.utc)
+        oid = ObjectId(oid)
+    except (ValueError, InvalidId):
+        raise ValueError("Invalid page_token.")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}},
+    ]}
+
+async def order_page(db, buyer_email: str, page_size: int, page_token: str | None = None) -> tuple:
+    """
+    One page of the buyer's orders, newest first, and the token of the next
+    page (None on the last). Pages are keyed on (created_at, _id), so each is a
+    bounded walk of the buyer_created index however long the history is.
+    """
+    # Per-line documents written before orders had created_at are not orders
+    # and are left out.
+    query = {"buyer_email": buyer_email, "created_at": {"$type": "date"}}
+    if page_token:
+        query.update(_after_token(page_token))
+    orders = await db[ORDER_COLLECTION].find(
+        query,
+        ORDER_SUMMARY_PROJECTION,
+        sort=[("created_at", -1), ("_id", -1)],
+        limit=page_size + 1
+    ).to_list()
+    if len(orders) > page_size:
+        return orders[:page_size], _page_token(orders[page_size - 1])
+    return orders, None
+
+async def find_order(db, buyer_email: str, order_id: ObjectId):
+    return await db[ORDER_COLLECTION].find_one(
+        {"_id": order_id, "buyer_email": buyer_email},
+        {"rolled_up": 0}
+    )
@@ -0,0 +1,103 @@
+import re
+
+UPDATABLE_FIELDS = ("name", "price", "quantity")
+
+# "price * 0.9", "quantity + 5", "quantity += 5", "+= 5", "*= 1.1". Without the
+# field name the "=" is required: a bare "-5" reads as a negative value.
+_EXPRESSION = re.compile(
+    r"^\s*(?P<field>[a-z_]+)?\s*(?P<op>[*/+-])(?P<assign>=?)\s*(?P<operand>\d+(?:\.\d+)?)\s*$"
+)
+# {"$inc": -5}, {"$mul": 1.1}
+_OPERATORS = ("$inc", "$mul")
+
+def _number(field: str, value):
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be a number")
+    try:
+        number = int(value) if field == "quantity" else float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be {'an integer' if field == 'quantity' else 'a number'}")
+    if field == "quantity" and isinstance(value, float) and not value.is_integer():
+        raise ValueError("quantity must be an integer")
+    if number < 0:
+        raise ValueError(f"{field} must not be negative")
+    return number
+
+def _relative(field: str, value) -> tuple | None:
+    """(op, operand) for a change relative to the current value, or None for a plain value."""
+    if isinstance(value, dict):
+        if len(value) != 1 or next(iter(value)) not in _OPERATORS:
+            raise ValueError(f"{field} takes one of {', '.join(_OPERATORS)}, e.g. {{\"$inc\": -5}}")
+        (operator, amount), = value.items()
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            raise ValueError(f"{operator} for {field} must be a number")
+        if operator == "$mul":
+            if amount < 0:
+                raise ValueError(f"{field} cannot be multiplied by a negative number")
+            return "*", float(amount)
+        return ("-" if amount < 0 else "+"), float(abs(amount))
+    match = _EXPRESSION.match(value) if isinstance(value, str) else None
+    if match is None:
+        return None
+    if match["field"] and match["field"] != field:
+        raise ValueError(f"expression for {field} refers to {match['field']}")
+    if not match["field"] and not match["assign"]:
+        op, operand = match["op"], match["operand"]
+        raise ValueError(
+            f"'{value.strip()}' is ambiguous for {field}: write '{op}= {operand}' to change it "
+            f"relative to its current value, or a non-negative number to set it"
+        )
+    return match["op"], float(match["operand"])
+
+def parse_changes(changes: dict) -> tuple:
+    """
+    Turns {field: value-or-expression} into (update document, extra filter).
+    Plain values are $set; price and quantity also take arithmetic on their
+    current value, written "-= n", "+= n", "*= n" or "/= n", with the field
+    named as in "price * 0.9" or "quantity += 5", or as {"$inc": n} or
+    {"$mul": n}. A decrement only applies while it keeps the field
+    non-negative, which the extra filter enforces.
+    """
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("changes must be a non-empty object")
+    update = {}
+    guard = {}
+    for field, value in changes.items():
+        field = field.strip().lower()
+        if field not in UPDATABLE_FIELDS:
+            raise ValueError(f"cannot update '{field}'; choose from {', '.join(UPDATABLE_FIELDS)}")
+        if field == "name":
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError("name must be a non-empty string")
+            update.setdefault("$set", {})["name"] = value.strip()
+            continue
+
+        relative = _relative(field, value)
+        if relative is None:
+            update.setdefault("$set", {})[field] = _number(field, value)
+            continue
+        op, operand = relative
+        if field == "quantity" and not operand.is_integer():
+            raise ValueError("quantity can only change by whole numbers")
+        if field == "quantity":
+            operand = int(operand)
+        if op in "*/":
+            if op == "/" and operand == 0:
+                raise ValueError("cannot divide by zero")
+            if field == "quantity" and op == "/":
+                raise ValueError("quantity cannot be divided")
+            update.setdefault("$mul", {})[field] = operand if op == "*" else 1 / operand
+        else:
+            update.setdefault("$inc", {})[field] = operand if op == "+" else -operand
+            if op == "-":
+                guard[field] = {"$gte": operand}
+    return update, guard
+
+def would_modify(doc: dict, update: dict) -> bool:
+    """Whether applying the update to the current document changes it."""
+    for field, value in update.get("$set", {}).items():
+        if doc.get(field) != value:
+            return True
+    if any(value != 0 for value in update.get("$inc", {}).values()):
+        return True
+    return any(value != 1 and doc.get(field) for field, value in update.get("$mul", {}).items())
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from .db_utils import get_async_db
+from .constants import INVENTORY_COLLECTION, RESERVATION_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# How long a cart hold keeps stock aside before it is returned to inventory.
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+# How often the sweeper looks for expired holds.
+RESERVATION_SWEEP_INTERVAL = int(os.getenv("RESERVATION_SWEEP_INTERVAL", "30"))
+# How long settled (released or consumed) holds are kept before the TTL index drops them.
+RESERVATION_RETENTION_SECONDS = int(os.getenv("RESERVATION_RETENTION_SECONDS", "86400"))
+
+HELD = "held"
+RELEASED = "released"
+CONSUMED = "consumed"
+
+def _now():
+    return datetime.now(timezone.utc)
+
+async def take_stock_many(db, wanted, session) -> bool:
+    """
+    Takes (product_id, quantity) pairs out of inventory in one bulk write. Each
+    decrement only applies while enough stock remains, so concurrent buyers can
+    never push quantity below zero. The result only says whether every
+    decrement applied, so this runs inside a transaction that the caller aborts
+    when it returns False.
+    """
+    now = _now()
+    result = await db[INVENTORY_COLLECTION].bulk_write([
+        UpdateOne(
+            {"_id": product_id, "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity}, "$set": {"updated_at": now}}
+        )
+        for product_id, quantity in wanted
+    ], ordered=False, session=session)
+    return result.matched_count == len(wanted)
+
+async def return_stock(db, product_id, quantity: int, session=None):
+    """Puts units taken with take_stock_many back into inventory."""
+    await db[INVENTORY_COLLECTION].update_one(
+        {"_id": product_id},
+        {"$inc": {"quantity": quantity}, "$set": {"updated_at": _now()}},
+        session=session
+    )
+
+async def record_holds(db, buyer_email: str, taken, session=None):
+    """
+    Records that the buyer holds units already taken with take_stock_many, given as
+    (product_id, quantity) pairs. Outside a transaction, stock is taken before
+    holds are written: a crash in between strands units rather than handing out
+    stock that was never taken.
+    """
+    now = _now()
+    expires_at = now + timedelta(seconds=RESERVATION_TTL_SECONDS)
+    await db[RESERVATION_COLLECTION].insert_many([
+        {
+            "buyer_email": buyer_email,
+            "product_id": product_id,
+            "quantity": quantity,
+            "status": HELD,
+            "created_at": now,
+            "expires_at": expires_at
+        }
+        for product_id, quantity in taken
+    ], session=session)
+
+async def held_quantities(db, buyer_email: str, session=None) -> dict:
+    """Returns {product_id: units} currently held for the buyer, expired or not."""
+    held = {}
+    async for hold in db[RESERVATION_COLLECTION].find(
+        {"buyer_email": buyer_email, "status": HELD},
+        {"product_id": 1, "quantity": 1},
+        session=session
+    ):
+        held[hold["product_id"]] = held.get(hold["product_id"], 0) + hold["quantity"]
+    return held
+
+async def consume_holds(db, buyer_email: str, session=None):
+    """Marks all of the buyer's holds as consumed by a checkout; their stock stays sold."""
+    await db[RESERVATION_COLLECTION].update_many(
+        {"buyer_email": buyer_email, "status": HELD},
+        {"$set": {"status": CONSUMED, "settled_at": _now()}},
+        session=session
+    )
+
+async def _release_hold(db, hold_id) -> bool:
+    async def release(session):
+        hold = await db[RESERVATION_COLLECTION].find_one_and_update(
+            {"_id": hold_id, "status": HELD},
+            {"$set": {"status": RELEASED, "settled_at": _now()}},
+            session=session
+        )
+        if hold is None:
+            return False
+        await return_stock(db, hold["product_id"], hold["quantity"], session=session)
+        return True
+
+    async with db.client.start_session() as session:
+        return await session.with_transaction(release)
+
+async def _release_all(db, query, limit: int = 0) -> int:
+    holds = await db[RESERVATION_COLLECTION].find(query, {"_id": 1}).limit(limit).to_list()
+    released = await asyncio.gather(*(_release_hold(db, hold["_id"]) for hold in holds))
+    return sum(released)
+
+async def release_holds(db, buyer_email: str, product_id) -> int:
+    """Returns the buyer's held units of a product to inventory. Returns the number of holds released."""
+    return await _release_all(db, {"buyer_email": buyer_email, "product_id": product_id, "status": HELD})
+
+async def release_expired_reservations(db=None, limit: int = 500) -> int:
+    """Returns stock for holds past their expiry. Returns the number of holds released."""
+    db = get_async_db() if db is None else db
+    return await _release_all(db, {"status": HELD, "expires_at": {"$lte": _now()}}, limit)
+
+async def _sweep_forever(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            released = await release_expired_reservations()
+            if released:
+                logger.info("Released %d expired reservation(s)", released)
+        except PyMongoError as e:
+            logger.warning("Reservation sweep failed: %s", e)
+
+_sweepers = {}
+
+async def start_reservation_sweeper(interval: int = RESERVATION_SWEEP_INTERVAL):
+    """Starts the background task that releases expired holds, once per event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _sweepers:
+        _sweepers[loop] = loop.create_task(_sweep_forever(interval))
@@ -0,0 +1,210 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from .db_utils import get_async_db
+from .constants import INVENTORY_COLLECTION, ORDER_COLLECTION, SALES_ROLLUP_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Rollup documents, all in SALES_ROLLUP_COLLECTION and keyed by seller_email and scope:
+#   "seller":  all-time totals of the seller
+#   "day":     the seller's totals for one UTC day ("day": "YYYY-MM-DD")
+#   "product": all-time totals of one product ("product_id", "name")
+# Each carries revenue, units and orders; checkout $incs them in its transaction.
+SELLER = "seller"
+DAY = "day"
+PRODUCT = "product"
+ROLLUP_COUNTERS = ("revenue", "units", "orders")
+
+# Legacy orders folded into the rollups per backfill transaction.
+SALES_BACKFILL_BATCH = int(os.getenv("SALES_BACKFILL_BATCH", "1000"))
+_BACKFILL_MARKER = {"seller_email": None, "scope": "backfill"}
+# Lines of one legacy checkout were written back to back; a longer pause starts another.
+LEGACY_CHECKOUT_GAP_SECONDS = 5
+
+def sales_day(when: datetime) -> str:
+    return when.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+def _rollup_ops(lines, seller_orders: dict, now: datetime) -> list:
+    """
+    Builds the $inc upserts for sold lines, given as (seller_email, product_id,
+    name, day, revenue, units, orders) tuples, and for the number of orders each
+    (seller_email, day) received.
+    """
+    totals = {}
+
+    def add(key, revenue=0, units=0, orders=0):
+        counters = totals.setdefault(key, {"revenue": 0, "units": 0, "orders": 0})
+        counters["revenue"] += revenue
+        counters["units"] += units
+        counters["orders"] += orders
+
+    names = {}
+    for seller_email, product_id, name, day, revenue, units, orders in lines:
+        add((seller_email, PRODUCT, None, product_id), revenue, units, orders)
+        add((seller_email, DAY, day, None), revenue, units)
+        add((seller_email, SELLER, None, None), revenue, units)
+        names[product_id] = name
+    for (seller_email, day), orders in seller_orders.items():
+        add((seller_email, DAY, day, None), orders=orders)
+        add((seller_email, SELLER, None, None), orders=orders)
+
+    ops = []
+    for (seller_email, scope, day, product_id), counters in totals.items():
+        key = {"seller_email": seller_email, "scope": scope, "day": day, "product_id": product_id}
+        update = {"$inc": counters, "$set": {"updated_at": now}}
+        if scope == PRODUCT:
+            update["$set"]["name"] = names[product_id]
+        ops.append(UpdateOne(key, update, upsert=True))
+    return ops
+
+async def record_sales(db, cart, when: datetime, session=None):
+    """Adds a checkout's cart lines to the seller, day and product rollups."""
+    day = sales_day(when)
+    lines = [
+        (item["seller_email"], item["product_id"], item.get("name"), day,
+         item.get("price", 0) * item.get("quantity", 0), item.get("quantity", 0), 1)
+        for item in cart
+    ]
+    seller_orders = {(item["seller_email"], day): 1 for item in cart}
+    await db[SALES_ROLLUP_COLLECTION].bulk_write(_rollup_ops(lines, seller_orders, when), ordered=False, session=session)
+
+async def sales_rollups(db, seller_email: str, since_day: str) -> list:
+    """The seller's all-time rollup and daily rollups from since_day on, in one indexed read."""
+    return await db[SALES_ROLLUP_COLLECTION].find(
+        {"seller_email": seller_email, "$or": [{"scope": SELLER}, {"scope": DAY, "day": {"$gte": since_day}}]},
+        {"_id": 0, "scope": 1, "day": 1, **{counter: 1 for counter in ROLLUP_COUNTERS}},
+        sort=[("scope", 1), ("day", 1)]
+    ).to_list()
+
+async def product_rollups(db, seller_email: str, sort_by: str, limit: int) -> list:
+    return await db[SALES_ROLLUP_COLLECTION].find(
+        {"seller_email": seller_email, "scope": PRODUCT},
+        {"_id": 0, "product_id": 1, "name": 1, **{counter: 1 for counter in ROLLUP_COUNTERS}},
+        sort=[(sort_by, -1)],
+        limit=limit
+    ).to_list()
+
+async def _products_by_name(db, names) -> dict:
+    """
+    Maps the product names of legacy orders to their products in one read, with
+    None for a name that several products share. Those orders carry only the
+    product name, so a line whose name maps to no single product is skipped.
+    """
+    products = {}
+    async for product in db[INVENTORY_COLLECTION].find({"name": {"$in": list(names)}}, {"seller_email": 1, "name": 1}):
+        products[product["name"]] = None if product["name"] in products else product
+    return products
+
+def _legacy_checkouts(batch, last_lines: dict) -> dict:
+    """
+    Maps each legacy order line to the checkout it belonged to, named by the _id
+    of that checkout's first line. Those checkouts wrote one order per cart line,
+    one after another, so a buyer's lines less than LEGACY_CHECKOUT_GAP_SECONDS
+    apart are taken as one checkout. last_lines carries each buyer's latest
+    (time, checkout) from one batch to the next and is updated in place.
+    """
+    checkouts = {}
+    for order in sorted(batch, key=lambda order: order["_id"]):
+        when = order["_id"].generation_time
+        buyer = order.get("buyer_email")
+        previous = last_lines.get(buyer)
+        if previous and (when - previous[0]).total_seconds() <= LEGACY_CHECKOUT_GAP_SECONDS:
+            checkout = previous[1]
+        else:
+            checkout = order["_id"]
+        last_lines[buyer] = (when, checkout)
+        checkouts[order["_id"]] = checkout
+    return checkouts
+
+async def _backfill_batch(session, db, order_ids, products, checkouts, counted: frozenset):
+    """
+    Folds the batch's orders by seller, product and day; the day comes from the
+    order's ObjectId. Revenue and units add up per line, but a checkout counts as
+    one order for each product and each seller and day it touched; counted holds
+    the (checkout, ...) keys earlier batches already counted. Returns the number
+    of lines folded and the counted keys including this batch's.
+    """
+    orders = await db[ORDER_COLLECTION].find(
+        {"_id": {"$in": order_ids}, "rolled_up": {"$exists": False}},
+        {"prod_name": 1, "total_price": 1, "quantity": 1},
+        session=session
+    ).to_list()
+    counted = set(counted)
+    groups = {}
+    seller_orders = {}
+    folded = 0
+    for order in orders:
+        product = products.get(order.get("prod_name"))
+        if product is None:
+            continue
+        folded += 1
+        checkout = checkouts[order["_id"]]
+        day = sales_day(order["_id"].generation_time)
+        key = (product["seller_email"], product["_id"], day)
+        group = groups.setdefault(key, {"name": order["prod_name"], "revenue": 0, "units": 0, "orders": 0})
+        group["revenue"] += order.get("total_price", 0)
+        group["units"] += order.get("quantity", 0)
+        if (checkout, *key) not in counted:
+            counted.add((checkout, *key))
+            group["orders"] += 1
+        if (checkout, product["seller_email"], day) not in counted:
+            counted.add((checkout, product["seller_email"], day))
+            seller_orders[(product["seller_email"], day)] = seller_orders.get((product["seller_email"], day), 0) + 1
+    lines = [
+        (seller_email, product_id, group["name"], day, group["revenue"], group["units"], group["orders"])
+        for (seller_email, product_id, day), group in groups.items()
+    ]
+    if lines:
+        ops = _rollup_ops(lines, seller_orders, datetime.now(timezone.utc))
+        await db[SALES_ROLLUP_COLLECTION].bulk_write(ops, ordered=False, session=session)
+    await db[ORDER_COLLECTION].update_many(
+        {"_id": {"$in": [order["_id"] for order in orders]}}, {"$set": {"rolled_up": True}}, session=session
+    )
+    return folded, counted
+
+async def backfill_sales_rollups():
+    """
+    Folds orders written before the rollups existed into them, in batches that
+    each commit the $incs together with marking their orders rolled_up, so an
+    interrupted backfill resumes without counting an order twice. Runs as a
+    startup hook; once done, a marker document makes later runs a single read.
+    """
+    db = get_async_db()
+    rollups = db[SALES_ROLLUP_COLLECTION]
+    if await rollups.find_one(_BACKFILL_MARKER, {"_id": 1}):
+        return
+    orders = db[ORDER_COLLECTION]
+    folded = seen = 0
+    last_lines = {}
+    counted = frozenset()
+    while True:
+        # In _id order, so a checkout's lines arrive together and in sequence.
+        batch = await orders.find(
+            {"rolled_up": {"$exists": False}}, {"prod_name": 1, "buyer_email": 1},
+            sort=[("_id", 1)], limit=SALES_BACKFILL_BATCH
+        ).to_list()
+        if not batch:
+            break
+        # Resolved before the transaction: inventory has no index on name alone,
+        # so matching each order to it would scan the inventory once per order.
+        products = await _products_by_name(db, {order["prod_name"] for order in batch if order.get("prod_name")})
+        order_ids = [order["_id"] for order in batch]
+        checkouts = _legacy_checkouts(batch, last_lines)
+        async with db.client.start_session() as session:
+            lines, counted = await session.with_transaction(
+                lambda s: _backfill_batch(s, db, order_ids, products, checkouts, counted)
+            )
+        folded += lines
+        seen += len(batch)
+        # Only checkouts that may continue into the next batch need remembering.
+        still_open = {checkout for _, checkout in last_lines.values()}
+        counted = frozenset(key for key in counted if key[0] in still_open)
+    await rollups.update_one(_BACKFILL_MARKER, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True)
+    if seen:
+        logger.info("Backfilled sales rollups from %d order lines; %d could not be attributed to a product", seen, seen - folded)
+
+def since_day(days: int) -> str:
+    """The first day of a window of `days` UTC days ending today."""
+    return sales_day(datetime.now(timezone.utc) - timedelta(days=days - 1))
@@ -0,0 +1,244 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+from .db_utils import get_async_db
+from .constants import INVENTORY_COLLECTION
+from .inventory_events import add_listener
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PROJECTION = {"name": 1, "price": 1, "quantity": 1, "seller_email": 1}
+SORT_OPTIONS = ("relevance", "price_asc", "price_desc", "name")
+
+# Match weights per query term: exact token, token prefix, typo within edit distance.
+EXACT, PREFIX, FUZZY = 3, 2, 1
+
+# Words in any script; casefolding also matches "Straße" to "STRASSE".
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text.casefold())
+
+def _trigrams(token: str) -> set:
+    padded = f"#{token}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _max_typos(term: str) -> int:
+    if len(term) >= 8:
+        return 2
+    if len(term) >= 4:
+        return 1
+    return 0
+
+def _within_distance(a: str, b: str, limit: int) -> bool:
+    """Levenshtein distance check that gives up as soon as `limit` is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index over inventory product names, with the fields the
+    search filters need kept alongside. Terms match whole tokens, token prefixes,
+    and (for longer terms) tokens within one or two typos.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self._postings = {}
+        self._vocab = []
+        self._grams = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def _add_token(self, token: str, product_id):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = set()
+            bisect.insort(self._vocab, token)
+            for gram in _trigrams(token):
+                self._grams.setdefault(gram, set()).add(token)
+        postings.add(product_id)
+
+    def _drop_token(self, token: str, product_id):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.discard(product_id)
+        if not postings:
+            del self._postings[token]
+            del self._vocab[bisect.bisect_left(self._vocab, token)]
+            for gram in _trigrams(token):
+                tokens = self._grams[gram]
+                tokens.discard(token)
+                if not tokens:
+                    del self._grams[gram]
+
+    def add(self, doc: dict):
+        """Indexes a product, replacing any previous version of it."""
+        product_id = doc["_id"]
+        previous = self.products.get(product_id)
+        self.products[product_id] = doc
+        if previous is not None and previous.get("name") == doc.get("name"):
+            return
+        if previous is not None:
+            for token in set(tokenize(previous.get("name", ""))):
+                self._drop_token(token, product_id)
+        for token in set(tokenize(doc.get("name", ""))):
+            self._add_token(token, product_id)
+
+    def remove(self, product_id):
+        doc = self.products.pop(product_id, None)
+        if doc is not None:
+            for token in set(tokenize(doc.get("name", ""))):
+                self._drop_token(token, product_id)
+
+    def _expand(self, term: str, fuzzy: bool) -> dict:
+        """Returns {token: weight} for every indexed token the term matches."""
+        matches = {}
+        i = bisect.bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            token = self._vocab[i]
+            matches[token] = EXACT if token == term else PREFIX
+            i += 1
+
+        typos = _max_typos(term) if fuzzy else 0
+        if typos:
+            grams = _trigrams(term)
+            shared = {}
+            for gram in grams:
+                for token in self._grams.get(gram, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            # Each typo can break at most three trigrams.
+            needed = max(1, len(grams) - 3 * typos)
+            for token, count in shared.items():
+                if count >= needed and token not in matches and _within_distance(term, token, typos):
+                    matches[token] = FUZZY
+        return matches
+
+    def search(self, query: str, min_price=None, max_price=None, seller_email=None,
+               in_stock_only: bool = False, sort_by: str = "relevance", limit: int = 20,
+               fuzzy: bool = True) -> list:
+        """Returns up to `limit` matching product documents; every query term must match."""
+        scores = None
+        for term in set(tokenize(query)):
+            term_scores = {}
+            for token, weight in self._expand(term, fuzzy).items():
+                for product_id in self._postings[token]:
+                    if term_scores.get(product_id, 0) < weight:
+                        term_scores[product_id] = weight
+            if scores is None:
+                scores = term_scores
+            else:
+                smaller, larger = sorted((scores, term_scores), key=len)
+                scores = {pid: score + larger[pid] for pid, score in smaller.items() if pid in larger}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+
+        if seller_email:
+            seller_email = seller_email.strip().lower()
+        hits = []
+        for product_id, score in scores.items():
+            doc = self.products[product_id]
+            if min_price is not None and doc["price"] < min_price:
+                continue
+            if max_price is not None and doc["price"] > max_price:
+                continue
+            if seller_email and doc["seller_email"] != seller_email:
+                continue
+            if in_stock_only and doc["quantity"] <= 0:
+                continue
+            hits.append((score, doc))
+
+        if sort_by == "price_asc":
+            key = lambda hit: (hit[1]["price"], hit[1]["name"])
+        elif sort_by == "price_desc":
+            key = lambda hit: (-hit[1]["price"], hit[1]["name"])
+        elif sort_by == "name":
+            key = lambda hit: hit[1]["name"].lower()
+        else:
+            key = lambda hit: (-hit[0], hit[1]["name"].lower())
+        return [doc for _, doc in heapq.nsmallest(limit, hits, key=key)]
+
+class LiveSearchIndex:
+    """
+    Keeps a ProductSearchIndex in step with inventory: built by one streaming
+    scan, then maintained from inventory change events. Events that arrive
+    during a rebuild are replayed onto the new index before it is swapped in.
+    """
+
+    def __init__(self):
+        self.index = None
+        self._pending = None
+        self._rebuild_task = None
+        self._rebuild_again = False
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    def apply_change(self, change: dict):
+        if "documentKey" not in change:
+            # drop, rename or invalidate: the collection itself changed.
+            self.reset()
+            return
+        if self._pending is not None:
+            self._pending.append(change)
+        if self.index is not None:
+            _apply(self.index, change)
+
+    def reset(self):
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            self._rebuild_again = True
+            return
+        self._rebuild_task = asyncio.get_running_loop().create_task(self._rebuild_loop())
+
+    async def _rebuild_loop(self):
+        self._rebuild_again = True
+        while self._rebuild_again:
+            self._rebuild_again = False
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.warning("Search index rebuild failed: %s", e)
+
+    async def rebuild(self):
+        self._pending = []
+        try:
+            index = ProductSearchIndex()
+            async for doc in get_async_db()[INVENTORY_COLLECTION].find({}, SEARCH_PROJECTION, batch_size=5000):
+                index.add(doc)
+            for change in self._pending:
+                _apply(index, change)
+            self.index = index
+            logger.info("Search index built over %d products", len(index))
+        finally:
+            self._pending = None
+
+def _apply(index: ProductSearchIndex, change: dict):
+    doc = change.get("fullDocument")
+    if change["operationType"] in ("insert", "update", "replace") and doc is not None:
+        index.add({field: doc.get(field) for field in ("_id", *SEARCH_PROJECTION)})
+    else:
+        index.remove(change["documentKey"]["_id"])
+
+search_index = LiveSearchIndex()
+add_listener(search_index.apply_change, search_index.reset)
+
+async def start_search_index():
+    """Builds the search index in the background; search falls back to Mongo until it is ready."""
+    if not search_index.ready:
+        search_index.reset()
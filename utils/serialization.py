@@ -0,0 +1,47 @@
+import datetime
+import json
+import os
+from bson import Decimal128, ObjectId
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Pretty-printing inflates catalog and cart payloads considerably, so responses
+# are compact unless explicitly asked for.
+RESPONSE_PRETTY_JSON = os.getenv("RESPONSE_PRETTY_JSON", "false").strip().lower() in ("1", "true", "yes")
+# Set to false to force the standard-library encoder even when orjson is installed.
+RESPONSE_USE_ORJSON = os.getenv("RESPONSE_USE_ORJSON", "true").strip().lower() in ("1", "true", "yes")
+
+def _default(value):
+    """Encodes the BSON types Mongo documents carry; called only for values json can't encode."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _orjson_default(value):
+    # orjson encodes datetimes natively, so only the BSON-specific types reach here.
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    raise TypeError
+
+def to_json(data, pretty: bool | None = None) -> str:
+    """
+    Encodes a tool response, including raw Mongo documents, in a single pass:
+    ObjectIds and datetimes are converted by the encoder as it meets them rather
+    than by walking the document beforehand.
+    """
+    pretty = RESPONSE_PRETTY_JSON if pretty is None else pretty
+    if orjson is not None and RESPONSE_USE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(data, default=_orjson_default, option=option).decode()
+    if pretty:
+        return json.dumps(data, default=_default, ensure_ascii=False, indent=2)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,90 @@
+import datetime
+import hashlib
+import os
+import secrets
+import time
+from collections import OrderedDict
+from .db_utils import get_async_db
+from .constants import SESSION_COLLECTION
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "100000"))
+# Persisting sessions lets every gateway worker, and a restarted process,
+# resolve tokens issued elsewhere, at the cost of one read on a local miss.
+SESSION_PERSIST = os.getenv("SESSION_PERSIST", "false").strip().lower() in ("1", "true", "yes")
+
+INVALID_SESSION_MESSAGE = "Invalid or expired session token, or one issued to another role. Log in again with loginUser."
+
+def _token_key(token: str) -> str:
+    # Only a digest of the token is ever stored, so a leaked session document can't be replayed.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class SessionStore:
+    """
+    Maps opaque session tokens to the email, role and name of the user who
+    logged in. Every session lives for the same TTL, so insertion order is
+    expiry order and expired entries are pruned from the front.
+    """
+
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+
+    def _prune(self, now: float):
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session["expires_at"] > now and len(self._sessions) <= self.max_size:
+                break
+            del self._sessions[key]
+
+    async def issue(self, email: str, role: str, name: str) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        session = {"email": email, "role": role, "name": name, "expires_at": now + self.ttl}
+        self._sessions[_token_key(token)] = session
+        self._prune(now)
+        if SESSION_PERSIST:
+            await get_async_db()[SESSION_COLLECTION].insert_one({
+                "_id": _token_key(token),
+                "email": email,
+                "role": role,
+                "name": name,
+                "expires_at": datetime.datetime.fromtimestamp(session["expires_at"], datetime.timezone.utc),
+            })
+        return token
+
+    async def resolve(self, token: str) -> dict | None:
+        """Returns the session for a token, or None if it is unknown or expired."""
+        key = _token_key(token)
+        now = time.time()
+        session = self._sessions.get(key)
+        if session is not None:
+            return session if session["expires_at"] > now else None
+        if not SESSION_PERSIST:
+            return None
+        doc = await get_async_db()[SESSION_COLLECTION].find_one({
+            "_id": key,
+            "expires_at": {"$gt": datetime.datetime.fromtimestamp(now, datetime.timezone.utc)},
+        })
+        if doc is None:
+            return None
+        session = {
+            "email": doc["email"],
+            "role": doc["role"],
+            "name": doc["name"],
+            "expires_at": doc["expires_at"].replace(tzinfo=datetime.timezone.utc).timestamp(),
+        }
+        # May land out of expiry order, which only delays pruning: expiry is checked on every resolve.
+        self._sessions[key] = session
+        return session
+
+    async def revoke(self, token: str) -> bool:
+        key = _token_key(token)
+        found = self._sessions.pop(key, None) is not None
+        if SESSION_PERSIST:
+            result = await get_async_db()[SESSION_COLLECTION].delete_one({"_id": key})
+            found = found or result.deleted_count > 0
+        return found
+
+session_store = SessionStore(SESSION_TTL_SECONDS, SESSION_STORE_SIZE)
@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from .inventory_events import add_listener
+from .metrics import tool_metrics
+
+# How long a completed read keeps answering identical calls. Off by default:
+# with it on, a read may be up to this stale.
+SINGLE_FLIGHT_REUSE_SECONDS = float(os.getenv("SINGLE_FLIGHT_REUSE_SECONDS", "0"))
+
+class _SyncCall:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Lets concurrent identical calls share one execution: the first caller for
+    a key runs the function and every caller that arrives while it is in flight
+    gets the same result (or exception). Optionally a completed result keeps
+    answering for `reuse_seconds`; failures are never reused.
+
+    Async calls are tracked per event loop, because a future can only be awaited
+    on its own loop; sync calls are shared across threads.
+    """
+
+    def __init__(self, reuse_seconds: float = 0):
+        self.reuse_seconds = reuse_seconds
+        self._tasks = {}
+        self._sync_calls = {}
+        self._sync_lock = threading.Lock()
+        self._results = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.reused = 0
+
+    def _reusable(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return False, None
+        if entry[1] <= time.monotonic():
+            self._results.pop(key, None)
+            return False, None
+        self.reused += 1
+        return True, entry[0]
+
+    def _keep(self, key, result):
+        if self.reuse_seconds > 0:
+            now = time.monotonic()
+            # Dropping expired entries on write keeps the map bounded by what
+            # one window of traffic can fill.
+            for stale in [k for k, (_, expires) in self._results.items() if expires <= now]:
+                del self._results[stale]
+            self._results[key] = (result, now + self.reuse_seconds)
+
+    async def run(self, key, fn):
+        """Awaits fn() once for all concurrent callers with the same key."""
+        self.calls += 1
+        found, result = self._reusable(key)
+        if found:
+            return result
+        key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(key)
+        if task is None:
+            self.executions += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish_async(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded, so one caller giving up does not cancel the read for the rest.
+        return await asyncio.shield(task)
+
+    def _finish_async(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled() and task.exception() is None:
+            self._keep(key[1], task.result())
+
+    def run_sync(self, key, fn):
+        """Calls fn() once for all concurrent callers with the same key, across threads."""
+        with self._sync_lock:
+            self.calls += 1
+            found, result = self._reusable(key)
+            if found:
+                return result
+            call = self._sync_calls.get(key)
+            leader = call is None
+            if leader:
+                self.executions += 1
+                call = self._sync_calls[key] = _SyncCall()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._sync_lock:
+                del self._sync_calls[key]
+                if call.error is None:
+                    self._keep(key, call.result)
+            call.done.set()
+
+    def forget(self, *_):
+        """Drops reusable results, e.g. after the data behind them changed."""
+        self._results.clear()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "reused": self.reused,
+            "in_flight": len(self._tasks) + len(self._sync_calls),
+            "size": len(self._results),
+            "hits": self.coalesced + self.reused,
+            "misses": self.executions,
+        }
+
+def _call_key(name: str, signature: inspect.Signature, args, kwargs) -> tuple:
+    """Tool name plus arguments bound to the signature, so positional, keyword and default spellings match."""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return name, json.dumps(bound.arguments, sort_keys=True, default=str)
+
+def coalesce(fn=None, *, flight: "SingleFlight | None" = None):
+    """
+    Decorator that routes a sync or async read tool through a SingleFlight.
+    Apply it below @mcp.tool(); the wrapper keeps the tool's name and signature.
+    """
+    if fn is None:
+        return lambda fn: coalesce(fn, flight=flight)
+    flight = flight or single_flight
+    signature = inspect.signature(fn)
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await flight.run(_call_key(name, signature, args, kwargs), lambda: fn(*args, **kwargs))
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return flight.run_sync(_call_key(name, signature, args, kwargs), lambda: fn(*args, **kwargs))
+    return wrapper
+
+# Shared by the catalog read tools; inventory changes end any reuse window early.
+single_flight = SingleFlight(SINGLE_FLIGHT_REUSE_SECONDS)
+add_listener(single_flight.forget, single_flight.forget)
+tool_metrics.add_cache("single_flight", single_flight.stats)